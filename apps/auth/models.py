@@ -37,6 +37,7 @@ from datetime import datetime, timedelta
 from django.core.cache import cache
 from django.utils.hashcompat import sha_constructor
 from utils.metrics import Meter
+from utils.redis_utils import RedisSimpleField
 from random import random
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
@@ -90,6 +91,9 @@ class CustomUser(BaseUser):
     is_partner = models.BooleanField(default=False)
     can_send_messages = models.BooleanField(default=True)
 
+    # see MessageManager.unread_count
+    unread_messages_counter = RedisSimpleField()
+
     objects = UserManager()
 
     class Meta:
@@ -145,8 +149,12 @@ class CustomUser(BaseUser):
         return qs
 
     def unread_messages_count(self, hidden_meassage_id=None):
+        from messages.models import Message
+
+        if hidden_meassage_id:
+            return self.unread_messages(hidden_meassage_id=hidden_meassage_id).count()
         if not hasattr(self, '_unread_messages_count'):
-            self._unread_messages_count = self.unread_messages(hidden_meassage_id=hidden_meassage_id).count()
+            self._unread_messages_count = Message.objects.unread_count(self)
         return self._unread_messages_count
 
     @classmethod
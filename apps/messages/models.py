@@ -23,9 +23,12 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.conf import settings
 from django.utils import simplejson as json
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.core.urlresolvers import reverse
 from django.utils.html import escape, urlize
+
+from utils.orm import bulk_insert
+from utils.redis_utils import IGNORE_REDIS, default_connection
 Q = models.Q
 
 MESSAGE_MAX_LENGTH = getattr(settings,'MESSAGE_MAX_LENGTH', 1000)
@@ -42,6 +45,69 @@ class MessageManager(models.Manager):
     def unread(self):
         return self.get_query_set().filter(read=False)
 
+    def create_many(self, messages):
+        """Save many new messages with multi-row INSERTs.
+
+        Like Message.save(), messages to users that opted out of site
+        messages are stored as read.  The messages won't have their pk set.
+        """
+        if getattr(settings, "MESSAGES_DISABLED", False) or not messages:
+            return
+        counts = {}
+        for message in messages:
+            if not message.user.notify_by_message:
+                message.read = True
+            if message.is_unread():
+                counts[message.user_id] = counts.get(message.user_id, 0) + 1
+        bulk_insert(Message, messages)
+        self._bump_unread(counts)
+
+    def mark_as_read(self, user, message_ids):
+        unread = self.for_user(user).filter(pk__in=message_ids, read=False)
+        self._bump_unread({user.pk: -unread.update(read=True)})
+
+    def unread_count(self, user):
+        """Return how many unread messages the user has.
+
+        The number is kept in a redis counter, updated as messages are
+        created, read and deleted, so it doesn't need to query the messages.
+        A missing counter is filled from the database.
+        """
+        counter = User.unread_messages_counter(user.pk, skip_mark_as_changed=True)
+        count = counter.val
+        if count is None:
+            count = user.unread_messages().count()
+            counter.setnx(count)
+        return int(count)
+
+    def _bump_unread(self, counts):
+        """Add counts ({user pk: n}) to the unread counters."""
+        counts = [(pk, n) for pk, n in counts.items() if n]
+        if IGNORE_REDIS or not counts:
+            return
+        keys = [User.unread_messages_counter(pk, skip_mark_as_changed=True).redis_key
+                for pk, n in counts]
+        pipe = default_connection.pipeline()
+        for key, (pk, n) in zip(keys, counts):
+            pipe.exists(key)
+            pipe.incr(key, n)
+        result = pipe.execute()
+        # INCR starts missing counters from 0, drop those so that they are
+        # filled from the database instead
+        missing = [key for key, existed in zip(keys, result[::2]) if not existed]
+        if missing:
+            default_connection.delete(*missing)
+
+    def on_user_created(self, sender, instance, created, raw=False, **kwargs):
+        if not created:
+            return
+        counter = User.unread_messages_counter(instance.pk, skip_mark_as_changed=True)
+        if raw:
+            # loaded from a fixture, which may have messages too
+            counter.delete()
+        else:
+            counter.val = 0
+
 class Message(models.Model):
     user = models.ForeignKey(User)
     subject = models.CharField(max_length=100, blank=True)
@@ -64,11 +130,19 @@ class Message(models.Model):
     class Meta:
         ordering = ['-created']
 
+    def __init__(self, *args, **kwargs):
+        super(Message, self).__init__(*args, **kwargs)
+        # whether the unread counter of the user includes this message
+        self._counted_unread = bool(self.pk) and self.is_unread()
+
     def __unicode__(self):
         if self.subject and not u' ' in self.subject:
             return self.subject[:40]+u'...'
         return self.subject or ugettext('[no subject]')
 
+    def is_unread(self):
+        return not self.read and not self.deleted_for_user
+
     def get_reply_url(self):
         return '%s?reply=%s' % (reverse('messages:index'), self.pk)
 
@@ -128,9 +202,23 @@ class Message(models.Model):
 
         if not getattr(settings, "MESSAGES_DISABLED", False):
             super (Message, self).save(*args, **kwargs)
+            unread = self.is_unread()
+            if unread != self._counted_unread:
+                Message.objects._bump_unread({self.user_id: unread and 1 or -1})
+                self._counted_unread = unread
         
     @classmethod
     def on_delete(cls, sender, instance, **kwargs):
         ct = ContentType.objects.get_for_model(sender)
         cls.objects.filter(content_type__pk=ct.pk, object_pk=instance.pk).delete()
 
+    @classmethod
+    def on_message_deleted(cls, sender, instance, **kwargs):
+        if instance._counted_unread:
+            cls.objects._bump_unread({instance.user_id: -1})
+
+post_delete.connect(Message.on_message_deleted, Message,
+                    dispatch_uid='messages.message.on_message_deleted')
+post_save.connect(Message.objects.on_user_created, User,
+                  dispatch_uid='messages.message.on_user_created')
+
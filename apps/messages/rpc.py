@@ -43,7 +43,7 @@ class MessagesApiClass(object):
         if not user.is_authenticated():
             return {'error': _('You should be authenticated.')}
 
-        Message.objects.filter(pk=message_id, user=user).update(read=True)
+        Message.objects.mark_as_read(user, [message_id])
 
         return {}
 
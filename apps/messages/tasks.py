@@ -44,7 +44,7 @@ from teams.moderation_const import REVIEWED_AND_PUBLISHED, \
 
 
 from messages.models import Message
-from utils import send_templated_email
+from utils import send_templated_email, send_templated_emails
 from utils.metrics import Meter
 from utils.translation import get_language_label
 
@@ -137,29 +137,32 @@ def application_sent(application_pk):
     from teams.models import Application, TeamMember
     application = Application.objects.get(pk=application_pk)
     notifiable = TeamMember.objects.filter( team=application.team,
-       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER])
+       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).select_related("user")
+    context = {
+        "applicant": application.user,
+        "url_base": get_url_base(),
+        "team":application.team,
+        "note":application.note,
+    }
+    subject  = ugettext(u'%(user)s is applying for team %(team)s') % dict(user=application.user, team=application.team.name)
+    recipients = []
+    messages = []
     for m in notifiable:
-
-        template_name = "messages/application-sent.txt"
-        context = {
-            "applicant": application.user,
-            "url_base": get_url_base(),
-            "team":application.team,
-            "note":application.note,
-            "user":m.user,
-        }
-        body = render_to_string(template_name,context)
-        subject  = ugettext(u'%(user)s is applying for team %(team)s') % dict(user=application.user, team=application.team.name)
         if m.user.notify_by_message:
+            body = render_to_string("messages/application-sent.txt",
+                                    dict(context, user=m.user))
             msg = Message()
             msg.subject = subject
             msg.content = body
             msg.user = m.user
             msg.object = application.team
             msg.author = application.user
-            msg.save()
-        Meter('templated-emails-sent-by-type.teams.application-sent').inc()
-        send_templated_email(m.user, subject, "messages/email/application-sent-email.html", context)
+            messages.append(msg)
+        recipients.append((m.user, {"user": m.user}))
+    Message.objects.create_many(messages)
+    Meter('templated-emails-sent-by-type.teams.application-sent').inc(len(recipients))
+    send_templated_emails(recipients, subject,
+                          "messages/email/application-sent-email.html", context)
     return True
 
 
@@ -204,27 +207,31 @@ def team_member_new(member_pk):
     Action.create_new_member_handler(member)
     # notify  admins and owners through messages
     notifiable = TeamMember.objects.filter( team=member.team,
-       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).exclude(pk=member.pk)
+       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).exclude(pk=member.pk).select_related("user")
+    context = {
+        "new_member": member.user,
+        "team":member.team,
+        "role":member.role,
+        "url_base":get_url_base(),
+    }
+    subject = ugettext("%s team has a new member" % (member.team))
+    recipients = []
+    messages = []
     for m in notifiable:
-        context = {
-            "new_member": member.user,
-            "team":member.team,
-            "user":m.user,
-            "role":member.role,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-new-member.txt",context)
-        subject = ugettext("%s team has a new member" % (member.team))
         if m.user.notify_by_message:
+            body = render_to_string("messages/team-new-member.txt",
+                                    dict(context, user=m.user))
             msg = Message()
             msg.subject = subject
             msg.content = body
             msg.user = m.user
-            msg.object = m.team
-            msg.save()
-        template_name = "messages/email/team-new-member.html"
-        Meter('templated-emails-sent-by-type.teams.new-member').inc()
-        send_templated_email(m.user, subject, template_name, context)
+            msg.object = member.team
+            messages.append(msg)
+        recipients.append((m.user, {"user": m.user}))
+    Message.objects.create_many(messages)
+    Meter('templated-emails-sent-by-type.teams.new-member').inc(len(recipients))
+    send_templated_emails(recipients, subject,
+                          "messages/email/team-new-member.html", context)
 
 
     # now send welcome mail to the new member
@@ -262,25 +269,30 @@ def team_member_leave(team_pk, user_pk):
     Action.create_member_left_handler(team, user)
     # notify  admins and owners through messages
     notifiable = TeamMember.objects.filter( team=team,
-       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER])
+       role__in=[TeamMember.ROLE_ADMIN, TeamMember.ROLE_OWNER]).select_related("user")
     subject = ugettext(u"%(user)s has left the %(team)s team" % dict(user=user, team=team))
+    context = {
+        "parting_member": user,
+        "team":team,
+        "url_base":get_url_base(),
+    }
+    recipients = []
+    messages = []
     for m in notifiable:
-        context = {
-            "parting_member": user,
-            "team":team,
-            "user":m.user,
-            "url_base":get_url_base(),
-        }
-        body = render_to_string("messages/team-member-left.txt",context)
         if m.user.notify_by_message:
+            body = render_to_string("messages/team-member-left.txt",
+                                    dict(context, user=m.user))
             msg = Message()
             msg.subject = subject
             msg.content = body
             msg.user = m.user
             msg.object = team
-            msg.save()
-        Meter('templated-emails-sent-by-type.teams.someone-left').inc()
-        send_templated_email(m.user, subject, "messages/email/team-member-left.html", context)
+            messages.append(msg)
+        recipients.append((m.user, {"user": m.user}))
+    Message.objects.create_many(messages)
+    Meter('templated-emails-sent-by-type.teams.someone-left').inc(len(recipients))
+    send_templated_emails(recipients, subject,
+                          "messages/email/team-member-left.html", context)
 
 
     context = {
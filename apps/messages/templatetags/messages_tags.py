@@ -27,14 +27,17 @@ def messages(context):
     user = context['user']
     if user.is_authenticated():
         hidden_message_id = context['request'].COOKIES.get(Message.hide_cookie_name)
-        qs = user.unread_messages(hidden_message_id)
-        try:
-            last_unread = qs[:1].get().pk
-        except Message.DoesNotExist:
-            last_unread = ''
-        count = user.unread_messages_count(hidden_message_id)
+        # the counter is free, only query when there's something unread
+        count = user.unread_messages_count()
+        if count and hidden_message_id:
+            count = user.unread_messages_count(hidden_message_id)
+        last_unread = ''
+        if count:
+            try:
+                last_unread = user.unread_messages(hidden_message_id)[:1].get().pk
+            except Message.DoesNotExist:
+                pass
     else:
-        qs = Message.objects.none()
         last_unread = ''
         count = 0
 
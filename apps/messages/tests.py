@@ -80,6 +80,36 @@ class MessageTest(TestCase):
         self.assertEquals(Message.objects.unread().filter(user=self.user).count(), 0)
         self.assertEquals(Message.objects.filter(user=self.user).count(), 1)
         
+    def test_unread_counter(self):
+        def unread_count():
+            # unread_messages_count is cached on the instance
+            return User.objects.get(pk=self.user.pk).unread_messages_count()
+
+        def db_count():
+            return self.user.unread_messages().count()
+
+        start = unread_count()
+        self.assertEqual(start, db_count())
+
+        self._create_message(self.user)
+        self.assertEqual(unread_count(), start + 1)
+
+        Message.objects.create_many([
+            Message(user=self.user, author=self.author, subject=self.subject)
+            for i in xrange(3)])
+        self.assertEqual(unread_count(), start + 4)
+
+        Message.objects.mark_as_read(self.user, [self.message.pk])
+        Message.objects.mark_as_read(self.user, [self.message.pk])
+        self.assertEqual(unread_count(), start + 3)
+
+        self.user.unread_messages()[:1].get().delete_for_user(self.user)
+        self.assertEqual(unread_count(), start + 2)
+
+        self.user.unread_messages()[:1].get().delete()
+        self.assertEqual(unread_count(), start + 1)
+        self.assertEqual(unread_count(), db_count())
+
     def test_member_join(self):
         def _get_counts(member):
             email_to = "%s" %( member.user.email) 
@@ -146,6 +176,52 @@ class MessageTest(TestCase):
         self.assertTrue(Action.objects.for_user(contributor.user).filter(pk=action.pk).exists())
         self.assertTrue(Action.objects.for_user(admin.user).filter(pk=action.pk).exists())
         
+    def test_member_join_without_admins(self):
+        team = Team.objects.create(name='no admins', slug='no-admins',
+                                   membership_policy=Team.OPEN)
+        user = User.objects.create(username='joiner',
+                                   email='joiner@example.com',
+                                   notify_by_email=True,
+                                   notify_by_message=True)
+        tm = TeamMember.objects.create(team=team, user=user,
+                                       role=TeamMember.ROLE_CONTRIBUTOR)
+        messages_before = Message.objects.filter(user=user).count()
+        mail.outbox = []
+
+        notifier.team_member_new(tm.pk)
+
+        # only the welcome message, as there's nobody to notify
+        self.assertEqual(Message.objects.filter(user=user).count(),
+                         messages_before + 1)
+        self.assertEqual([m.to for m in mail.outbox], [[user.email]])
+
+    def test_notifications_without_admins(self):
+        team = Team.objects.create(name='ownerless', slug='ownerless',
+                                   membership_policy=Team.APPLICATION)
+        user = User.objects.create(username='member',
+                                   email='member@example.com',
+                                   notify_by_email=True,
+                                   notify_by_message=True)
+        applicant = User.objects.create(username='applicant',
+                                        email='applicant@example.com')
+        TeamMember.objects.create(team=team, user=user,
+                                  role=TeamMember.ROLE_CONTRIBUTOR)
+        messages_before = Message.objects.filter(user=user).count()
+        mail.outbox = []
+
+        app = Application.objects.create(team=team, user=applicant)
+        self.assertTrue(notifier.application_sent.run(app.pk))
+        self.assertEqual(Message.objects.filter(user=user).count(),
+                         messages_before)
+        self.assertEqual(len(mail.outbox), 0)
+
+        # the last member leaving still gets the parting message
+        TeamMember.objects.filter(team=team, user=user).delete()
+        notifier.team_member_leave(team.pk, user.pk)
+        self.assertEqual(Message.objects.filter(user=user).count(),
+                         messages_before + 1)
+        self.assertEqual([m.to for m in mail.outbox], [[user.email]])
+
     def test_member_leave(self):
         return # fix me now
         def _get_counts(member):
@@ -33,7 +33,7 @@ from profiles.rpc import ProfileApiClass
 from utils.amazon import S3StorageError
 from utils.orm import LoadRelatedQuerySet
 from utils.rpc import RpcRouter
-from videos.models import Action, SubtitleLanguage, VideoUrl
+from videos.models import ActionTimeline, SubtitleLanguage, VideoUrl
 
 
 rpc_router = RpcRouter('profiles:rpc_router', {
@@ -98,7 +98,7 @@ def dashboard(request):
 
     context = {
         'user_info': user,
-        'action_list': Action.objects.for_user(user)[:5],
+        'action_list': ActionTimeline.objects.for_user(user, limit=5)[0],
         'tasks': tasks,
         'widget_settings': widget_settings,
     }
@@ -189,16 +189,17 @@ def send_message(request):
 
 @login_required
 def actions_list(request):
-    qs = Action.objects.for_user(request.user)
-    extra_context = {
-        'user_info': request.user
+    before = request.GET.get('before')
+    action_list, next_cursor = ActionTimeline.objects.for_user(
+        request.user, before=before)
+    context = {
+        'user_info': request.user,
+        'action_list': action_list,
+        'before': before,
+        'next_cursor': next_cursor,
     }
 
-    return object_list(request, queryset=qs, allow_empty=True,
-                       paginate_by=settings.ACTIVITIES_ONPAGE,
-                       template_name='profiles/actions_list.html',
-                       template_object_name='action',
-                       extra_context=extra_context)
+    return direct_to_template(request, 'profiles/actions_list.html', context)
 
 @login_required
 def generate_api_key(request):
@@ -88,6 +88,24 @@ class TestSearch(TestCase):
             result = rpc.search(rdata, self.user, testing=True)['sqs']
             self.assertTrue(video in [item.object for item in result], title)
 
+    def test_batched_prepare(self):
+        index = VideoIndex(Video)
+
+        for video in index.index_queryset():
+            batched = index.prepare(video).copy()
+            single = index.prepare(Video.objects.get(pk=video.pk))
+            self.assertEqual(batched, single)
+
+            self.assertEqual(batched['languages_count'],
+                             video.subtitlelanguage_set.filter(
+                                 subtitle_count__gt=0, has_version=True).count())
+            self.assertEqual(batched['contributors_count'],
+                             User.objects.filter(subtitleversion__language__video=video)
+                             .distinct().count())
+            self.assertEqual(batched['activity_count'], video.action_set.count())
+            self.assertEqual(batched['title'],
+                             Video.objects.get(pk=video.pk).title_display(truncate=False).strip())
+
     def test_empty_query(self):
         rpc = SearchApiClass()
 
@@ -19,10 +19,24 @@ from django.db import IntegrityError
 from django.db.models import F
 
 from statistic.models import SubtitleFetchCounters, VideoViewCounter, WidgetViewCounter
-from statistic.pre_day_statistic import BasePerDayStatistic, UpdatingLogger
+from statistic.pre_day_statistic import (
+    BasePerDayStatistic, PerDayStatisticRecorder, UpdatingLogger
+)
 from utils.redis_utils import default_connection
 
 
+def _video_pks(video_ids):
+    from videos.models import Video
+    return dict(Video.objects.filter(video_id__in=set(video_ids))
+                .values_list('video_id', 'pk'))
+
+def _video_counts(values):
+    counts = {}
+    for fields, value in values:
+        video_pk = fields['video_id']
+        counts[video_pk] = counts.get(video_pk, 0) + value
+    return counts
+
 class VideoViewStatistic(BasePerDayStatistic):
     """
     statistic.WidgetViewStatistic is inherited from this. Pay attention changing
@@ -61,13 +75,42 @@ class VideoViewStatistic(BasePerDayStatistic):
         obj, created = self.model.objects.get_or_create(video=video, date=date)
         return obj
 
+    def get_rows(self, keys):
+        parsed = {}
+        for key in keys:
+            prefix, video_id, date_str = key.split(':')
+            parsed[key] = (video_id, self.get_date(date_str))
+
+        video_pks = _video_pks(video_id for video_id, date in parsed.values())
+        return dict((key, {'video_id': video_pks[video_id], 'date': date})
+                    for key, (video_id, date) in parsed.iteritems()
+                    if video_id in video_pks)
+
     def get_query_set(self, video):
         return self.model.objects.filter(video=video)
 
+    def get_views_for_many(self, video_ids):
+        """
+        Same as get_views for many videos with one query. video_ids are
+        primary keys, returns {video pk: views}
+        """
+        video_ids = list(video_ids)
+        if not video_ids:
+            return {}
+
+        views = self.sum_views(self.model.objects.filter(video__in=video_ids),
+                               group_by='video')
+        empty = dict(week=0, month=0, year=0, today=0)
+        return dict((pk, views.get(pk, empty).copy()) for pk in video_ids)
+
     def update_total(self, key, obj, value):
         video = obj.video
         video.__class__.objects.filter(pk=video.pk).update(view_count=F('view_count')+value)
 
+    def update_totals(self, values):
+        from videos.models import Video
+        self.increment_field(Video, 'view_count', _video_counts(values))
+
 st_video_view_handler = VideoViewStatistic()
 
 class WidgetViewStatistic(VideoViewStatistic):
@@ -100,6 +143,10 @@ class WidgetViewStatistic(VideoViewStatistic):
         Video.objects.filter(pk=obj.video_id) \
             .update(widget_views_count=F('widget_views_count')+value)
 
+    def update_totals(self, values):
+        from videos.models import Video
+        self.increment_field(Video, 'widget_views_count', _video_counts(values))
+
     def post_migrate(self, updated_objects, updated_keys):
         from utils.celery_search_index import update_search_index_for_qs
         from videos.models import Video
@@ -114,6 +161,7 @@ class WidgetViewStatistic(VideoViewStatistic):
             update_search_index_for_qs.delay(Video, [item.video_id for item in chunk])
 
 st_widget_view_statistic = WidgetViewStatistic()
+st_widget_view_recorder = PerDayStatisticRecorder(st_widget_view_statistic)
 
 class SubtitleFetchStatistic(BasePerDayStatistic):
     connection = default_connection
@@ -173,6 +221,24 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
             obj = self.model.objects.get(**fields)
         return obj
 
+    def get_rows(self, keys):
+        parsed = {}
+        for key in keys:
+            parts = key.split(':')
+
+            if len(parts) == 6:
+                lang = parts[2]
+            else:
+                lang = ''
+
+            parsed[key] = (parts[1], lang, self.get_date(parts[-1]))
+
+        video_pks = _video_pks(video_id for video_id, lang, date in parsed.values())
+        return dict((key, {'video_id': video_pks[video_id], 'language': lang,
+                           'date': date})
+                    for key, (video_id, lang, date) in parsed.iteritems()
+                    if video_id in video_pks)
+
     def get_query_set(self, date, video, sl=None):
         qs = self.model.objects.filter(video=video)
 
@@ -183,6 +249,10 @@ class SubtitleFetchStatistic(BasePerDayStatistic):
 
     def update_total(self, key, obj, value):
         video = obj.video
-        video.__class__.objects.filter(pk=video.pk).update(view_count=F('subtitles_fetched_count')+value)
+        video.__class__.objects.filter(pk=video.pk).update(subtitles_fetched_count=F('subtitles_fetched_count')+value)
+
+    def update_totals(self, values):
+        from videos.models import Video
+        self.increment_field(Video, 'subtitles_fetched_count', _video_counts(values))
 
 st_sub_fetch_handler = SubtitleFetchStatistic()
@@ -16,12 +16,15 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
-from django.db import models
-from utils.redis_utils import RedisKey
+from django.db import IntegrityError, connections, models
+from utils.orm import bulk_insert
+from utils.redis_utils import IGNORE_REDIS, RedisKey
 from django.contrib.admin import ModelAdmin
 from django.views.generic.simple import direct_to_template
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
+import atexit
 import datetime
+import threading
 import time
 from django.views.generic.list_detail import object_list
 
@@ -175,11 +178,16 @@ class BasePerDayStatistic(object):
     Really *get_query_set* and *get_key* should get same arguments, because 
     as you update statistic for some objects, for same you wish get this statistic
     in future.
+
+    For big volumes implement *get_rows* and *update_totals* too, then
+    *migrate* saves each chunk of keys with a few multi-row queries instead
+    of calling *get_object* and *update_total* for every key.
     """
     connection = None   #Redis connection
     prefix = None       #keys' prefix
     model = None        #Model to save info in DB, BasePerDayStatisticModel subclass
     log_to_redis = None
+    migrate_chunk_size = 1000   #Redis keys migrated per batch
     
     def __init__(self):
         if not self.connection:
@@ -256,27 +264,66 @@ class BasePerDayStatistic(object):
         Pas
         """
         qs = self.get_query_set(**kwargs)
-        today = datetime.datetime.today()
-        yesterday  = today - datetime.timedelta(days=1)
-        week_ago = today - datetime.timedelta(days=7)
-        month_ago = today - datetime.timedelta(days=30)
+        return self.sum_views(qs)[None]
+
+    def sum_views(self, qs, group_by=None):
+        """
+        Sum counts of *qs* for all *get_views* windows with one conditional
+        aggregation query. Return {value of group_by field: views}, or
+        {None: views} without *group_by*, in which case the views are always
+        there. Groups without views in the last year are left out.
+        """
+        now = datetime.datetime.now()
+        today = now.date()
+        yesterday = today - datetime.timedelta(days=1)
         year_ago = today - datetime.timedelta(days=365)
-        
-        #TODO: refactor this. too many queries. 
-        result = dict(week=0, month=0)
-        result['week'] = qs.filter(date__range=(week_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['month'] = qs.filter(date__range=(month_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-        result['year'] = qs.filter(date__range=(year_ago, today)) \
-            .aggregate(s=models.Sum('count'))['s'] or 0
-
-        today_views = qs.filter(date=today).aggregate(s=models.Sum('count'))['s'] or 0
-        yesterday_views = qs.filter(date=yesterday).aggregate(s=models.Sum('count'))['s'] or 0
-        result['today'] =  int(today_views + yesterday_views * (1 - today.hour / 24.))
-                    
+        windows = [
+            ('week', today - datetime.timedelta(days=7), today),
+            ('month', today - datetime.timedelta(days=30), today),
+            ('year', year_ago, today),
+            ('today', today, today),
+            ('yesterday', yesterday, yesterday),
+        ]
+
+        fields = ['date', 'count']
+        if group_by:
+            fields.append(group_by)
+        qs = qs.filter(date__range=(year_ago, today)).values(*fields)
+        db = connections[qs.db]
+        qn = db.ops.quote_name
+
+        inner_sql, inner_params = qs.query.get_compiler(qs.db).as_sql()
+
+        columns = []
+        params = []
+        if group_by:
+            group_column = qn(self.model._meta.get_field(group_by).column)
+            columns.append(group_column)
+        for name, start, end in windows:
+            columns.append('SUM(CASE WHEN %s BETWEEN %%s AND %%s THEN %s ELSE 0 END)'
+                           % (qn('date'), qn('count')))
+            params.extend([db.ops.value_to_db_date(start),
+                           db.ops.value_to_db_date(end)])
+        params.extend(inner_params)
+
+        sql = 'SELECT %s FROM (%s) %s' % (', '.join(columns), inner_sql, qn('views'))
+        if group_by:
+            sql += ' GROUP BY %s' % group_column
+
+        cursor = db.cursor()
+        cursor.execute(sql, params)
+
+        result = {}
+        for row in cursor.fetchall():
+            key = row[0] if group_by else None
+            sums = [int(value or 0) for value in row[-len(windows):]]
+            views = dict((name, value) for (name, start, end), value
+                         in zip(windows, sums))
+            yesterday_views = views.pop('yesterday')
+            views['today'] = int(views['today'] + yesterday_views * (1 - now.hour / 24.))
+            result[key] = views
         return result
-    
+
     def post_migrate(self, updated_objects, updated_keys):
         """
         This method is executed after migration to DB
@@ -289,57 +336,196 @@ class BasePerDayStatistic(object):
         """
         pass
     
+    def get_rows(self, keys):
+        """
+        Batched version of *get_object*, used by *migrate* when implemented.
+        Should return {key: {field: value}} with the fields that identify
+        the *model* row each Redis key is saved to, e.g.
+
+            {'st_video_view:abc:2012-1-1': {'video_id': 1, 'date': date}}
+
+        Resolve all objects the keys refer to with one query and leave out
+        keys you don't want to save. Return None if not implemented, then
+        *migrate* saves the keys one by one with *get_object*.
+        """
+        return None
+
+    def update_totals(self, values):
+        """
+        Batched version of *update_total*, used together with *get_rows*.
+        values is a list of (fields, value) pairs, fields as returned by
+        *get_rows*.
+        """
+        raise Exception('Not implemented')
+
+    def increment_field(self, model, field, counts):
+        """
+        Add counts ({pk: value}) to *field* of *model* rows, with one UPDATE
+        per distinct value instead of one per row
+        """
+        pks_by_value = {}
+        for pk, value in counts.iteritems():
+            pks_by_value.setdefault(value, []).append(pk)
+
+        size = self.migrate_chunk_size
+        for value, pks in pks_by_value.iteritems():
+            for i in xrange(0, len(pks), size):
+                model._default_manager.filter(pk__in=pks[i:i+size]) \
+                    .update(**{field: models.F(field)+value})
+
     def migrate(self, verbosity=1):
         """
         Migrate information from Redis to DB
+
+        Keys are drained *migrate_chunk_size* at a time with pipelined
+        commands and each chunk is saved with a few multi-row queries, see
+        *get_rows* and *update_totals*.
         """
         if verbosity >= 2:
             print '>>> Start migration...'
-            
+
         start = time.time()
-        
+
         self.pre_migrate()
-        
+
         count = self.set_key.scard()
-        
-        i = count 
-        
+
+        i = count
+
         updated_keys = []
         updated_objects = []
-        
-        while i:
-            if verbosity >= 2 and (count - i) % 100 == 0:
-                print '  >>> migrate key: %s of %s' % ((count - i), count)
-                 
-            i -= 1
-            key = self.set_key.spop()
-            if not key:
+
+        while i > 0:
+            keys = self._pop_keys(min(i, self.migrate_chunk_size))
+            if not keys:
                 break
-            
-            updated_keys.append(key)
-            
-            obj = self.get_object(key)
-            if obj:
-                try:
-                    value = int(self.connection.getset(key, 0))
-                    
-                    obj.__class__._default_manager.filter(pk=obj.pk) \
-                        .update(count=models.F('count')+value)
+            i -= len(keys)
 
-                    self.update_total(key, obj, value)
+            updated_keys.extend(keys)
+            updated_objects.extend(self._migrate_keys(keys))
 
-                    updated_objects.append(obj)
-                except (TypeError, ValueError):
-                    pass
-                self.connection.delete(key)
+            if verbosity >= 2:
+                print '  >>> migrated keys: %s of %s' % ((count - i), count)
 
         self.post_migrate(updated_objects, updated_keys)
 
+        elapsed = time.time() - start
+
+        if verbosity >= 2:
+            print '>>> Migrated %s keys into %s rows in %.2fs (%d keys/s)' % (
+                len(updated_keys), len(updated_objects), elapsed,
+                len(updated_keys) / max(elapsed, 0.001))
+
         if self.log_to_redis and count:
-            self.log_to_redis.save(datetime.datetime.now(), count, time.time()-start)
+            self.log_to_redis.save(datetime.datetime.now(), count, elapsed)
 
         return count
-        
+
+    def _pop_keys(self, count):
+        pipe = self.connection.pipeline(transaction=False)
+        for i in xrange(count):
+            pipe.spop(self.set_key.redis_key)
+        return [key for key in pipe.execute() if key]
+
+    def _pop_counts(self, keys):
+        """
+        Read and delete the counters atomically, return {key: value}
+        """
+        pipe = self.connection.pipeline()
+        for key in keys:
+            pipe.get(key)
+            pipe.delete(key)
+        result = pipe.execute()
+
+        counts = {}
+        for key, value in zip(keys, result[::2]):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+            if value:
+                counts[key] = value
+        return counts
+
+    def _migrate_keys(self, keys):
+        counts = self._pop_counts(keys)
+        if not counts:
+            return []
+
+        rows = self.get_rows(counts.keys())
+        if rows is None:
+            return self._migrate_objects(counts)
+
+        # several keys can end up in the same row
+        values = {}
+        for key, fields in rows.iteritems():
+            row = tuple(sorted(fields.items()))
+            values[row] = values.get(row, 0) + counts[key]
+
+        if not values:
+            return []
+
+        objects = self._save_counts(values)
+        self.update_totals([(dict(row), value)
+                            for row, value in values.iteritems()])
+        return objects
+
+    def _migrate_objects(self, counts):
+        objects = []
+        for key, value in counts.iteritems():
+            obj = self.get_object(key)
+            if obj:
+                obj.__class__._default_manager.filter(pk=obj.pk) \
+                    .update(count=models.F('count')+value)
+                self.update_total(key, obj, value)
+                objects.append(obj)
+        return objects
+
+    def _save_counts(self, values):
+        """
+        Add values ({row: value}) to the counts in *model*. The missing rows
+        are inserted with a zero count first, then all counts are added with
+        F() updates, so that migrations running at the same time don't lose
+        increments. Return the saved instances.
+        """
+        existing = self._get_rows(values)
+        missing = [row for row in values if row not in existing]
+        if missing:
+            try:
+                bulk_insert(self.model, [self.model(count=0, **dict(row))
+                                         for row in missing])
+            except IntegrityError:
+                # another migration inserted some of them meanwhile
+                for row in missing:
+                    try:
+                        self.model._default_manager.get_or_create(**dict(row))
+                    except IntegrityError:
+                        pass
+            existing = self._get_rows(values)
+
+        self.increment_field(self.model, 'count', dict(
+            (obj.pk, values[row]) for row, obj in existing.iteritems()))
+        return existing.values()
+
+    def _get_rows(self, values):
+        """
+        Return {row: instance} for the rows of values that are in *model*
+        """
+        names = [name for name, v in values.keys()[0]]
+        # fields can be given by attname (video_id), filter needs the name
+        field_names = dict((f.attname, f.name) for f in self.model._meta.fields)
+        lookup = dict(('%s__in' % field_names[name],
+                       set(dict(row)[name] for row in values))
+                      for name in names)
+
+        # the lookup can match more rows than needed, pick the right ones
+        rows = {}
+        for obj in self.model._default_manager.filter(**lookup):
+            row = tuple((name, getattr(obj, name)) for name in names)
+            if row in values:
+                rows[row] = obj
+        return rows
+
     def update(self, **kwargs):
         """
         Update counter for date in Redis
@@ -349,7 +535,67 @@ class BasePerDayStatistic(object):
 
         if not key:
             return
-        
-        self.connection.incr(key)
-        self.set_key.sadd(key)
-        self.total_key.incr()    
\ No newline at end of file
+
+        self.update_keys({key: 1})
+
+    def update_keys(self, counts):
+        """
+        Add counts ({redis key: increment}) to the counters in one round trip
+        """
+        if not counts or IGNORE_REDIS:
+            return
+
+        pipe = self.connection.pipeline(transaction=False)
+        for key, value in counts.iteritems():
+            pipe.incr(key, value)
+            pipe.sadd(self.set_key.redis_key, key)
+        pipe.incr(self.total_key.redis_key, sum(counts.itervalues()))
+        pipe.execute()
+
+class PerDayStatisticRecorder(object):
+    """
+    Buffers *update* calls of a BasePerDayStatistic in process and writes
+    them to Redis with *update_keys* once *max_keys* different keys were
+    recorded or *max_age* seconds passed since the last flush.
+
+    Use it from the web tier instead of queueing a task for every event:
+
+        recorder = PerDayStatisticRecorder(st_widget_view_statistic)
+        recorder.record(video_id=video_id)
+
+    Counts still in the buffer are flushed when the process exits. *max_age*
+    is only checked when something is recorded, so a process that goes
+    quiet holds its last counts until the next view or until it exits. A
+    process that is killed without running atexit handlers loses them, at
+    most *max_keys* keys' worth, which is accepted for view statistics.
+    """
+    def __init__(self, statistic, max_keys=100, max_age=10):
+        self.statistic = statistic
+        self.max_keys = max_keys
+        self.max_age = max_age
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        atexit.register(self.flush)
+
+    def record(self, **kwargs):
+        date = kwargs.get('date', datetime.date.today())
+        key = self.statistic.get_key(date=date, **kwargs)
+
+        if not key:
+            return
+
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            full = (len(self.counts) >= self.max_keys or
+                    time.time() - self.last_flush >= self.max_age)
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.last_flush = time.time()
+
+        self.statistic.update_keys(counts)    
\ No newline at end of file
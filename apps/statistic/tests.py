@@ -0,0 +1,206 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from datetime import date, datetime, timedelta
+
+from django.db.models import Sum
+from django.test import TestCase
+
+from statistic import VideoViewStatistic, WidgetViewStatistic
+from statistic.pre_day_statistic import PerDayStatisticRecorder
+from statistic.models import VideoViewCounter, WidgetViewCounter
+from videos.models import Video
+
+
+class IsolatedVideoViewStatistic(VideoViewStatistic):
+    prefix = 'test_st_video_view'
+
+class IsolatedWidgetViewStatistic(WidgetViewStatistic):
+    prefix = 'test_st_widget_view'
+    log_to_redis = None
+
+
+class PerDayStatisticTest(TestCase):
+    def setUp(self):
+        self.video, created = Video.get_or_create_for_url(
+            'http://example.com/statistic-1.mp4')
+        self.other, created = Video.get_or_create_for_url(
+            'http://example.com/statistic-2.mp4')
+        self.video_stat = IsolatedVideoViewStatistic()
+        self.widget_stat = IsolatedWidgetViewStatistic()
+        for stat in (self.video_stat, self.widget_stat):
+            self._clear(stat)
+
+    def _clear(self, stat):
+        keys = list(stat.set_key.smembers())
+        keys += [stat.set_key.redis_key, stat.total_key.redis_key]
+        stat.connection.delete(*keys)
+
+    def _check_migrate(self, stat, model, total_field):
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        model.objects.create(video=self.video, date=yesterday, count=5)
+        totals = dict(Video.objects.filter(pk__in=[self.video.pk, self.other.pk])
+                      .values_list('pk', total_field))
+
+        keys = [stat.get_key(today, video=self.video),
+                stat.get_key(yesterday, video=self.video),
+                stat.get_key(today, video=self.other),
+                stat.get_key(today, video_id='missing')]
+        for i in xrange(3):
+            stat.update(video=self.video)
+        stat.update_keys({keys[1]: 1})
+        stat.update(video=self.other)
+        stat.update(video_id='missing')
+
+        self.assertEqual(stat.migrate(verbosity=0), len(keys))
+
+        counts = dict(((video_id, d), count) for video_id, d, count in
+                      model.objects.values_list('video', 'date', 'count'))
+        self.assertEqual(counts, {
+            (self.video.pk, today): 3,
+            (self.video.pk, yesterday): 6,
+            (self.other.pk, today): 1,
+        })
+        video = Video.objects.get(pk=self.video.pk)
+        self.assertEqual(getattr(video, total_field),
+                         totals[self.video.pk] + 4)
+        other = Video.objects.get(pk=self.other.pk)
+        self.assertEqual(getattr(other, total_field),
+                         totals[self.other.pk] + 1)
+
+        for key in keys:
+            self.assertFalse(stat.connection.exists(key))
+        self.assertEqual(stat.set_key.scard(), 0)
+
+        # nothing left to migrate
+        self.assertEqual(stat.migrate(verbosity=0), 0)
+        self.assertEqual(model.objects.get(video=self.video, date=today).count, 3)
+
+    def test_migrate_video_views(self):
+        self._check_migrate(self.video_stat, VideoViewCounter, 'view_count')
+
+    def test_migrate_widget_views(self):
+        self._check_migrate(self.widget_stat, WidgetViewCounter,
+                            'widget_views_count')
+
+    def test_migrate_concurrent_insert(self):
+        stat = self.widget_stat
+        today = date.today()
+        stat.update(video=self.video)
+        stat.update(video=self.video)
+
+        # another migration inserts the row after this one looked for it
+        get_rows = stat._get_rows
+        def _get_rows(values):
+            stat._get_rows = get_rows
+            WidgetViewCounter.objects.create(video=self.video, date=today,
+                                             count=1)
+            return {}
+        stat._get_rows = _get_rows
+
+        stat.migrate(verbosity=0)
+        self.assertEqual(WidgetViewCounter.objects.get(
+            video=self.video, date=today).count, 3)
+
+    def test_update_keys(self):
+        stat = self.widget_stat
+        today = date.today()
+        key = stat.get_key(today, video=self.video)
+        other_key = stat.get_key(today, video=self.other)
+
+        stat.update_keys({key: 2, other_key: 3})
+        stat.update_keys({key: 1})
+
+        self.assertEqual(stat.connection.get(key), '3')
+        self.assertEqual(stat.connection.get(other_key), '3')
+        self.assertEqual(stat.set_key.smembers(), set([key, other_key]))
+        self.assertEqual(stat.total_key.val, '6')
+
+    def test_recorder_flushes_when_full(self):
+        stat = self.widget_stat
+        recorder = PerDayStatisticRecorder(stat, max_keys=2, max_age=3600)
+        key = stat.get_key(date.today(), video=self.video)
+        other_key = stat.get_key(date.today(), video=self.other)
+
+        recorder.record(video=self.video)
+        recorder.record(video_id=self.video.video_id)
+        self.assertEqual(stat.connection.get(key), None)
+
+        recorder.record(video=self.other)
+        self.assertEqual(stat.connection.get(key), '2')
+        self.assertEqual(stat.connection.get(other_key), '1')
+        self.assertEqual(stat.total_key.val, '3')
+        self.assertEqual(recorder.counts, {})
+
+    def test_recorder_flushes_when_old(self):
+        stat = self.widget_stat
+        recorder = PerDayStatisticRecorder(stat, max_keys=100, max_age=60)
+        key = stat.get_key(date.today(), video=self.video)
+
+        recorder.record(video=self.video)
+        self.assertEqual(stat.connection.get(key), None)
+
+        recorder.last_flush -= 61
+        recorder.record(video=self.video)
+        self.assertEqual(stat.connection.get(key), '2')
+        self.assertEqual(stat.set_key.smembers(), set([key]))
+        self.assertEqual(stat.total_key.val, '2')
+
+    def _old_views(self, qs):
+        """get_views as it was, with one SUM query per window"""
+        today = date.today()
+        def views(start, end):
+            return qs.filter(date__range=(start, end)) \
+                .aggregate(s=Sum('count'))['s'] or 0
+        yesterday = today - timedelta(days=1)
+        return {
+            'week': views(today - timedelta(days=7), today),
+            'month': views(today - timedelta(days=30), today),
+            'year': views(today - timedelta(days=365), today),
+            'today': int(views(today, today) + views(yesterday, yesterday) *
+                         (1 - datetime.now().hour / 24.)),
+        }
+
+    def test_get_views(self):
+        stat = self.widget_stat
+        today = date.today()
+        for days, count in ((0, 2), (1, 4), (5, 8), (20, 16), (200, 32),
+                            (400, 64)):
+            WidgetViewCounter.objects.create(
+                video=self.video, date=today - timedelta(days=days),
+                count=count)
+        for days, count in ((0, 3), (10, 1), (30, 5), (365, 7)):
+            WidgetViewCounter.objects.create(
+                video=self.other, date=today - timedelta(days=days),
+                count=count)
+        empty, created = Video.get_or_create_for_url(
+            'http://example.com/statistic-3.mp4')
+
+        views = stat.get_views(video=self.video)
+        self.assertEqual(views, self._old_views(stat.get_query_set(self.video)))
+        self.assertEqual((views['week'], views['month'], views['year']),
+                         (14, 30, 62))
+
+        many = stat.get_views_for_many([self.video.pk, self.other.pk,
+                                        empty.pk])
+        for video in (self.video, self.other, empty):
+            old = self._old_views(stat.get_query_set(video))
+            self.assertEqual(stat.get_views(video=video), old)
+            self.assertEqual(many[video.pk], old)
+        self.assertEqual(many[empty.pk],
+                         dict(week=0, month=0, year=0, today=0))
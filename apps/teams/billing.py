@@ -0,0 +1,176 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""
+Rows of the billing reports.
+
+The team videos are read in chunks, and each chunk takes a fixed number of
+queries: the subtitle time spans come from MIN/MAX aggregates instead of
+loading the cues of every version.
+"""
+from django.db import connection
+from django.db.models import Max, Min
+
+from teams.moderation_const import APPROVED, UNMODERATED
+from videos import UNSYNCED_MARKER
+from videos.models import Video, SubtitleLanguage, SubtitleVersion, Subtitle
+
+CHUNK_SIZE = 200
+
+HEADER = ['Video title', 'Video URL', 'Video language', 'Billable minutes']
+
+
+def _latest_public_versions(language_pks):
+    """Return {language pk: version}, see SubtitleLanguage.latest_version."""
+    if not language_pks:
+        return {}
+    versions = SubtitleVersion.objects.filter(
+        language__in=language_pks,
+        moderation_status__in=[APPROVED, UNMODERATED])
+    latest = set(versions.order_by().values_list('language')
+                         .annotate(Max('version_no')))
+    # the lookup can match older versions too, pick the right ones
+    return dict((v.language_id, v) for v in versions.filter(
+                    version_no__in=set(n for pk, n in latest))
+                if (v.language_id, v.version_no) in latest)
+
+def _spans(versions):
+    """Return {version pk: (first start, last end)} of the versions' cues."""
+    if not versions:
+        return {}
+    return dict((pk, (start, end)) for pk, start, end in
+                Subtitle.objects.filter(version__in=versions).order_by()
+                        .values_list('version')
+                        .annotate(Min('start_time'), Max('end_time')))
+
+def _translation_spans(standard_versions):
+    """Return the spans of translations, timed by their standard versions.
+
+    standard_versions is {translation version pk: standard version pk}.
+    Like EffectiveSubtitles, only the standard cues that were translated
+    count.
+
+    """
+    if not standard_versions:
+        return {}
+    table = connection.ops.quote_name(Subtitle._meta.db_table)
+    pks = standard_versions.keys()
+    sql = ('SELECT t.version_id, MIN(s.start_time), MAX(s.end_time) '
+           'FROM %(table)s t INNER JOIN %(table)s s '
+           'ON s.subtitle_id = t.subtitle_id '
+           'AND s.version_id = CASE t.version_id %(cases)s END '
+           'WHERE t.version_id IN (%(pks)s) GROUP BY t.version_id') % {
+        'table': table,
+        'cases': ' '.join(['WHEN %s THEN %s'] * len(pks)),
+        'pks': ', '.join(['%s'] * len(pks)),
+    }
+    params = []
+    for pk in pks:
+        params.extend([pk, standard_versions[pk]])
+    cursor = connection.cursor()
+    cursor.execute(sql, params + pks)
+    return dict((pk, (start, end)) for pk, start, end in cursor.fetchall())
+
+def _language_spans(billed, languages, versions):
+    """Return {language pk: (start, end)} for the billed versions."""
+    own, translations, rebuilt = {}, {}, {}
+    for language_pk, version in billed.items():
+        language = languages[language_pk]
+        standard = None
+        if language.is_original or version.is_forked:
+            own[version.pk] = language_pk
+        else:
+            standard = versions.get(language.standard_language_id)
+            if standard is None:
+                continue
+            translations[version.pk] = (language_pk, standard.pk)
+
+        if version.delta_parent_id or (standard and standard.delta_parent_id):
+            # delta versions only store their changes, rebuild them
+            own.pop(version.pk, None)
+            translations.pop(version.pk, None)
+            subs = version.ordered_subtitles()
+            if subs:
+                rebuilt[language_pk] = (subs[0].start_time, subs[-1].end_time)
+
+    spans = rebuilt
+    for version_pk, span in _spans(own.keys()).items():
+        spans[own[version_pk]] = span
+    for version_pk, span in _translation_spans(dict(
+            (pk, standard_pk) for pk, (language_pk, standard_pk)
+            in translations.items())).items():
+        spans[translations[version_pk][0]] = span
+    return spans
+
+def billing_rows(team, start_date, end_date, host):
+    """Yield the billing report rows of a team, without the header.
+
+    Languages are billed when their latest public version is approved and
+    was started between start_date and end_date.
+
+    """
+    from teams.models import TeamVideo
+
+    video_pks = list(TeamVideo.objects.filter(team=team)
+                     .order_by('video__title').values_list('video', flat=True))
+
+    for offset in xrange(0, len(video_pks), CHUNK_SIZE):
+        chunk = video_pks[offset:offset + CHUNK_SIZE]
+        videos = Video.objects.in_bulk(chunk)
+
+        languages = {}
+        video_languages = {}
+        for language in (SubtitleLanguage.objects.filter(video__in=chunk)
+                         .order_by('pk')):
+            language.video = videos[language.video_id]
+            languages[language.pk] = language
+            video_languages.setdefault(language.video_id, []).append(language)
+
+        versions = _latest_public_versions(set(languages) | set(
+            l.standard_language_id for l in languages.values()
+            if l.standard_language_id))
+
+        billed = {}
+        for language_pk, language in languages.items():
+            version = versions.get(language_pk)
+            if not version or version.moderation_status != APPROVED:
+                continue
+            if (version.datetime_started <= start_date) or (
+                    version.datetime_started >= end_date):
+                continue
+            version.language = language
+            billed[language_pk] = version
+
+        spans = _language_spans(billed, languages, versions)
+
+        for video_pk in chunk:
+            video = videos[video_pk]
+            for language in video_languages.get(video_pk, []):
+                if language.pk not in spans:
+                    continue
+                start, end = spans[language.pk]
+                # like EffectiveSubtitle, unsynced times are UNSYNCED_MARKER
+                if start is None:
+                    start = UNSYNCED_MARKER
+                if end is None:
+                    end = UNSYNCED_MARKER
+                yield [
+                    video.title.encode('utf-8'),
+                    host + video.get_absolute_url(),
+                    language.language,
+                    round((end - start) / 60, 2)
+                ]
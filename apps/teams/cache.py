@@ -30,6 +30,9 @@ def _team_writable_langs_id(team):
 def _team_preferred_langs_id(team):
     return u"%s-preferred-langs" % team.pk
 
+def _user_team_roles_id(user_pk):
+    return u"%s-team-roles" % user_pk
+
 
 def invalidate_lang_preferences(team):
     cache.delete(_team_readable_langs_id(team))
@@ -64,3 +67,21 @@ def get_preferred_langs(team):
         cache.set(cache_key, value, TIMEOUT)
     return value
 
+
+# Bumped on every membership change in this process, so that the per-request
+# permission contexts built before it get reloaded.
+roles_generation = 0
+
+def invalidate_team_roles(user_pk):
+    global roles_generation
+    roles_generation += 1
+    cache.delete(_user_team_roles_id(user_pk))
+
+def get_team_roles(user):
+    cache_key = _user_team_roles_id(user.pk)
+    value = cache.get(cache_key)
+    if value is None:
+        from teams.models import TeamMember
+        value = TeamMember.objects._generate_roles(user)
+        cache.set(cache_key, value, TIMEOUT)
+    return value
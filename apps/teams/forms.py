@@ -757,12 +757,12 @@ class UploadDraftForm(forms.Form):
         # if the language has dependents, check if the transcript is smaller so we don't lose subtitles
         if language.is_original or language.is_forked:
             if version and SubtitleLanguage.objects.filter(standard_language=language).exists():
-                if len(self._parser) < version.subtitle_set.count():
-                    raise Exception(_(u"Sorry, we couldn't upload your file because it has fewer lines ({0}) than the previous version ({1}).".format(len(self._parser), version.subtitle_set.count())))
+                if len(self._parser) < len(version.get_subtitles()):
+                    raise Exception(_(u"Sorry, we couldn't upload your file because it has fewer lines ({0}) than the previous version ({1}).".format(len(self._parser), len(version.get_subtitles()))))
         # if we are translating from another version, always check if we don't have
         # more subtitles than we need
         elif translated_from and translated_from.version():
-            original_subs_count = translated_from.version().subtitle_set.count()
+            original_subs_count = len(translated_from.version().get_subtitles())
             if len(self._parser) > original_subs_count:
                 raise Exception(_(u"Sorry, we couldn't upload your file because the number of lines in your translation ({0}) doesn't match the original ({1}).".format(len(self._parser), original_subs_count)))
 
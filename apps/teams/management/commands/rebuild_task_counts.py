@@ -0,0 +1,35 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from django.core.management.base import BaseCommand
+
+from teams.models import Team, TaskCount
+
+
+class Command(BaseCommand):
+    args = '[team_slug ...]'
+    help = u'Recounts the tasks of the given teams, or of all teams'
+
+    def handle(self, *slugs, **kwargs):
+        verbosity = int(kwargs.get('verbosity', 1))
+        teams = Team.all_objects.all()
+        if slugs:
+            teams = teams.filter(slug__in=slugs)
+        for team in teams.order_by('pk'):
+            TaskCount.objects.rebuild(team)
+            if verbosity > 0:
+                print "%s: %s tasks" % (team.slug, TaskCount.objects.total(team))
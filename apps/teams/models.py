@@ -24,7 +24,8 @@ from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.core.files import File
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Sum
 from django.db.models.signals import post_save, post_delete, pre_delete
 from django.http import Http404
 from django.template.loader import render_to_string
@@ -41,15 +42,17 @@ from messages.models import Message
 from teams.moderation_const import WAITING_MODERATION, UNMODERATED
 from teams.permissions_const import (
     TEAM_PERMISSIONS, PROJECT_PERMISSIONS, ROLE_OWNER, ROLE_ADMIN, ROLE_MANAGER,
-    ROLE_CONTRIBUTOR
+    ROLE_CONTRIBUTOR, ROLE_OUTSIDER
 )
 from videos.tasks import upload_subtitles_to_original_service
 from teams.tasks import update_one_team_video
 from utils import DEFAULT_PROTOCOL
 from utils.amazon import S3EnabledImageField, S3EnabledFileField
+from utils.metrics import Meter, Timer
+from utils.orm import bulk_insert
 from utils.panslugify import pan_slugify
 from utils.searching import get_terms
-from videos.models import Video, SubtitleLanguage, SubtitleVersion
+from videos.models import Video, SubtitleLanguage, SubtitleVersion, ActionTimeline
 
 from functools import partial
 
@@ -308,15 +311,16 @@ class Team(models.Model):
 
         If no role is given, simply return whether the user is a member of this team at all.
 
-        TODO: Change this to use the stuff in teams.permissions.
+        The roles come from the user's teams.permissions context.
 
         """
         if not user or not user.is_authenticated():
             return False
-        qs = self.members.filter(user=user)
+        from teams.permissions import get_context
+        user_role = get_context(user).role(self)
         if role:
-            qs = qs.filter(role=role)
-        return qs.exists()
+            return user_role == role
+        return user_role != ROLE_OUTSIDER
 
     def is_admin(self, user):
         """Return whether the given user is an admin of this team."""
@@ -399,7 +403,7 @@ class Team(models.Model):
 
         """
         if not hasattr(self, '_tasks_count'):
-            setattr(self, '_tasks_count', Task.objects.filter(team=self, deleted=False, completed=None).count())
+            setattr(self, '_tasks_count', TaskCount.objects.total(team=self))
         return self._tasks_count
 
 
@@ -431,8 +435,7 @@ class Team(models.Model):
                                           project=None, user=None, query=None, sort=None):
         from teams.search_indexes import TeamVideoLanguagesIndex
 
-        is_member = (user and user.is_authenticated()
-                     and self.members.filter(user=user).exists())
+        is_member = self.is_member(user)
 
         if is_member:
             qs =  TeamVideoLanguagesIndex.results_for_members(self).filter(team_id=self.id)
@@ -605,10 +608,8 @@ class Project(models.Model):
         Caches the result in-object for performance.
 
         """
-        tasks = Task.objects.filter(team=self.team, deleted=False, completed=None)
-
         if not hasattr(self, '_tasks_count'):
-            setattr(self, '_tasks_count', tasks.filter(team_video__project = self).count())
+            setattr(self, '_tasks_count', TaskCount.objects.total(project=self))
         return self._tasks_count
 
 
@@ -644,6 +645,10 @@ class TeamVideo(models.Model):
     class Meta:
         unique_together = (('team', 'video'),)
 
+    def __init__(self, *args, **kwargs):
+        super(TeamVideo, self).__init__(*args, **kwargs)
+        self._saved_project_id = self.project_id
+
     def __unicode__(self):
         return self.title or unicode(self.video)
 
@@ -683,8 +688,17 @@ class TeamVideo(models.Model):
                     "%s: Team (%s) is not equal to project's (%s) team (%s)"\
                          % (self, self.team, self.project, self.project.team)
 
+        # the task counts are kept per project
+        moved = self.pk and self.project_id != self._saved_project_id
+        if moved:
+            TaskCount.objects.add_tasks(self.task_set.all(), -1)
+
         super(TeamVideo, self).save(*args, **kwargs)
 
+        if moved:
+            TaskCount.objects.add_tasks(self.task_set.all())
+        self._saved_project_id = self.project_id
+
 
     def is_checked_out(self, ignore_user=None):
         '''Return whether this video is checked out in a task.
@@ -734,7 +748,9 @@ class TeamVideo(models.Model):
         from teams.signals import video_moved_from_team_to_team
         from videos import metadata_manager
         # For now, we'll just delete any tasks associated with the moved video.
-        self.task_set.update(deleted=True)
+        TaskCount.objects.update_tasks(self.task_set.all(), deleted=True)
+
+        ActionTimeline.objects.remove_team_video(self)
 
         # We move the video by just switching the team, instead of deleting and
         # recreating it.
@@ -747,6 +763,7 @@ class TeamVideo(models.Model):
             self.project = new_team.default_project
 
         self.save()
+        ActionTimeline.objects.add_team_video(self)
 
         # We need to make any as-yet-unmoderated versions public.
         # TODO: Dedupe this and the team video delete signal.
@@ -880,6 +897,15 @@ def team_video_add_video_moderation(sender, instance, created, raw, **kwargs):
         instance.video.moderated_by = instance.team
         instance.video.save()
 
+def team_video_add_activity(sender, instance, created, raw, **kwargs):
+    """Add the earlier actions of a newly added TeamVideo's Video to the team's activity."""
+    if created and not raw:
+        ActionTimeline.objects.add_team_video(instance)
+
+def team_video_rm_activity(sender, instance, **kwargs):
+    """Remove the actions of a deleted TeamVideo's Video from the team's activity."""
+    ActionTimeline.objects.remove_team_video(instance)
+
 def team_video_rm_video_moderation(sender, instance, **kwargs):
     """Clear the .moderated_by attribute on a newly deleted TeamVideo's Video, if necessary."""
     try:
@@ -896,6 +922,8 @@ post_save.connect(team_video_autocreate_task, TeamVideo, dispatch_uid='teams.tea
 post_save.connect(team_video_add_video_moderation, TeamVideo, dispatch_uid='teams.teamvideo.team_video_add_video_moderation')
 post_delete.connect(team_video_delete, TeamVideo, dispatch_uid="teams.teamvideo.team_video_delete")
 post_delete.connect(team_video_rm_video_moderation, TeamVideo, dispatch_uid="teams.teamvideo.team_video_rm_video_moderation")
+post_save.connect(team_video_add_activity, TeamVideo, dispatch_uid='teams.teamvideo.team_video_add_activity')
+post_delete.connect(team_video_rm_activity, TeamVideo, dispatch_uid='teams.teamvideo.team_video_rm_activity')
 
 
 # TeamMember
@@ -909,6 +937,32 @@ class TeamMemberManager(models.Manager):
         tm.save()
         return tm
 
+    def _generate_roles(self, user):
+        """Return {team pk: (role, project pks, languages)} for the given user.
+
+        The project pks and languages are the member's narrowings.  Reads
+        all of the user's teams with one query.
+
+        """
+        roles = {}
+        rows = self.filter(user=user).values_list(
+            'team', 'role', 'narrowings__project', 'narrowings__language')
+        for team_pk, role, project_pk, language in rows:
+            role, projects, languages = roles.setdefault(
+                team_pk, (role, set(), set()))
+            if project_pk:
+                projects.add(project_pk)
+            if language:
+                languages.add(language)
+        return roles
+
+    def on_changed(self, sender, instance, *args, **kwargs):
+        """Drop the cached roles of a user whose membership changed."""
+        from teams.cache import invalidate_team_roles
+        if sender is MembershipNarrowing:
+            instance = instance.member
+        invalidate_team_roles(instance.user_id)
+
 class TeamMember(models.Model):
     ROLE_OWNER = ROLE_OWNER
     ROLE_ADMIN = ROLE_ADMIN
@@ -991,7 +1045,7 @@ def clear_tasks(sender, instance, *args, **kwargs):
 
     """
     tasks = instance.team.task_set.incomplete().filter(assignee=instance.user)
-    tasks.update(assignee=None)
+    TaskCount.objects.update_tasks(tasks, assignee=None)
 
 pre_delete.connect(clear_tasks, TeamMember, dispatch_uid='teams.members.clear-tasks-on-delete')
 
@@ -1038,6 +1092,16 @@ class MembershipNarrowing(models.Model):
 
         return super(MembershipNarrowing, self).save(*args, **kwargs)
 
+post_save.connect(TeamMember.objects.on_changed, TeamMember,
+                  dispatch_uid='teams.members.roles-changed')
+post_delete.connect(TeamMember.objects.on_changed, TeamMember,
+                    dispatch_uid='teams.members.roles-deleted')
+post_save.connect(TeamMember.objects.on_changed, MembershipNarrowing,
+                  dispatch_uid='teams.narrowings.roles-changed')
+# pre_delete, the member can be deleted in the same cascade
+pre_delete.connect(TeamMember.objects.on_changed, MembershipNarrowing,
+                   dispatch_uid='teams.narrowings.roles-deleted')
+
 
 # Application
 class Application(models.Model):
@@ -1532,12 +1596,29 @@ class Task(models.Model):
 
     objects = TaskManager()
 
+    def __init__(self, *args, **kwargs):
+        super(Task, self).__init__(*args, **kwargs)
+        # the TaskCount this task was counted in when loaded
+        self._count_key = self.count_key() if self.pk else None
+
     def __unicode__(self):
         return u'Task %s (%s) for %s' % (self.id or "unsaved",
                                          self.get_type_display(),
                                          self.team_video)
 
 
+    def count_key(self):
+        """Return the TaskCount fields this task is counted under.
+
+        Deleted tasks aren't counted, so they return None.  The project is
+        left out, it comes from the team video when the count is updated.
+
+        """
+        if self.deleted:
+            return None
+        return (self.team_id, self.team_video_id, self.language, self.type,
+                self.assignee_id, self.completed is not None)
+
     @property
     def workflow(self):
         '''Return the most specific workflow for this task's TeamVideo.'''
@@ -1970,6 +2051,7 @@ class Task(models.Model):
                    "Review and Approve tasks must have a subtitle_version!"
 
         result = super(Task, self).save(*args, **kwargs)
+        TaskCount.objects.task_saved(self)
         if update_team_video_index:
             update_one_team_video.delay(self.team_video.pk)
         return result
@@ -1992,6 +2074,162 @@ post_save.connect(task_moderate_version, Task,
                   dispatch_uid="teams.task.task_moderate_version")
 
 
+# Task counts
+class TaskCountManager(models.Manager):
+    def _bump(self, key, project_id, delta):
+        team_id, team_video_id, language, type, assignee_id, completed = key
+        counts = self.filter(team=team_id, project=project_id,
+                             language=language, type=type,
+                             assignee_id=assignee_id or 0, completed=completed)
+        if counts.update(count=models.F('count') + delta):
+            return
+        sid = transaction.savepoint()
+        try:
+            self.create(team_id=team_id, project_id=project_id,
+                        language=language, type=type,
+                        assignee_id=assignee_id or 0, completed=completed,
+                        count=delta)
+        except IntegrityError:
+            # another process created the count meanwhile
+            transaction.savepoint_rollback(sid)
+            counts.update(count=models.F('count') + delta)
+        else:
+            transaction.savepoint_commit(sid)
+
+    def task_saved(self, task):
+        """Move a task to its new count after it was saved."""
+        old, new = task._count_key, task.count_key()
+        if old == new:
+            return
+        if old:
+            if old[1] == task.team_video_id:
+                project_id = task.team_video.project_id
+            else:
+                project_id = TeamVideo.objects.filter(
+                    pk=old[1]).values_list('project', flat=True)[0]
+            self._bump(old, project_id, -1)
+        if new:
+            self._bump(new, task.team_video.project_id, 1)
+        task._count_key = new
+
+    def on_task_deleted(self, sender, instance, **kwargs):
+        # pre_delete, the team video can be going away in the same cascade
+        if instance._count_key:
+            self._bump(instance._count_key,
+                       instance.team_video.project_id, -1)
+            instance._count_key = None
+
+    def _grouped(self, tasks):
+        """Return {fields: count} of the undeleted tasks, grouped as counted."""
+        counts = {}
+        tasks = tasks.filter(deleted=False)
+        for completed, qs in ((False, tasks.filter(completed=None)),
+                              (True, tasks.filter(completed__isnull=False))):
+            rows = (qs.order_by()
+                      .values_list('team', 'team_video__project', 'language',
+                                   'type', 'assignee')
+                      .annotate(Count('pk')))
+            for row in rows:
+                counts[row[:-1] + (completed,)] = row[-1]
+        return counts
+
+    def add_tasks(self, tasks, sign=1):
+        """Add (or with sign=-1, remove) the tasks of a queryset to the counts.
+
+        Use this around changes that bypass Task.save, like queryset updates
+        or moving team videos between projects.
+
+        """
+        for (team_id, project_id, language, type, assignee_id,
+             completed), n in self._grouped(tasks).items():
+            self._bump((team_id, None, language, type, assignee_id, completed),
+                       project_id, sign * n)
+
+    def update_tasks(self, tasks, **values):
+        """Run tasks.update(**values), keeping the counts in step."""
+        tasks = Task.objects.filter(pk__in=list(tasks.values_list('pk', flat=True)))
+        self.add_tasks(tasks, -1)
+        tasks.update(**values)
+        self.add_tasks(tasks)
+
+    def rebuild(self, team):
+        """Recount all the tasks of a team from scratch."""
+        self.filter(team=team).delete()
+        bulk_insert(self.model, [
+            self.model(team_id=team_id, project_id=project_id,
+                       language=language, type=type,
+                       assignee_id=assignee_id or 0, completed=completed,
+                       count=n)
+            for (team_id, project_id, language, type, assignee_id,
+                 completed), n in self._grouped(
+                     Task.objects.filter(team=team)).items()])
+
+    def _incomplete(self, team=None, project=None, assignee=None,
+                    language=None):
+        counts = self.filter(completed=False)
+        if team:
+            counts = counts.filter(team=team)
+        if project:
+            counts = counts.filter(project=project)
+        if assignee:
+            counts = counts.filter(assignee_id=getattr(assignee, 'pk', assignee))
+        if language:
+            counts = counts.filter(language=language)
+        return counts
+
+    def total(self, team=None, project=None, assignee=None):
+        """Return the number of incomplete, undeleted tasks."""
+        return self._incomplete(team, project, assignee).aggregate(
+            total=Sum('count'))['total'] or 0
+
+    def by_type(self, team, language=None, assignee=None, unassigned=False):
+        """Return {type: count} of the incomplete, undeleted tasks of a team.
+
+        With unassigned only the tasks without an assignee are counted.
+
+        """
+        counts = self._incomplete(team, language=language, assignee=assignee)
+        if unassigned:
+            counts = counts.filter(assignee_id=0)
+        return dict(counts.order_by().values_list('type')
+                          .annotate(Sum('count')))
+
+    def languages(self, team):
+        """Return the language codes of the undeleted tasks of a team."""
+        return set(self.filter(team=team, count__gt=0).order_by()
+                       .values_list('language', flat=True).distinct())
+
+class TaskCount(models.Model):
+    """Number of tasks of a team sharing these fields.
+
+    Kept up to date by Task.save and deletion, and by TaskCountManager for
+    the queryset updates.  The rebuild_task_counts command recounts them.
+
+    """
+    team = models.ForeignKey(Team)
+    project = models.ForeignKey(Project)
+    language = models.CharField(max_length=16, blank=True)
+    type = models.PositiveIntegerField(choices=Task.TYPE_CHOICES)
+    # the assignee's pk, 0 for unassigned tasks: unlike NULL, the unique
+    # index enforces 0, so there's only ever one count of unassigned tasks
+    assignee_id = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    count = models.IntegerField(default=0)
+
+    objects = TaskCountManager()
+
+    class Meta:
+        unique_together = (('team', 'project', 'language', 'type',
+                            'assignee_id', 'completed'),)
+
+    def __unicode__(self):
+        return u'%s %s tasks for %s' % (self.count, self.get_type_display(),
+                                        self.team)
+
+pre_delete.connect(TaskCount.objects.on_task_deleted, Task,
+                   dispatch_uid='teams.task.task_count_deleted')
+
+
 # Settings
 class SettingManager(models.Manager):
     use_for_related_fields = True
@@ -2272,6 +2510,9 @@ class TeamNotificationSetting(models.Model):
         return u'NotificationSettings for team %s' % (self.team)
 
 
+# Billing reports bigger than this are spooled to a temporary file
+BILLING_REPORT_SPOOL_SIZE = 10 * 1024 * 1024
+
 class BillingReport(models.Model):
     team = models.ForeignKey(Team)
     start_date = models.DateField()
@@ -2286,57 +2527,38 @@ class BillingReport(models.Model):
                 self.end_date.strftime('%Y-%m-%d'))
 
     def process(self):
-        from teams.moderation_const import APPROVED
         import csv
+        from tempfile import SpooledTemporaryFile
+        from teams.billing import HEADER, billing_rows
 
         midnight = datetime.time(0, 0, 0)
         start_date = datetime.datetime.combine(self.start_date, midnight)
         end_date = datetime.datetime.combine(self.end_date, midnight)
 
-        rows = [['Video title', 'Video URL', 'Video language',
-                    'Billable minutes']]
-
-        tvs = TeamVideo.objects.filter(team=self.team).order_by('video__title')
-
         domain = Site.objects.get_current().domain
         protocol = getattr(settings, 'DEFAULT_PROTOCOL')
         host = '%s://%s' % (protocol, domain)
 
-        for tv in tvs:
-            languages = tv.video.subtitlelanguage_set.all()
-
-            for language in languages:
-                v = language.latest_version()
-
-                if not v or v.moderation_status != APPROVED:
-                    continue
-
-                if (v.datetime_started <= start_date) or (
-                        v.datetime_started >= end_date):
-                    continue
-
-                subs = v.ordered_subtitles()
-
-                if len(subs) == 0:
-                    continue
-
-                start = subs[0].start_time
-                end = subs[-1].end_time
-
-                rows.append([
-                    tv.video.title.encode('utf-8'),
-                    host + tv.video.get_absolute_url(),
-                    language.language,
-                    round((end - start) / 60, 2)
-                ])
-
-        fn = '/tmp/bill-%s.csv' % self.pk
-
-        with open(fn, 'w') as f:
-            writer = csv.writer(f)
-            writer.writerows(rows)
+        # rows go to the file as they are computed, and small reports never
+        # touch the disk
+        f = SpooledTemporaryFile(max_size=BILLING_REPORT_SPOOL_SIZE)
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+
+        count = 0
+        with Timer('billing-report-rows-time'):
+            for row in billing_rows(self.team, start_date, end_date, host):
+                writer.writerow(row)
+                count += 1
+        Meter('billing-report-rows').inc(count)
+
+        content = File(f)
+        content.size = f.tell()
+        f.seek(0)
+        with Timer('billing-report-upload-time'):
+            self.csv_file.save('bill-%s.csv' % self.pk, content, save=False)
+        f.close()
 
-        self.csv_file = File(open(fn, 'r'))
         self.processed = datetime.datetime.utcnow()
         self.save()
 
@@ -51,11 +51,75 @@ def _perms_equal_or_greater(role, include_outsiders=False):
     return roles[:roles.index(role) + 1]
 
 
+# Permission contexts
+class PermissionContext(object):
+    """The roles and narrowings of a user in all of their teams.
+
+    They are read with one query (or from the cache, see
+    teams.cache.get_team_roles) the first time a permission of the user is
+    checked, and shared by all the checks of that request through
+    get_context.
+
+    """
+    def __init__(self, user):
+        from teams import cache
+        self.generation = cache.roles_generation
+        if user and user.is_authenticated():
+            self.roles = cache.get_team_roles(user)
+        else:
+            self.roles = {}
+
+    def role(self, team):
+        """Return the user's general role in the team, ignoring narrowings."""
+        return self.roles.get(team.pk, (ROLE_OUTSIDER,))[0]
+
+    def is_member(self, team):
+        return team.pk in self.roles
+
+    def role_for_target(self, team, project=None, lang=None):
+        """Return the role the user effectively has for the given target."""
+        if team.pk not in self.roles:
+            return ROLE_OUTSIDER
+        role, project_pks, languages = self.roles[team.pk]
+
+        # If the user has no narrowings, just return their overall role.
+        if not project_pks and not languages:
+            return role
+
+        # The default project is the same as "no project".
+        if project and project.is_default_project:
+            project = None
+
+        # Otherwise the narrowings must match the target.
+        if project_pks and (not project or project.pk not in project_pks):
+            return ROLE_CONTRIBUTOR
+
+        if languages and lang not in languages:
+            return ROLE_CONTRIBUTOR
+
+        return role
+
+def get_context(user):
+    """Return the PermissionContext of the given user.
+
+    It's kept on the user object, which lives as long as the request, and
+    reloaded after a membership changes.
+
+    """
+    from teams import cache
+    context = getattr(user, '_permission_context', None)
+    if context is None or context.generation != cache.roles_generation:
+        context = PermissionContext(user)
+        if user is not None:
+            user._permission_context = context
+    return context
+
+
 # Utility functions
 def get_member(user, team):
     """Return the TeamMember object (or None) for the given user/team."""
 
-    if not user.is_authenticated():
+    if not user.is_authenticated() or not get_context(user).is_member(team):
         return None
 
     if hasattr(user, '_cached_teammember') and user._cached_teammember.get(team.pk):
@@ -88,29 +152,7 @@ def get_role_for_target(user, team, project=None, lang=None):
     `lang` should be a string (the language code).
 
     """
-    member = get_member(user, team)
-    role = get_role(member)
-    narrowings = get_narrowings(member)
-
-    # If the user has no narrowings, just return their overall role.
-    if not narrowings:
-        return role
-
-    # Otherwise the narrowings must match the target.
-    project_narrowings = [n.project for n in narrowings if n.project]
-    lang_narrowings = [n.language for n in narrowings if n.language]
-
-    # The default project is the same as "no project".
-    if project and project.is_default_project:
-        project = None
-
-    if project_narrowings and project not in project_narrowings:
-        return ROLE_CONTRIBUTOR
-
-    if lang_narrowings and lang not in lang_narrowings:
-        return ROLE_CONTRIBUTOR
-
-    return role
+    return get_context(user).role_for_target(team, project, lang)
 
 
 def roles_user_can_assign(team, user, to_user=None):
@@ -129,7 +171,7 @@ def roles_user_can_assign(team, user, to_user=None):
         return ROLES_ORDER[1:]
     elif user_role == ROLE_ADMIN:
         if to_user:
-            if get_role(get_member(to_user, team)) == ROLE_OWNER or get_role(get_member(to_user, team)) == ROLE_ADMIN:
+            if get_context(to_user).role(team) in (ROLE_OWNER, ROLE_ADMIN):
                 return []
         return ROLES_ORDER[2:]
     else:
@@ -421,7 +463,7 @@ def can_view_tasks_tab(team, user):
     if not user or not user.is_authenticated():
         return False
 
-    return team.members.filter(user=user).exists()
+    return get_context(user).is_member(team)
 
 def can_invite(team, user):
     """Return whether the given user can send an invite for the given team."""
@@ -26,6 +26,8 @@ from haystack.indexes import (
 )
 from haystack.query import SearchQuerySet
 from teams import models
+from utils.orm import LoadRelatedQuerySet
+from videos.models import SubtitleLanguage, VideoUrl
 
 from haystack.exceptions import AlreadyRegistered
 
@@ -33,6 +35,41 @@ from haystack.exceptions import AlreadyRegistered
 LANGUAGES_DICT = dict(settings.ALL_LANGUAGES)
 
 
+class TeamVideoIndexQuerySet(LoadRelatedQuerySet):
+    """
+    Loads the per team video counts and lookups TeamVideoLanguagesIndex
+    needs for each chunk of team videos fetched with grouped queries.
+    """
+
+    def update_result_cache(self):
+        team_videos = [tv for tv in self._result_cache
+                       if not hasattr(tv, '_index_data')]
+        if not team_videos:
+            return
+
+        video_pks = [tv.video_id for tv in team_videos]
+
+        task_counts = dict(models.Task.objects.incomplete()
+                           .filter(team_video__in=team_videos)
+                           .values_list('team_video').annotate(Count('pk')))
+
+        video_urls = {}
+        for vurl in VideoUrl.objects.filter(video__in=video_pks, primary=True):
+            video_urls.setdefault(vurl.video_id, vurl.effective_url)
+
+        originals = {}
+        for sl in SubtitleLanguage.objects.filter(
+                video__in=video_pks, is_original=True).order_by('pk'):
+            originals.setdefault(sl.video_id, sl)
+
+        for tv in team_videos:
+            # see Video._original_subtitle_language
+            tv.video._original_subtitle = originals.get(tv.video_id)
+            tv._index_data = {
+                'task_count': task_counts.get(tv.pk, 0),
+                'video_url': video_urls.get(tv.video_id),
+            }
+
 class TeamVideoLanguagesIndex(SearchIndex):
     text = CharField(
         document=True, use_template=True,
@@ -92,7 +129,13 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['video_pk'] = obj.video.id
         self.prepared_data['video_id'] = obj.video.video_id
         self.prepared_data['video_title'] = obj.video.title.strip()
-        self.prepared_data['video_url'] = obj.video.get_video_url()
+        data = getattr(obj, '_index_data', None)
+        if data is None:
+            data = {
+                'task_count': models.Task.objects.incomplete().filter(team_video=obj).count(),
+                'video_url': obj.video.get_video_url(),
+            }
+        self.prepared_data['video_url'] = data['video_url']
         original_sl = obj.video.subtitle_language()
         if original_sl:
             self.prepared_data['original_language_display'] = \
@@ -127,15 +170,17 @@ class TeamVideoLanguagesIndex(SearchIndex):
         self.prepared_data['video_completed_lang_urls'] = \
             [sl.get_absolute_url() for sl in completed_sls]
 
-        self.prepared_data['task_count'] = models.Task.objects.incomplete().filter(team_video=obj).count()
+        self.prepared_data['task_count'] = data['task_count']
 
-        team_video = obj.video.get_team_video()
-
-        self.prepared_data['is_public'] =  team_video.team.is_visible 
-        self.prepared_data["owned_by_team_id"] = team_video.team.id if team_video else None
+        self.prepared_data['is_public'] = obj.team.is_visible
+        self.prepared_data["owned_by_team_id"] = obj.team.id
 
         return self.prepared_data
 
+    def index_queryset(self):
+        return TeamVideoIndexQuerySet(models.TeamVideo).select_related(
+            'team', 'project', 'video')
+
     @classmethod
     def results_for_members(self, team):
         base_qs = SearchQuerySet().models(models.TeamVideo)
@@ -9,16 +9,16 @@ from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
 from haystack import site
 
-from utils import send_templated_email
+from utils import send_templated_emails
 from utils.metrics import Gauge, Meter
 from widget.video_cache import (
     invalidate_cache as invalidate_video_cache,
-    invalidate_video_moderation,
-    invalidate_video_visibility
+    invalidate_video_moderation_many,
+    invalidate_video_visibility_many
 )
 
+from utils.celery_search_index import update_search_index_for_qs
 from utils.metrics import Timer
-from apps.videos.tasks import video_changed_tasks
 
 @task()
 def invalidate_video_caches(team_id):
@@ -28,11 +28,19 @@ def invalidate_video_caches(team_id):
     for video_id in team.teamvideo_set.values_list('video__video_id', flat=True):
         invalidate_video_cache(video_id)
 
+# Team wide changes are propagated to this many videos at a time
+TEAM_VIDEOS_CHUNK_SIZE = 1000
+
+def _chunks(items, size=TEAM_VIDEOS_CHUNK_SIZE):
+    for start in xrange(0, len(items), size):
+        yield items[start:start + size]
+
 @task()
 def invalidate_video_moderation_caches(team):
     """Invalidate the moderation status caches for all the given team's videos."""
-    for video_id in team.teamvideo_set.values_list('video__video_id', flat=True):
-        invalidate_video_moderation(video_id)
+    video_ids = list(team.teamvideo_set.values_list('video__video_id', flat=True))
+    for chunk in _chunks(video_ids):
+        invalidate_video_moderation_many(chunk)
 
 @task()
 def update_video_moderation(team):
@@ -44,21 +52,36 @@ def update_video_moderation(team):
 
 @task()
 def invalidate_video_visibility_caches(team):
-    for video_id in team.teamvideo_set.values_list("video__video_id", flat=True):
-        invalidate_video_visibility(video_id)
+    video_ids = list(team.teamvideo_set.values_list("video__video_id", flat=True))
+    for chunk in _chunks(video_ids):
+        invalidate_video_visibility_many(chunk)
 
 @task()
 def update_video_public_field(team_id):
-    from apps.teams.models import Team
+    """Make the given team's videos public or private, like the team.
+
+    One UPDATE changes all the videos.  Their visibility caches are dropped
+    in chunks, and the search index updates are queued in chunks too.
+
+    """
+    from apps.teams.models import Team, TeamVideo
+    from apps.videos.models import Video
 
     with Timer("update-video-public-field-time"):
         team = Team.objects.get(pk=team_id)
 
-        for team_video in team.teamvideo_set.all():
-            video = team_video.video
-            video.is_public = team.is_visible
-            video.save()
-            video_changed_tasks(video.id)
+        rows = list(team.teamvideo_set.values_list(
+            'pk', 'video', 'video__video_id'))
+        Video.objects.filter(pk__in=[video_pk for pk, video_pk, video_id in rows]
+                             ).update(is_public=team.is_visible)
+
+        for chunk in _chunks(rows):
+            invalidate_video_visibility_many(
+                [video_id for pk, video_pk, video_id in chunk])
+            update_search_index_for_qs.delay(
+                Video, [video_pk for pk, video_pk, video_id in chunk])
+            update_search_index_for_qs.delay(
+                TeamVideo, [pk for pk, video_pk, video_id in chunk])
 
 @periodic_task(run_every=crontab(minute=0, hour=7))
 def expire_tasks():
@@ -95,22 +118,18 @@ def add_videos_notification(*args, **kwargs):
 
         subject = _(u'New %(team)s videos ready for subtitling!') % dict(team=team)
 
-        for user in members:
-            if not user.email:
-                continue
-
-            context = {
-                'domain': domain,
-                'user': user,
-                'team': team,
-                'team_videos': team_videos,
-                "STATIC_URL": settings.STATIC_URL,
-            }
-
-            Meter('templated-emails-sent-by-type.team.new-videos-ready').inc()
-            send_templated_email(user, subject,
-                                 'teams/email_new_videos.html',
-                                 context, fail_silently=not settings.DEBUG)
+        context = {
+            'domain': domain,
+            'team': team,
+            'team_videos': team_videos,
+            "STATIC_URL": settings.STATIC_URL,
+        }
+        recipients = [(user, {'user': user}) for user in members if user.email]
+
+        Meter('templated-emails-sent-by-type.team.new-videos-ready').inc(len(recipients))
+        send_templated_emails(recipients, subject,
+                              'teams/email_new_videos.html',
+                              context, fail_silently=not settings.DEBUG)
 
 
 @task()
@@ -17,7 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from django import template
-from teams.models import Team, TeamVideo, Project, TeamMember, Workflow, Task
+from teams.models import Team, TeamVideo, Project, TeamMember, Workflow, TaskCount
 from django.db.models import Count
 from videos.models import Video
 from apps.widget import video_cache
@@ -120,18 +120,9 @@ def is_team_manager(team, user):
 
 @register.filter
 def is_team_member(team, user):
-    if not user.is_authenticated():
-        return False
-
-    # We cache this here because we need to use it all over the place and
-    # there's no point in making 3+ queries to the DB when one will do.
-    if not hasattr(user, '_cached_teammember_status'):
-        user._cached_teammember_status = {}
-
-    if team.pk not in user._cached_teammember_status:
-        user._cached_teammember_status[team.pk] = team.is_member(user)
-
-    return user._cached_teammember_status[team.pk]
+    # the membership comes from the user's permission context, which is
+    # loaded once per request
+    return team.is_member(user)
 
 @register.filter
 def user_role(team, user):
@@ -140,14 +131,11 @@ def user_role(team, user):
 
 @register.filter
 def user_tasks_count(team, user):
-    tasks = Task.objects.filter(team=team,assignee=user,deleted=False,completed=None)
-    return tasks.count()
+    return TaskCount.objects.total(team=team, assignee=user)
 
 @register.filter
 def user_project_tasks_count(project, user):
-    team = project.team
-    tasks = Task.objects.filter(team=team,assignee=user,team_video__project=project,deleted=False,completed=None)
-    return tasks.count()
+    return TaskCount.objects.total(project=project, assignee=user)
 
 @register.inclusion_tag('teams/_team_select.html', takes_context=True)
 def team_select(context, team):
@@ -35,7 +35,7 @@ from apps.teams.permissions import (
     can_create_task_translate, can_join_team, can_edit_video, can_approve,
     roles_user_can_invite, can_add_video_somewhere, can_assign_tasks,
     can_create_and_edit_translations, save_role, can_remove_video,
-    can_delete_team, can_delete_video
+    can_delete_team, can_delete_video, get_context, get_role_for_target
 )
 
 
@@ -110,6 +110,29 @@ class TestRules(BaseTestPermission):
         self.client.login(**self.auth)
 
 
+    def test_permission_context(self):
+        user, team = self.user, self.team
+        default_project, test_project = self.default_project, self.test_project
+
+        with self.role(ROLE_MANAGER, test_project):
+            get_context(user)
+
+            def checks():
+                self.assertTrue(team.is_member(user))
+                self.assertTrue(team.is_manager(user))
+                self.assertFalse(team.is_admin(user))
+                self.assertTrue(can_view_tasks_tab(team, user))
+                self.assertEqual(get_role_for_target(user, team, test_project),
+                                 ROLE_MANAGER)
+                self.assertEqual(get_role_for_target(user, team, default_project),
+                                 ROLE_CONTRIBUTOR)
+
+            self.assertNumQueries(0, checks)
+
+        # membership changes are picked up
+        self.assertFalse(team.is_member(user))
+        self.assertEqual(get_role_for_target(user, team), ROLE_OUTSIDER)
+
     # Testing specific permissions
     def test_roles_assignable(self):
         user, team = self.user, self.team
@@ -18,11 +18,11 @@ from apps.teams.permissions import add_role
 from apps.teams.tests.teamstestsutils import refresh_obj, reset_solr
 from apps.teams.models import (
     Team, Invite, TeamVideo, Application, TeamMember,
-    TeamLanguagePreference, Project
+    TeamLanguagePreference, Project, Task, TaskCount
 )
 from apps.videos.search_indexes import VideoIndex
 from apps.videos import metadata_manager
-from apps.videos.models import Video, SubtitleLanguage
+from apps.videos.models import Video, SubtitleLanguage, SubtitleVersion
 from messages.models import Message
 from widget.tests import create_two_sub_session, RequestMockup
 
@@ -149,6 +149,103 @@ class TestTasks(TestCase):
         tv = TeamVideo(team=self.team, video=self.sl.video, added_by=self.team.users.all()[:1].get())
         tv.save()
 
+    def _assert_counts(self):
+        tasks = Task.objects.incomplete().filter(team=self.team)
+        self.assertEqual(self.team.tasks_count, tasks.count())
+        for type in Task.TYPE_IDS.values():
+            self.assertEqual(TaskCount.objects.by_type(self.team).get(type, 0),
+                             tasks.filter(type=type).count())
+        for project in self.team.project_set.all():
+            self.assertEqual(TaskCount.objects.total(project=project),
+                             tasks.filter(team_video__project=project).count())
+
+    def test_task_counts(self):
+        TaskCount.objects.rebuild(self.team)
+        user = self.team.users.all()[0]
+        tv = self.team.teamvideo_set.all()[0]
+        task = Task(team=self.team, team_video=tv, assignee=user,
+                    type=Task.TYPE_IDS['Translate'], language='fr')
+        task.save(update_team_video_index=False)
+        Task(team=self.team, team_video=tv, type=Task.TYPE_IDS['Subtitle']).save(
+            update_team_video_index=False)
+        self._assert_counts()
+        self.assertEqual(TaskCount.objects.total(team=self.team, assignee=user),
+                         1)
+        self.assertTrue('fr' in TaskCount.objects.languages(self.team))
+
+        task.completed = datetime.now()
+        task.save(update_team_video_index=False)
+        self._assert_counts()
+
+        tv.project = Project.objects.create(team=self.team, slug='counted')
+        tv.save()
+        self._assert_counts()
+
+        TaskCount.objects.update_tasks(tv.task_set.all(), deleted=True)
+        self._assert_counts()
+
+        Task.objects.get(pk=task.pk).delete()
+        self._assert_counts()
+
+    def test_task_count_races(self):
+        TaskCount.objects.rebuild(self.team)
+        tv = self.team.teamvideo_set.all()[0]
+        type = Task.TYPE_IDS['Review']
+        for i in xrange(2):
+            Task(team=self.team, team_video=tv, type=type,
+                 language='de').save(update_team_video_index=False)
+        # the unassigned tasks share one count
+        self.assertEqual(list(TaskCount.objects.filter(
+            team=self.team, type=type, language='de').values_list(
+            'assignee_id', 'count')), [(0, 2)])
+
+        # another process creates the count first
+        create = TaskCount.objects.create
+        def create_first(**fields):
+            TaskCount.objects.create = create
+            create(**dict(fields, count=1))
+            return create(**fields)
+        TaskCount.objects.create = create_first
+        try:
+            Task(team=self.team, team_video=tv, type=type,
+                 language='it').save(update_team_video_index=False)
+        finally:
+            TaskCount.objects.create = create
+        self.assertEqual(TaskCount.objects.get(
+            team=self.team, type=type, language='it').count, 2)
+
+class TestBilling(TestCase):
+
+    fixtures = ["staging_users.json", "staging_videos.json", "staging_teams.json"]
+
+    def test_billing_rows(self):
+        from apps.teams.billing import billing_rows
+
+        tv = TeamVideo.objects.all()[0]
+        language = SubtitleLanguage(video=tv.video, language='eo',
+                                    is_original=True, created=datetime.now())
+        language.save()
+        version = SubtitleVersion.objects.new_version([
+            {'subtitle_text': u'a', 'start_time': 30, 'end_time': 32},
+            {'subtitle_text': u'b', 'start_time': 120, 'end_time': 150},
+        ], language, None, moderation_status=MODERATION.APPROVED)
+
+        def rows(start, end):
+            return [row for row in billing_rows(tv.team, start, end, 'http://h')
+                    if row[2] == 'eo']
+
+        now = version.datetime_started
+        self.assertEqual(rows(now - timedelta(days=1), now + timedelta(days=1)),
+                         [[tv.video.title.encode('utf-8'),
+                           'http://h' + tv.video.get_absolute_url(), 'eo', 2.0]])
+        self.assertEqual(rows(now + timedelta(days=1), now + timedelta(days=2)),
+                         [])
+
+        version.moderation_status = MODERATION.WAITING_MODERATION
+        version.save()
+        self.assertEqual(rows(now - timedelta(days=1), now + timedelta(days=1)),
+                         [])
+
 class TeamVideoTest(TestCase):
 
     fixtures = ["staging_users.json", "staging_videos.json", "staging_teams.json"]
@@ -53,7 +53,7 @@ from teams.forms import (
 from teams.models import (
     Team, TeamMember, Invite, Application, TeamVideo, Task, Project, Workflow,
     Setting, TeamLanguagePreference, SubtitleVersion, InviteExpiredException,
-    BillingReport
+    BillingReport, TaskCount
 )
 from teams.permissions import (
     can_add_video, can_assign_role, can_assign_tasks, can_create_task_subtitle,
@@ -69,7 +69,7 @@ from teams.signals import api_teamvideo_new, api_subtitles_rejected
 from teams.tasks import (
     invalidate_video_caches, invalidate_video_moderation_caches,
     update_video_moderation, update_one_team_video, update_video_public_field,
-    invalidate_video_visibility_caches, process_billing_report
+    process_billing_report
 )
 from apps.videos.tasks import video_changed_tasks
 from utils import render_to, render_to_json, DEFAULT_PROTOCOL
@@ -83,7 +83,7 @@ from videos.tasks import (
     upload_subtitles_to_original_service, delete_captions_in_original_service,
     delete_captions_in_original_service_by_code
 )
-from videos.models import Action, VideoUrl, SubtitleLanguage, Video
+from videos.models import Action, ActionTimeline, VideoUrl, SubtitleLanguage, Video
 from widget.rpc import add_general_settings
 from widget.views import base_widget_params
 from widget.srt_subs import GenerateSubtitlesHandler
@@ -239,7 +239,6 @@ def settings_basic(request, slug):
 
             if is_visible != form.instance.is_visible:
                 update_video_public_field.delay(team.id)
-                invalidate_video_visibility_caches.delay(team)
 
             messages.success(request, _(u'Settings saved.'))
             return HttpResponseRedirect(request.path)
@@ -666,24 +665,16 @@ def activity(request, slug):
 
     public_only = False if member else True
 
-    # This section is here to work around MySQL's poor decisions.
-    #
-    # Much like the Tasks page, this query performs extremely poorly when run
-    # normally.  So we split it into two parts here so that each will run fast.
-    action_ids = Action.objects.for_team(team, public_only=public_only, ids=True)
-    action_ids, pagination_info = paginate(action_ids, ACTIONS_ON_PAGE,
-                                           request.GET.get('page'))
-    action_ids = list(action_ids)
-
-    activity_list = list(Action.objects.filter(id__in=action_ids).select_related(
-            'video', 'user', 'language', 'language__video'
-    ).order_by())
-    activity_list.sort(key=lambda a: action_ids.index(a.pk))
-
-    context = { 'activity_list': activity_list, 'team': team }
-    context.update(pagination_info)
+    before = request.GET.get('before')
+    activity_list, next_cursor = ActionTimeline.objects.for_team(
+        team, public_only=public_only, before=before, limit=ACTIONS_ON_PAGE)
 
-    return context
+    return {
+        'activity_list': activity_list,
+        'team': team,
+        'before': before,
+        'next_cursor': next_cursor,
+    }
 
 # Members
 @timefn
@@ -1005,9 +996,7 @@ def _get_or_create_workflow(team_slug, project_id, team_video_id):
     return workflow
 
 def _task_languages(team, user):
-    languages = filter(None, Task.objects.filter(team=team, deleted=False)
-                                         .values_list('language', flat=True)
-                                         .distinct())
+    languages = filter(None, TaskCount.objects.languages(team))
 
     language_labels = dict(get_language_choices(with_empty=True))
 
@@ -1028,24 +1017,30 @@ def _task_languages(team, user):
     return lang_data
 
 def _task_category_counts(team, filters, user):
-    tasks = team.task_set.incomplete()
-
-    if filters['language']:
-        tasks = tasks.filter(language=filters['language'])
+    unassigned = filters['assignee'] == 'none'
+    assignee = user if filters['assignee'] and not unassigned else None
 
     if filters['team_video']:
-        tasks = tasks.filter(team_video=int(filters['team_video']))
-
-    if filters['assignee']:
-        if filters['assignee'] == 'none':
+        # counts aren't kept per video, but a video only has a few tasks
+        tasks = team.task_set.incomplete().filter(
+            team_video=int(filters['team_video']))
+        if filters['language']:
+            tasks = tasks.filter(language=filters['language'])
+        if unassigned:
             tasks = tasks.filter(assignee=None)
-        else:
-            tasks = tasks.filter(assignee=user)
+        elif assignee:
+            tasks = tasks.filter(assignee=assignee)
+        type_counts = dict(tasks.order_by().values_list('type')
+                                .annotate(Count('pk')))
+    else:
+        type_counts = TaskCount.objects.by_type(
+            team, language=filters['language'], assignee=assignee,
+            unassigned=unassigned)
 
-    counts = { 'all': tasks.count() }
+    counts = { 'all': sum(type_counts.values()) }
 
     for type in ['Subtitle', 'Translate', 'Review', 'Approve']:
-        counts[type.lower()] = tasks.filter(type=Task.TYPE_IDS[type]).count()
+        counts[type.lower()] = type_counts.get(Task.TYPE_IDS[type], 0)
 
     return counts
 
@@ -1447,7 +1442,7 @@ def download_draft(request, slug, task_pk, type="srt"):
     subtitle_version = task.get_subtitle_version()
 
     subtitle = GenerateSubtitlesHandler[type].create(subtitle_version)
-    response = HttpResponse(unicode(subtitle), mimetype="text/plain")
+    response = HttpResponse(subtitle.stream(), mimetype="text/plain")
     original_filename = '%s.%s' % (subtitle_version.video.lang_filename(task.language), subtitle.file_type)
 
     if not 'HTTP_USER_AGENT' in request.META or u'WebKit' in request.META['HTTP_USER_AGENT']:
@@ -1666,7 +1661,7 @@ def _propagate_unpublish_to_tasks(team_video, language_pk, language_code):
     if team_video.video.subtitle_language():
         tasks_to_delete = tasks_to_delete.filter(language=language_code)
 
-    tasks_to_delete.update(deleted=True)
+    TaskCount.objects.update_tasks(tasks_to_delete, deleted=True)
 
 def unpublish(request, slug):
     team = get_object_or_404(Team, slug=slug)
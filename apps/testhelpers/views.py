@@ -75,7 +75,7 @@ def _copy_subtitles(fromlang, tolang, maxout=None):
     version.datetime_started = datetime.datetime.now()
     version.save()
     i = 0
-    for x in fromlang.version().subtitle_set.all():
+    for x in fromlang.version().get_subtitles():
         s = x.duplicate_for(version=version)
         s.subtitle_text = "Sub %s for lang (%s)" % (i, tolang.language)
         s.save()
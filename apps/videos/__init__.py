@@ -17,6 +17,10 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import re
+import zlib
+from array import array
+
+from django.utils import simplejson as json
 
 from utils.subtitles import MAX_SUB_TIME, strip_tags, DEFAULT_ALLOWED_TAGS
 from utils.unisubsmarkup import markup_to_html
@@ -40,7 +44,10 @@ def format_time(time):
     return '%s:%s' % (t / 60, s)
 
 
-class EffectiveSubtitle:
+class EffectiveSubtitle(object):
+    __slots__ = ('subtitle_id', 'text', 'start_time', 'end_time', 'sub_order',
+                 'pk', 'start_of_paragraph')
+
     def __init__(self, subtitle_id, text, start_time, end_time, sub_order, pk, start_of_paragraph=False):
         self.subtitle_id = subtitle_id
         self.text = text
@@ -55,6 +62,13 @@ class EffectiveSubtitle:
         self.pk = pk
         self.start_of_paragraph = start_of_paragraph
 
+    def __getstate__(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
     def as_dict(self):
         return {
             'subtitle_id': self.subtitle_id,
@@ -130,3 +144,162 @@ class EffectiveSubtitle:
     @property
     def has_end_time(self):
         return self.end_time != UNSYNCED_MARKER
+
+
+class EffectiveSubtitles(object):
+    """
+    List-like column store of the EffectiveSubtitles of a version.
+
+    Times, orders, pks and paragraph flags are kept in arrays, ids and texts
+    in lists, and EffectiveSubtitle rows are only built for the items that
+    are accessed. *as_dicts* and *for_generator* read the columns directly.
+    Pickles as one compressed string.
+    """
+    __slots__ = ('subtitle_ids', 'texts', 'start_times', 'end_times',
+                 'sub_orders', 'pks', 'paragraphs')
+
+    # arrays can't hold None
+    _NO_ORDER = float('nan')
+    _NO_PK = 0
+
+    def __init__(self, subtitles=()):
+        self._set_columns([], [], array('d'), array('d'), array('d'),
+                          array('l'), array('B'))
+        for s in subtitles:
+            self.append(s.subtitle_id, s.text, s.start_time, s.end_time,
+                        s.sub_order, s.pk, s.start_of_paragraph)
+
+    def _set_columns(self, subtitle_ids, texts, start_times, end_times,
+                     sub_orders, pks, paragraphs):
+        self.subtitle_ids = subtitle_ids
+        self.texts = texts
+        self.start_times = start_times
+        self.end_times = end_times
+        self.sub_orders = sub_orders
+        self.pks = pks
+        self.paragraphs = paragraphs
+
+    def _columns(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def append(self, subtitle_id, text, start_time, end_time, sub_order, pk,
+               start_of_paragraph=False):
+        if start_time is None:
+            start_time = UNSYNCED_MARKER
+        if end_time is None:
+            end_time = UNSYNCED_MARKER
+        self.subtitle_ids.append(subtitle_id)
+        self.texts.append(text)
+        self.start_times.append(start_time)
+        self.end_times.append(end_time)
+        self.sub_orders.append(self._NO_ORDER if sub_order is None else sub_order)
+        self.pks.append(pk or self._NO_PK)
+        self.paragraphs.append(bool(start_of_paragraph))
+
+    def append_subtitle(self, subtitle):
+        """Add a videos.Subtitle, see EffectiveSubtitle.for_subtitle"""
+        self.append(subtitle.subtitle_id, subtitle.subtitle_text,
+                    subtitle.start_time, subtitle.end_time,
+                    subtitle.subtitle_order, subtitle.pk,
+                    subtitle.start_of_paragraph)
+
+    def append_translation(self, original, translation):
+        """See EffectiveSubtitle.for_dependent_translation"""
+        self.append(original.subtitle_id, translation.subtitle_text,
+                    original.start_time, original.end_time,
+                    original.subtitle_order, original.pk,
+                    original.start_of_paragraph)
+
+    def _sub_order(self, i):
+        order = self.sub_orders[i]
+        return None if order != order else order
+
+    def _pk(self, i):
+        return self.pks[i] or None
+
+    def _row(self, i):
+        return EffectiveSubtitle(
+            self.subtitle_ids[i], self.texts[i], self.start_times[i],
+            self.end_times[i], self._sub_order(i), self._pk(i),
+            bool(self.paragraphs[i]))
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._row(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = EffectiveSubtitles()
+            result._set_columns(*[column[index] for column in self._columns()])
+            return result
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('subtitle index out of range')
+        return self._row(index)
+
+    def sort(self, key=None, reverse=False):
+        rows = list(self)
+        if key is None:
+            order = sorted(xrange(len(rows)), key=lambda i: rows[i].sub_order,
+                           reverse=reverse)
+        else:
+            order = sorted(xrange(len(rows)), key=lambda i: key(rows[i]),
+                           reverse=reverse)
+        columns = []
+        for column in self._columns():
+            sorted_column = [column[i] for i in order]
+            if isinstance(column, array):
+                sorted_column = array(column.typecode, sorted_column)
+            columns.append(sorted_column)
+        self._set_columns(*columns)
+
+    def as_dicts(self):
+        """The subtitles as dicts, with the same keys as EffectiveSubtitle."""
+        return [{
+            'subtitle_id': self.subtitle_ids[i],
+            'text': self.texts[i],
+            'start_time': self.start_times[i],
+            'end_time': self.end_times[i],
+            'sub_order': self._sub_order(i),
+            'pk': self._pk(i),
+            'start_of_paragraph': bool(self.paragraphs[i]),
+        } for i in xrange(len(self))]
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        result = cls()
+        for d in dicts:
+            result.append(d['subtitle_id'], d['text'], d['start_time'],
+                          d['end_time'], d['sub_order'], d['pk'],
+                          d['start_of_paragraph'])
+        return result
+
+    def for_generator(self):
+        """Same as EffectiveSubtitle.for_generator for all subtitles."""
+        return [{
+            'text': markup_to_html(self.texts[i]),
+            'start': self.start_times[i],
+            'end': self.end_times[i],
+            'id': self._pk(i),
+            'start_of_paragraph': bool(self.paragraphs[i]),
+        } for i in xrange(len(self))]
+
+    def __getstate__(self):
+        columns = [list(self.subtitle_ids), list(self.texts)]
+        columns.extend(column.tostring().encode('base64')
+                       for column in self._columns()[2:])
+        # base64, memcached pickles with protocol 0
+        return zlib.compress(json.dumps(columns)).encode('base64')
+
+    def __setstate__(self, state):
+        columns = json.loads(zlib.decompress(state.decode('base64')))
+        arrays = []
+        for typecode, data in zip('dddlB', columns[2:]):
+            column = array(typecode)
+            column.fromstring(data.decode('base64'))
+            arrays.append(column)
+        self._set_columns(columns[0], columns[1], *arrays)
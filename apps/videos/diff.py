@@ -0,0 +1,101 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""
+Differences between the subtitles of two versions, shared by the diffing
+view and the version change ratios computed in metadata_manager.
+"""
+
+from django.core.cache import cache
+
+DIFF_CACHE_TIMEOUT = 60 * 60 * 24
+
+class SubtitleDiff(object):
+    """
+    Changes from old to new, two sequences of EffectiveSubtitles matched by
+    subtitle_id.
+
+    rows is a list of (old, new, changed) for every cue of either version,
+    ordered by start time, where old or new is None for inserted and
+    deleted cues.  changed has the same keys as in the diffing template.
+    text_changed and time_changed count the cues whose text or timing
+    changed, counting inserted and deleted ones as both.
+    """
+
+    def __init__(self, old, new):
+        old_by_id = dict((s.subtitle_id, s) for s in old)
+        self.rows = []
+        self.text_changed = self.time_changed = 0
+        self.length = len(new)
+
+        for subtitle in new:
+            previous = old_by_id.pop(subtitle.subtitle_id, None)
+            if previous is None:
+                changed = {'text': True, 'time': True}
+                self.text_changed += 1
+                self.time_changed += 1
+            else:
+                changed = {
+                    'text': previous.text != subtitle.text,
+                    'time': previous.start_time != subtitle.start_time,
+                    'end_time': previous.end_time != subtitle.end_time,
+                }
+                self.text_changed += changed['text']
+                self.time_changed += changed['time'] or changed['end_time']
+            self.rows.append((previous, subtitle, changed))
+
+        for subtitle in old:
+            if subtitle.subtitle_id in old_by_id:
+                self.rows.append((subtitle, None, {'text': True, 'time': True}))
+                self.text_changed += 1
+                self.time_changed += 1
+
+        self.rows.sort(key=lambda row: (row[1] or row[0]).start_time)
+
+    def _ratio(self, count):
+        if not self.length:
+            return 1 if count else 0
+        return min(count / 1. / self.length, 1)
+
+    @property
+    def text_change(self):
+        return self._ratio(self.text_changed)
+
+    @property
+    def time_change(self):
+        return self._ratio(self.time_changed)
+
+def _collection_key(version):
+    # a dependent version's subtitles also depend on its standard version
+    key = str(version.pk)
+    if version.is_dependent():
+        standard = version._get_standard_collection()
+        if standard:
+            key += '.%s' % standard.pk
+    return key
+
+def diff_versions(old_version, new_version):
+    """Return the cached SubtitleDiff of two versions' ordered_subtitles."""
+    key = 'subtitle-diff-%s-%s' % (_collection_key(old_version),
+                                   _collection_key(new_version))
+    diff = cache.get(key)
+    if diff is None:
+        diff = SubtitleDiff(old_version.ordered_subtitles(),
+                            new_version.ordered_subtitles())
+        cache.set(key, diff, DIFF_CACHE_TIMEOUT)
+    return diff
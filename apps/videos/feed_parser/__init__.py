@@ -40,10 +40,28 @@ class FeedParser(object):
     See videos.tests.TestFeedParser for details.
     """
     
-    def __init__(self, feed_url):
+    def __init__(self, feed_url, etag=None, modified=None):
+        """
+        etag and modified are the validators of a previous fetch, the
+        feed is only downloaded again if it has changed since then.
+        """
         self.feed_url = feed_url
-        self.feed = feedparser.parse(feed_url)
+        self.feed = feedparser.parse(feed_url, etag=etag, modified=modified)
         self.parser = None
+
+    @property
+    def not_modified(self):
+        return self.feed.get('status') == 304
+
+    @property
+    def etag(self):
+        return self.feed.get('etag') or ''
+
+    @property
+    def modified(self):
+        # older feedparsers give the parsed date instead of the header
+        modified = self.feed.get('modified')
+        return isinstance(modified, basestring) and modified or ''
         
     def items(self, reverse=False, until=False, since=False, ignore_error=False):
         """
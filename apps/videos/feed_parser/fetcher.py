@@ -0,0 +1,147 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+"""
+Concurrent feed downloads.
+
+Feeds are fetched by a bounded pool of threads, with at most
+FEED_FETCH_PER_HOST requests to the same host at a time, and with
+conditional GETs so that unchanged feeds only cost a 304.  Only the
+downloading happens in the threads: the caller gets the parsed feeds back
+and does the database work itself.
+"""
+import logging
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+from utils.metrics import Histogram, Meter
+from videos.feed_parser import FeedParser
+
+logger = logging.getLogger("videos-feed-fetcher")
+
+FEED_FETCH_THREADS = getattr(settings, 'FEED_FETCH_THREADS', 8)
+FEED_FETCH_PER_HOST = getattr(settings, 'FEED_FETCH_PER_HOST', 2)
+
+
+class FeedFetch(object):
+    """The outcome of fetching one feed.
+
+    feed_parser is a FeedParser, or None if the download failed, in which
+    case error is the exception.
+    """
+    def __init__(self, key, url):
+        self.key = key
+        self.url = url
+        self.feed_parser = None
+        self.error = None
+
+    @property
+    def not_modified(self):
+        return self.feed_parser is not None and self.feed_parser.not_modified
+
+def _host(url):
+    return urlparse.urlparse(url).netloc.lower()
+
+def _interleave_by_host(jobs):
+    """Order jobs round-robin by host, so the threads don't all end up
+    waiting for the same host."""
+    by_host = {}
+    hosts = []
+    for job in jobs:
+        host = _host(job[1])
+        if host not in by_host:
+            by_host[host] = []
+            hosts.append(host)
+        by_host[host].append(job)
+
+    interleaved = []
+    for i in xrange(max(len(host_jobs) for host_jobs in by_host.values())):
+        for host in hosts:
+            if i < len(by_host[host]):
+                interleaved.append(by_host[host][i])
+    return interleaved
+
+class FeedFetcher(object):
+    def __init__(self, threads=FEED_FETCH_THREADS, per_host=FEED_FETCH_PER_HOST):
+        self.threads = threads
+        self.per_host = per_host
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = _host(url)
+        self._lock.acquire()
+        try:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+        finally:
+            self._lock.release()
+
+    def _fetch(self, job):
+        key, url, etag, modified = job
+        result = FeedFetch(key, url)
+        slot = self._host_slot(url)
+        slot.acquire()
+        try:
+            result.feed_parser = FeedParser(url, etag=etag or None,
+                                            modified=modified or None)
+        except Exception, e:
+            result.error = e
+        finally:
+            slot.release()
+        return result
+
+    def fetch(self, jobs):
+        """Download feeds, yielding a FeedFetch for each as it completes.
+
+        jobs are (key, url, etag, modified) tuples, where etag and modified
+        come from the previous fetch of the feed (or are empty) and key is
+        handed back in the FeedFetch.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return
+        jobs = _interleave_by_host(jobs)
+
+        start = time.time()
+        pool = ThreadPool(min(self.threads, len(jobs)))
+        try:
+            for result in pool.imap_unordered(self._fetch, jobs):
+                if result.error is not None:
+                    Meter('feeds-fetch-errors').inc()
+                elif result.not_modified:
+                    Meter('feeds-not-modified').inc()
+                else:
+                    Meter('feeds-fetched').inc()
+                yield result
+        finally:
+            pool.terminate()
+
+        elapsed = time.time() - start
+        rate = len(jobs) / max(elapsed, 0.001)
+        Histogram('feeds-fetched-per-second').record(rate)
+        logger.info('Fetched %s feeds in %.2fs (%.1f feeds/s)',
+                    len(jobs), elapsed, rate)
+
+def fetch_feeds(jobs, **kwargs):
+    """Shortcut for FeedFetcher(**kwargs).fetch(jobs)."""
+    return FeedFetcher(**kwargs).fetch(jobs)
@@ -28,7 +28,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from math_captcha.forms import MathCaptchaForm
 
-from teams.models import Task, Workflow
+from teams.models import Task, TaskCount, Workflow
 from teams.moderation_const import UNMODERATED, WAITING_MODERATION, APPROVED
 from teams.permissions import (
         can_create_and_edit_subtitles, can_assign_task,
@@ -305,13 +305,13 @@ class SubtitlesUploadForm(forms.Form):
         if subtitle_language and (subtitle_language.is_original or subtitle_language.is_forked):
             version = subtitle_language.version()
             if version and SubtitleLanguage.objects.filter(standard_language=subtitle_language).exists():
-                if len(self._parser) < version.subtitle_set.count():
-                    raise forms.ValidationError(_(u"Sorry, we couldn't upload your file because it has fewer lines ({0}) than the previous version ({1}).".format(len(self._parser), version.subtitle_set.count())))
+                if len(self._parser) < len(version.get_subtitles()):
+                    raise forms.ValidationError(_(u"Sorry, we couldn't upload your file because it has fewer lines ({0}) than the previous version ({1}).".format(len(self._parser), len(version.get_subtitles()))))
 
         # if we are translating from another version, always check if we don't have
         # more subtitles than we need
         elif translated_from and translated_from.version():
-            original_subs_count = translated_from.version().subtitle_set.count()
+            original_subs_count = len(translated_from.version().get_subtitles())
             if len(self._parser) > original_subs_count:
                 raise forms.ValidationError(_(u"Sorry, we couldn't upload your file because the number of lines in your translation ({0}) doesn't match the original ({1}).".format(len(self._parser), original_subs_count)))
 
@@ -329,7 +329,7 @@ class SubtitlesUploadForm(forms.Form):
         translated_from = video.subtitle_language(translated_from_language)
 
         if is_complete and translated_from and translated_from.version():
-            original_subs_count = translated_from.version().subtitle_set.count()
+            original_subs_count = len(translated_from.version().get_subtitles())
             is_complete = original_subs_count <= len(self._parser)
 
         new_version = self._save_subtitles(self._parser, is_complete=is_complete, translated_from=translated_from)
@@ -449,8 +449,9 @@ class SubtitlesUploadForm(forms.Form):
 
         if outstanding_tasks.exists():
             if new_version.moderation_status != WAITING_MODERATION:
-                outstanding_tasks.update(subtitle_version=new_version,
-                                         language=language.language)
+                TaskCount.objects.update_tasks(
+                    outstanding_tasks, subtitle_version=new_version,
+                    language=language.language)
         elif not can_bypass_moderation:
             # we just need to create review/approve/subtitle if the language
             # is a new one or, if it's a post-publish edit, if the user can't
@@ -0,0 +1,53 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from haystack import site
+
+from teams.models import TeamVideo
+from videos.models import Video
+
+
+class Command(BaseCommand):
+    help = u'Measures how many search documents per second are prepared'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', '-c', dest='count', type="int",
+                    help='Number of objects per index', default=500),
+    )
+
+    def handle(self, count, *args, **kwargs):
+        for model in (Video, TeamVideo):
+            index = site.get_index(model)
+            pks = list(model.objects.order_by('-pk')
+                       .values_list('pk', flat=True)[:count])
+
+            one_by_one = model.objects.filter(pk__in=pks)
+            batched = index.index_queryset().filter(pk__in=pks)
+
+            for name, qs in (('one by one', one_by_one), ('batched', batched)):
+                start_t = time.time()
+                for obj in qs:
+                    index.prepare(obj)
+                elapsed = time.time() - start_t
+
+                print '%-10s %-10s %8.1f docs/s  %d docs in %.2fs' % (
+                    model.__name__, name, len(pks) / max(elapsed, 1e-6),
+                    len(pks), elapsed)
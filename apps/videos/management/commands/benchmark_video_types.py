@@ -0,0 +1,81 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from videos.types import video_type_registrar
+
+# one URL for each registered type, plus some that match none.  There's no
+# dailymotion URL: matching those fetches the video metadata.
+SAMPLE_URLS = [
+    'http://www.youtube.com/watch?v=q26umaF242I',
+    'http://youtu.be/q26umaF242I',
+    'http://blip.tv/day9tv/day-9-daily-101-kill-the-zealots-part-1-3744438',
+    'http://vimeo.com/15786066',
+    'http://link.brightcove.com/services/player/bcpid955357260001',
+    'http://bcove.me/7fa5828z',
+    'http://example.com/videos/lecture.mp4',
+    'http://example.com/videos/lecture.ogv',
+    'http://example.com/videos/lecture.flv',
+    'http://example.com/audio/podcast.mp3',
+    'http://example.com/blog/2012/05/some-post.html',
+    'http://www.youtube.com/user/universalsubtitles',
+    'https://vimeo.com/channels/staffpicks',
+]
+
+def linear_lookup(url):
+    """How video_type_for_url used to look types up."""
+    for video_type in video_type_registrar.itervalues():
+        if video_type.matches_video_url(url):
+            return video_type
+
+def indexed_lookup(url):
+    for video_type in video_type_registrar.candidates(url):
+        if video_type.matches_video_url(url):
+            return video_type
+
+class Command(BaseCommand):
+    help = u'Measures how fast URLs are matched to video types'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', '-r', dest='repeat', type="int",
+                    help='Lookups of each sample URL', default=2000),
+    )
+
+    def handle(self, repeat, *args, **kwargs):
+        urls = SAMPLE_URLS * repeat
+        lookups = (
+            ('linear', linear_lookup),
+            ('indexed', indexed_lookup),
+            ('cached', video_type_registrar.video_type_class_for_url),
+        )
+
+        for url in SAMPLE_URLS:
+            found = [lookup(url) for name, lookup in lookups]
+            assert len(set(found)) == 1, 'lookups disagree on %s' % url
+
+        for name, lookup in lookups:
+            start_t = time.time()
+            for url in urls:
+                lookup(url)
+            elapsed = time.time() - start_t
+
+            print '%-8s %10.0f lookups/s  %d lookups in %.2fs' % (
+                name, len(urls) / max(elapsed, 1e-6), len(urls), elapsed)
@@ -0,0 +1,47 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from videos.models import Action, ActionTimeline
+
+
+class Command(BaseCommand):
+    help = u'Adds the existing actions to the activity timelines'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', '-c', dest='chunk_size', type="int",
+                    help='Actions per query', default=1000),
+    )
+
+    def handle(self, chunk_size, *args, **kwargs):
+        verbosity = int(kwargs.get('verbosity', 1))
+        num = Action.objects.count()
+        count = 0
+        last_pk = 0
+        while True:
+            actions = list(Action.objects.filter(pk__gt=last_pk)
+                           .order_by('pk')[:chunk_size])
+            if not actions:
+                break
+            ActionTimeline.objects.fill(actions)
+            last_pk = actions[-1].pk
+            count += len(actions)
+            if verbosity > 0:
+                print "%s/%s actions" % (count, num)
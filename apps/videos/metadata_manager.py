@@ -19,163 +19,307 @@
 from teams.models import TeamVideo
 from datetime import datetime
 from utils.metrics import Meter, Timer
+from utils.orm import bulk_update
 
-def update_metadata(video_pk):
+def update_metadata(video_pk, new_version_id=None):
+    """Recompute the denormalized metadata of a video and its languages.
+
+    Languages, versions and subtitles are loaded with a fixed number of
+    queries, everything is computed in memory and the results are written
+    back with one UPDATE per table.
+
+    If new_version_id is given only the language of that version and its
+    translations are recomputed, the other languages keep their stored values.
+
+    """
     from videos.models import Video
     with Timer('metadata-update-time'):
         video = Video.objects.get(pk=video_pk)
-        video.edited = datetime.now()
-        video.save()
-        _update_is_public(video)
-        _update_forked(video)
-        _update_changes(video)
-        _update_subtitle_counts(video)
-        _update_percent_done(video)
-        _update_has_had_version(video)
-        _update_is_was_subtitled(video)
-        _update_languages_count(video)
-        _update_complete_date(video)
+        metadata = VideoMetadata(video, new_version_id)
+        metadata.update()
         _invalidate_cache(video)
 
-def _update_forked(video):
-    for sl in video.subtitlelanguage_set.all():
-        # This metrics is incremented here arbitrarily.  It could be done in any
-        # of the other many _update_* functions that loop over the language set.
-        Meter('language-metadata-update').inc()
-        if sl.latest_version() and \
-                sl.latest_version().is_forked != sl.is_forked:
-            sl.is_forked = sl.latest_version().is_forked
-            sl.save()
-
-def _update_changes(video):
-    from videos.models import SubtitleVersion
-    for sl in video.subtitlelanguage_set.all():
-        last_version = None
-        versions = sl.subtitleversion_set.order_by('version_no').all()
+class VideoMetadata(object):
+    """Computes a video's metadata from data loaded up front."""
+
+    LANGUAGE_FIELDS = ('is_forked', 'subtitle_count', 'percent_done',
+                       'is_complete', 'has_version', 'had_version', 'created')
+
+    def __init__(self, video, new_version_id=None):
+        from videos.models import SubtitleLanguage, SubtitleVersion
+
+        self.video = video
+        self.video_languages = list(video.subtitlelanguage_set.all())
+        self.languages = dict((sl.pk, sl) for sl in self.video_languages)
+
+        missing = set(sl.standard_language_id for sl in self.video_languages
+                      if sl.standard_language_id) - set(self.languages)
+        if missing:
+            for sl in SubtitleLanguage.objects.filter(pk__in=missing):
+                self.languages[sl.pk] = sl
+
+        # language pk -> versions, latest first
+        self.versions = dict((pk, []) for pk in self.languages)
+        versions = SubtitleVersion.objects.filter(
+            language__in=self.languages.keys()).defer(
+            'title', 'description', 'note').order_by('-version_no')
+        new_version = None
         for version in versions:
-            if version.text_change is None or version.time_change is None:
-                time_change, text_change = _update_changes_on_version(version, last_version)
-                SubtitleVersion.objects.filter(pk=version.pk).update(
-                        time_change=time_change, text_change=text_change)
-            last_version = version
-
-def _update_changes_on_version(version, last_version):
-    new_subtitles = version.subtitles()
-    subs_length = len(new_subtitles)
-
-    if not last_version:
-        return 1, 1
-    elif subs_length == 0:
-        old_subs_length = last_version.subtitle_set.count()
-        time_change = 0 if old_subs_length == 0 else 1
-        text_change = version.time_change
-        return time_change, text_change
-    else:
-        return _update_changes_on_nonzero_version(version, last_version)
-
-def _update_changes_on_nonzero_version(version, last_version):
-    subtitles = version.subtitles()
-    last_subtitles = dict([(item.subtitle_id, item)
-                           for item in last_version.subtitles()])
-    time_count_changed, text_count_changed = 0, 0
-    new_subtitles_ids = set()
-
-    for subtitle in subtitles:
-        new_subtitles_ids.add(subtitle.subtitle_id)
-        if subtitle.subtitle_id in last_subtitles:
-            last_subtitle = last_subtitles[subtitle.subtitle_id]
-            if not last_subtitle.text == subtitle.text:
-                text_count_changed += 1
-            if not subtitle.has_same_timing(last_subtitle):
-                time_count_changed += 1
+            self.versions[version.language_id].append(version)
+            if version.pk == new_version_id:
+                new_version = version
+
+        if new_version is None:
+            self.touched = self.video_languages
         else:
-            time_count_changed += 1
-            text_count_changed += 1
+            language_pk = new_version.language_id
+            self.touched = [sl for sl in self.video_languages
+                            if language_pk in (sl.pk, sl.standard_language_id)]
 
-    for subtitle_id in last_subtitles.keys():
-        if subtitle_id not in new_subtitles_ids:
-            text_count_changed += 1
-            time_count_changed += 1
+        self.subtitles = {}
+        self._effective = {}
+        self.changed = set()
 
-    subs_length = len(subtitles)
-    time_change = min(time_count_changed / 1. / subs_length, 1)
-    text_change = min(text_count_changed / 1. / subs_length, 1)
+    def update(self):
+        from videos.models import Video, SubtitleLanguage
 
-    return time_change, text_change
+        self._update_is_public()
+        self._update_forked()
+        self._update_changes()
+        self._load_subtitles(self._needed_collections())
+        for sl in self.touched:
+            Meter('language-metadata-update').inc()
+            self._update_subtitle_count(sl)
+            self._update_percent_done(sl)
+            self._update_has_had_version(sl)
+        self._update_is_was_subtitled()
+        self._update_languages_count()
+        self._update_complete_date()
 
-def _update_subtitle_counts(video):
-    from videos.models import Subtitle
-    for sl in video.subtitlelanguage_set.all():
-        original_value = sl.subtitle_count
-        new_value = sl.nonblank_subtitle_count() or 0
+        now = datetime.now()
+        values = {}
+        for sl in self.changed:
+            sl.created = now
+            values[sl.pk] = dict((name, getattr(sl, name))
+                                 for name in self.LANGUAGE_FIELDS)
+        bulk_update(SubtitleLanguage, values)
 
-        if original_value != new_value:
-            sl.subtitle_count = new_value
-            sl.save()
+        video = self.video
+        video.edited = now
+        Video.objects.filter(pk=video.pk).update(
+            edited=video.edited, is_public=video.is_public,
+            is_subtitled=video.is_subtitled, was_subtitled=video.was_subtitled,
+            languages_count=video.languages_count,
+            complete_date=video.complete_date)
 
-def _update_percent_done(video):
-    for sl in video.subtitlelanguage_set.all():
-        percent_done = sl.calculate_percent_done()
+    # Lookups
+    def latest_version(self, language_pk, public_only=True):
+        from videos.models import APPROVED, UNMODERATED
+        for version in self.versions.get(language_pk, []):
+            if not public_only or version.moderation_status in (APPROVED, UNMODERATED):
+                return version
 
-        if percent_done is None:
-            continue
+    def is_dependent(self, language):
+        return not language.is_original and not language.is_forked
+
+    def _version_is_dependent(self, version):
+        return (not self.languages[version.language_id].is_original
+                and not version.is_forked)
+
+    def _standard_collection(self, version, public_only):
+        standard_pk = self.languages[version.language_id].standard_language_id
+        if standard_pk:
+            return self.latest_version(standard_pk, public_only)
+
+    def _collections(self, version, public_only):
+        """Return the versions whose subtitles make up version's subtitles."""
+        if version is None:
+            return []
+        if not self._version_is_dependent(version):
+            return [version]
+        standard = self._standard_collection(version, public_only)
+        return [version] + ([standard] if standard else [])
+
+    def _needed_collections(self):
+        needed = []
+        for sl in self.touched:
+            needed.extend(self._collections(self.latest_version(sl.pk, False), False))
+            needed.extend(self._collections(self.latest_version(sl.pk, True), True))
+            if self.is_dependent(sl) and sl.standard_language_id:
+                needed.extend(self._collections(
+                    self.latest_version(sl.standard_language_id, True), True))
+        for sl in self.video_languages:
+            # only these can pass the cheap checks in _is_complete_and_synced
+            if sl.is_complete or self.is_dependent(sl):
+                needed.extend(self._collections(self.latest_version(sl.pk, True), True))
+        return needed
+
+    def _load_subtitles(self, versions):
+        from videos.models import Subtitle
+        versions = [v for v in versions if v.pk not in self.subtitles]
+        self.subtitles.update(Subtitle.objects.for_versions(versions))
+
+    def effective_subtitles(self, version, public_only=True):
+        """Same as version.subtitles(public_only=public_only)."""
+        from videos import EffectiveSubtitles
+        if version is None:
+            return EffectiveSubtitles()
+        key = (version.pk, public_only)
+        if key not in self._effective:
+            subtitles = self.subtitles[version.pk]
+            effective = EffectiveSubtitles()
+            if not self._version_is_dependent(version):
+                for s in subtitles:
+                    effective.append_subtitle(s)
+            else:
+                standard = self._standard_collection(version, public_only)
+                if standard:
+                    t_dict = dict([(s.subtitle_id, s) for s in subtitles])
+                    for s in self.subtitles[standard.pk]:
+                        if s.subtitle_id in t_dict:
+                            effective.append_translation(s, t_dict[s.subtitle_id])
+            self._effective[key] = effective
+        return self._effective[key]
+
+    def nonblank_subtitle_count(self, language_pk, public_only=False):
+        version = self.latest_version(language_pk, public_only)
+        return len([text for text in self.effective_subtitles(version, public_only).texts
+                    if text.strip()])
+
+    # Updates
+    def _set(self, sl, **fields):
+        for name, value in fields.items():
+            setattr(sl, name, value)
+        self.changed.add(sl)
+
+    def _update_is_public(self):
+        team_video = self.video.get_team_video()
+        if team_video:
+            self.video.is_public = team_video.team.is_visible
+        else:
+            self.video.is_public = True
+
+    def _update_forked(self):
+        for sl in self.touched:
+            latest = self.latest_version(sl.pk)
+            if latest and latest.is_forked != sl.is_forked:
+                self._set(sl, is_forked=latest.is_forked)
+
+    def _update_changes(self):
+        from videos.models import SubtitleVersion
+        from videos.diff import SubtitleDiff
+        pending = []
+        for sl in self.video_languages:
+            last_version = None
+            for version in reversed(self.versions[sl.pk]):
+                if version.text_change is None or version.time_change is None:
+                    pending.append((version, last_version))
+                last_version = version
+
+        needed = []
+        for version, last_version in pending:
+            if last_version is not None:
+                needed.extend(self._collections(version, True))
+                needed.extend(self._collections(last_version, True))
+        self._load_subtitles(needed)
+
+        values = {}
+        for version, last_version in pending:
+            if last_version is None:
+                time_change, text_change = 1, 1
+            else:
+                diff = SubtitleDiff(self.effective_subtitles(last_version),
+                                    self.effective_subtitles(version))
+                time_change, text_change = diff.time_change, diff.text_change
+            values[version.pk] = {'time_change': time_change,
+                                  'text_change': text_change}
+        bulk_update(SubtitleVersion, values)
+
+    def _update_subtitle_count(self, sl):
+        new_value = self.nonblank_subtitle_count(sl.pk) or 0
+        if sl.subtitle_count != new_value:
+            self._set(sl, subtitle_count=new_value)
+
+    def _update_percent_done(self, sl):
+        # same as SubtitleLanguage.calculate_percent_done
+        if not self.is_dependent(sl):
+            return
+
+        translation_count = self.nonblank_subtitle_count(sl.pk)
+        if sl.standard_language_id:
+            subtitle_count = self.nonblank_subtitle_count(
+                sl.standard_language_id, public_only=True)
+        else:
+            subtitle_count = 0
+
+        if subtitle_count == 0:
+            percent_done = 0
+        else:
+            percent_done = int(100 * float(translation_count) / float(subtitle_count))
+            percent_done = max(0, min(percent_done, 100))
+
+        if translation_count and percent_done < 1:
+            percent_done = 1
 
         if percent_done != sl.percent_done:
-            sl.percent_done = percent_done
-            sl.is_complete = percent_done == 100
-            sl.save()
+            self._set(sl, percent_done=percent_done,
+                      is_complete=percent_done == 100)
 
-def _update_has_had_version(video):
-    for sl in video.subtitlelanguage_set.all():
-        version = sl.latest_version()
+    def _update_has_had_version(self, sl):
+        version = self.latest_version(sl.pk)
         if not version:
-            sl.had_version = False
-            sl.has_version = False
-            sl.save()
-        elif len(version.subtitles()) == 0:
+            self._set(sl, had_version=False, has_version=False)
+        elif len(self.effective_subtitles(version)) == 0:
             if sl.has_version:
-                sl.has_version = False
-                sl.save()
+                self._set(sl, has_version=False)
         else:
             if not sl.has_version or not sl.had_version:
-                sl.had_version = True
-                sl.has_version = True
-                sl.save()
-
-def _update_is_was_subtitled(video):
-    language = video.subtitle_language()
-    if not language or not language.has_version:
-        if video.is_subtitled:
+                self._set(sl, had_version=True, has_version=True)
+
+    def _update_is_was_subtitled(self):
+        video = self.video
+        originals = [sl for sl in self.video_languages if sl.is_original]
+        language = originals[0] if originals else None
+        if not language or not language.has_version:
             video.is_subtitled = False
-            video.save()
-    else:
-        if not video.is_subtitled or not video.was_subtitled:
+        else:
             video.is_subtitled = True
             video.was_subtitled = True
-            video.save()
 
-def _update_languages_count(video):
-    video.languages_count = video.subtitlelanguage_set.filter(had_version=True, has_version=True).count()
-    video.save()
+    def _update_languages_count(self):
+        self.video.languages_count = len([
+            sl for sl in self.video_languages
+            if sl.had_version and sl.has_version])
+
+    def _is_complete_and_synced(self, sl):
+        # same as SubtitleLanguage.is_complete_and_synced
+        from videos import is_synced_value
+        if self.is_dependent(sl):
+            if sl.percent_done != 100:
+                return False
+            standard = self.languages.get(sl.standard_language_id)
+            if not standard or not standard.is_complete:
+                return False
+        elif not sl.is_complete:
+            return False
+        subtitles = self.effective_subtitles(self.latest_version(sl.pk))
+        if len(subtitles) == 0:
+            return False
+        if len([s for s in subtitles[:-1] if not s.has_complete_timing()]) > 0:
+            return False
+        if not is_synced_value(subtitles[-1].start_time):
+            return False
+        return True
 
-def _update_complete_date(video):
-    is_complete = video.is_complete
-    if is_complete and video.complete_date is None:
-        video.complete_date = datetime.now()
-        video.save()
-    elif not is_complete and video.complete_date is not None:
-        video.complete_date = None
-        video.save()
+    def _update_complete_date(self):
+        video = self.video
+        is_complete = any(self._is_complete_and_synced(sl)
+                          for sl in self.video_languages)
+        if is_complete and video.complete_date is None:
+            video.complete_date = datetime.now()
+        elif not is_complete and video.complete_date is not None:
+            video.complete_date = None
 
 def _invalidate_cache(video):
     from widget import video_cache
     video_cache.invalidate_cache(video.video_id)
-
-
-def _update_is_public(video):
-    team_video = video.get_team_video()
-    if team_video:
-        video.is_public = team_video.team.is_visible
-    else:
-        video.is_public = True
-    video.save()
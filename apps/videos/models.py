@@ -17,6 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 import logging
+import operator
 logger = logging.getLogger("videos-models")
 
 import string
@@ -40,7 +41,7 @@ from django.core.urlresolvers import reverse
 
 
 from auth.models import CustomUser as User, Awards
-from videos import EffectiveSubtitle, is_synced, is_synced_value
+from videos import EffectiveSubtitles, is_synced, is_synced_value
 from videos.types import video_type_registrar
 from videos.feed_parser import FeedParser
 from comments.models import Comment
@@ -49,6 +50,7 @@ from statistic.tasks import st_sub_fetch_handler_update, st_video_view_handler_u
 from widget import video_cache
 from utils.redis_utils import RedisSimpleField
 from utils.amazon import S3EnabledImageField
+from utils.orm import bulk_insert
 from utils.panslugify import pan_slugify
 
 from apps.teams.moderation_const import (
@@ -461,6 +463,119 @@ class Video(models.Model):
                 video_url_obj.save()
         return video, created
 
+    @classmethod
+    def get_or_create_for_urls(cls, video_urls=None, vts=None, user=None):
+        """Resolve many URLs to videos at once, creating the missing ones.
+
+        Works like get_or_create_for_url for each of video_urls (or of the
+        VideoTypes vts), but the existing videos of the whole batch are
+        found with two queries and the follow-up tasks of the new videos
+        are queued together.  Returns a list of (video, created) in the
+        order of the input, with (None, False) where a URL isn't a video.
+        """
+        assert video_urls is not None or vts is not None, \
+            'should be video URLs or VideoTypes'
+        if vts is None:
+            vts = [video_type_registrar.video_type_for_url(video_url)
+                   for video_url in video_urls]
+        vts = list(vts)
+        urls = [vt and vt.convert_to_video_url() for vt in vts]
+
+        by_url = {}
+        if any(urls):
+            for video_url_obj in VideoUrl.objects.filter(
+                    url__in=set(url for url in urls if url)
+                    ).select_related('video'):
+                by_url[video_url_obj.url] = video_url_obj
+
+        # like in get_or_create_for_url, the URLs we don't know may still
+        # match a video by its id on the site
+        lookups = {}
+        for vt, url in zip(vts, urls):
+            if vt and url not in by_url:
+                field, value = vt.create_kwars().items()[0]
+                lookups.setdefault((vt.abbreviation, field), set()).add(value)
+        by_kwargs = {}
+        if lookups:
+            query = reduce(operator.or_, [
+                Q(type=abbreviation, **{field + '__in': values})
+                for (abbreviation, field), values in lookups.items()])
+            for video_url_obj in VideoUrl.objects.filter(
+                    query).select_related('video'):
+                for field in ('url', 'videoid'):
+                    key = (video_url_obj.type, field,
+                           getattr(video_url_obj, field))
+                    by_kwargs.setdefault(key, video_url_obj)
+
+        results = []
+        new_videos, new_video_urls = [], []
+        try:
+            for vt, url in zip(vts, urls):
+                if not vt:
+                    results.append((None, False))
+                    continue
+
+                video_url_obj = by_url.get(url)
+                if video_url_obj is not None:
+                    video = video_url_obj.video
+                    if user and user.notify_by_message:
+                        video.followers.add(user)
+                    if (not video_url_obj.owner_username and
+                            hasattr(vt, 'username')):
+                        video_url_obj.owner_username = vt.username
+                        video_url_obj.save()
+                    results.append((video, False))
+                    continue
+
+                field, value = vt.create_kwars().items()[0]
+                video_url_obj = by_kwargs.get((vt.abbreviation, field, value))
+                if video_url_obj is not None:
+                    if user:
+                        Action.create_video_handler(video_url_obj.video, user)
+                    results.append((video_url_obj.video, False))
+                    continue
+
+                obj = Video()
+                obj = vt.set_values(obj)
+                if obj.title:
+                    obj.slug = slugify(obj.title)
+                obj.user = user
+                obj.save()
+
+                Action.create_video_handler(obj, user)
+                if user and user.notify_by_message:
+                    obj.followers.add(user)
+
+                # the first URL of a new video needs none of the VideoUrl
+                # post_save handlers, so they're inserted together
+                video_url_obj = VideoUrl(
+                    url=url, type=vt.abbreviation, original=True, primary=True,
+                    added_by=user, video=obj, videoid=vt.video_id or '',
+                    created=datetime.now(),
+                    owner_username=getattr(vt, 'username', None))
+                new_videos.append(obj)
+                new_video_urls.append(video_url_obj)
+                # the same video may come up again later in the batch
+                by_url[url] = video_url_obj
+                by_kwargs[(vt.abbreviation, field, value)] = video_url_obj
+                results.append((obj, True))
+        finally:
+            # the videos created before an error still get their URLs
+            if new_videos:
+                bulk_insert(VideoUrl, new_video_urls)
+                for video_url_obj in new_video_urls:
+                    video_cache.invalidate_video_id(video_url_obj.url)
+
+                from videos.tasks import save_thumbnails_in_s3
+                from utils.celery_search_index import update_search_index_for_qs
+                thumbnailed = [v.pk for v in new_videos if v.thumbnail]
+                if thumbnailed:
+                    save_thumbnails_in_s3.delay(thumbnailed)
+                update_search_index_for_qs.delay(
+                    Video, [v.pk for v in new_videos])
+
+        return results
+
     @property
     def language(self):
         """Return the language code of this video's original language as a string.
@@ -787,6 +902,7 @@ def create_video_id(sender, instance, **kwargs):
 
 def video_delete_handler(sender, instance, **kwargs):
     video_cache.invalidate_cache(instance.video_id)
+    video_cache.invalidate_video_urls(instance)
     # avoid circular dependencies, import here
     from haystack import site
     search_index = site.get_index(Video)
@@ -1110,11 +1226,11 @@ class SubtitleLanguage(models.Model):
         """
         to_language = attach_to_language or self
         if from_version:
-            original_subs = from_version.subtitle_set.all()
+            original_subs = from_version.get_subtitles()
         else:
             if self.standard_language is None:
                 return
-            original_subs = self.standard_language.latest_version().subtitle_set.all()
+            original_subs = self.standard_language.latest_version().get_subtitles()
 
         if self.is_writelocked and not bypass_writelock:
             raise AlreadyEditingException(_("Sorry, you cannot upload subtitles right now because someone is editing the language you are uploading or a translation of it"))
@@ -1138,8 +1254,8 @@ class SubtitleLanguage(models.Model):
 
         if old_version:
             original_sub_dict = dict([(s.subtitle_id, s) for s  in original_subs])
-            my_subs = old_version.subtitle_set.all()
-            for sub in my_subs:
+            subs = [sub.duplicate_for() for sub in old_version.get_subtitles()]
+            for sub in subs:
                 if sub.subtitle_id in original_sub_dict:
                     # if we can match, then we can simply copy
                     # time data
@@ -1147,10 +1263,7 @@ class SubtitleLanguage(models.Model):
                     sub.start_time = standard_sub.start_time
                     sub.end_time = standard_sub.end_time
                     sub.subtitle_order = standard_sub.subtitle_order
-                    sub.datetime_started = datetime.now()
-                sub.pk = None
-                sub.version = version
-                sub.save()
+            Subtitle.objects.bulk_save(version, subs)
 
         self.is_forked = True
         self.standard_language = None
@@ -1210,7 +1323,7 @@ class SubtitleCollection(models.Model):
 
     def subtitles(self, subtitles_to_use=None, public_only=True):
         """
-        Returns EffectiveSubtitle instances but also fetches timing data
+        Returns EffectiveSubtitles but also fetches timing data
         from the original sub if this is a translation.
         It will only match if the subtitile_id matches, else those subs
         not returned.
@@ -1221,26 +1334,24 @@ class SubtitleCollection(models.Model):
         if  self.pk:
             # if this collection hasn't been saved, then subtitle_set.all will return all subtitles
             # which will take too long / never return
-            subtitles = subtitles_to_use or self.subtitle_set.all()
+            subtitles = subtitles_to_use or self.get_subtitles()
         else:
             subtitles = subtitles_to_use or []
+        effective_subtitles = EffectiveSubtitles()
         if not self.is_dependent():
-            effective_subtitles = [EffectiveSubtitle.for_subtitle(s)
-                                   for s in subtitles]
+            for s in subtitles:
+                effective_subtitles.append_subtitle(s)
         else:
             standard_collection = self._get_standard_collection(public_only=public_only)
-            if not standard_collection:
-                effective_subtitles = []
-            else:
+            if standard_collection:
                 t_dict = \
                     dict([(s.subtitle_id, s) for s
                           in subtitles])
-                filtered_subs = standard_collection.subtitle_set.all()
-                subs = [s for s in filtered_subs
-                        if s.subtitle_id in t_dict]
-                effective_subtitles = \
-                    [EffectiveSubtitle.for_dependent_translation(
-                        s, t_dict[s.subtitle_id]) for s in subs]
+                filtered_subs = standard_collection.get_subtitles()
+                for s in filtered_subs:
+                    if s.subtitle_id in t_dict:
+                        effective_subtitles.append_translation(
+                            s, t_dict[s.subtitle_id])
         setattr(self, ATTR, effective_subtitles)
         return effective_subtitles
 
@@ -1273,10 +1384,10 @@ class SubtitleVersionManager(models.Manager):
 
         if isinstance(translated_from, SubtitleVersion):
             forked_from = translated_from
-            original_subs = list(translated_from.subtitle_set.order_by("subtitle_order"))
+            original_subs = list(translated_from.get_subtitles())
         else:
             if translated_from and translated_from.version():
-                original_subs = list(translated_from.version().subtitle_set.order_by("subtitle_order"))
+                original_subs = list(translated_from.version().get_subtitles())
                 forked_from = translated_from.version()
 
         version = SubtitleVersion(
@@ -1295,44 +1406,39 @@ class SubtitleVersionManager(models.Manager):
 
         version.save()
 
-        ids = set()
+        items = list(parser)
+        original_subs = (original_subs or [])[:len(items)]
+        new_ids = new_subtitle_ids(
+            len(items) - len(original_subs),
+            [sub.subtitle_id for sub in original_subs])
 
-        for i, item in enumerate(parser):
-            original_sub  = None
+        captions = []
+        metadata = {}
 
-            if translated_from and len(original_subs) > i:
-               original_sub  = original_subs[i]
+        for i, item in enumerate(items):
+            if i < len(original_subs):
+                original_sub = original_subs[i]
 
-               id = original_sub.subtitle_id
-               order = original_sub.subtitle_order
-               paragraph = original_sub.start_of_paragraph
+                id = original_sub.subtitle_id
+                order = original_sub.subtitle_order
+                paragraph = original_sub.start_of_paragraph
             else:
-                id = int(random.random()*10e12)
+                id = new_ids[i - len(original_subs)]
                 order = i +1
-
-                while id in ids:
-                    id = int(random.random()*10e12)
-
                 paragraph = item.get('start_of_paragraph', False)
 
-            ids.add(id)
-
-            metadata = item.pop('metadata', None)
+            if item.get('metadata'):
+                metadata[id] = item['metadata']
 
-            caption, created = Subtitle.objects.get_or_create(version=version, subtitle_id=str(id))
-            caption.datetime_started = datetime.now()
-            caption.subtitle_order = order
-            caption.subtitle_text = html_to_markup(item['subtitle_text'])
-            caption.start_time = item['start_time']
-            caption.end_time = item['end_time']
-            caption.start_of_paragraph = paragraph
-            caption.save()
+            captions.append(Subtitle(
+                subtitle_id=id,
+                subtitle_order=order,
+                subtitle_text=html_to_markup(item['subtitle_text']),
+                start_time=item['start_time'],
+                end_time=item['end_time'],
+                start_of_paragraph=paragraph))
 
-            if metadata:
-                for name, value in metadata.items():
-                    SubtitleMetadata(
-                        subtitle=caption, key=name, data=value
-                    ).save()
+        Subtitle.objects.bulk_save(version, captions, metadata)
 
         return version
 
@@ -1353,6 +1459,12 @@ class SubtitleVersion(SubtitleCollection):
     notification_sent = models.BooleanField(default=False)
     result_of_rollback = models.BooleanField(default=False)
     forked_from = models.ForeignKey("self", blank=True, null=True)
+    # when set, this version's Subtitle rows are only the cues inserted,
+    # changed or deleted since delta_parent, see SubtitleManager.bulk_save
+    delta_parent = models.ForeignKey("self", blank=True, null=True,
+                                     related_name='delta_children')
+    # number of versions to replay to reconstruct the subtitles
+    delta_depth = models.PositiveIntegerField(default=0)
 
     title = models.CharField(max_length=2048, blank=True)
     description = models.TextField(blank=True, null=True)
@@ -1377,6 +1489,22 @@ class SubtitleVersion(SubtitleCollection):
                 self.language.video.followers.remove(self.user)
                 self.language.followers.add(self.user)
 
+    def delete(self, *args, **kwargs):
+        for child in self.delta_children.all():
+            Subtitle.objects.make_snapshot(child)
+        super(SubtitleVersion, self).delete(*args, **kwargs)
+
+    def get_subtitles(self):
+        """Return this version's Subtitles, ordered by subtitle_order.
+
+        Use this instead of subtitle_set, which only has the changes made
+        by this version when it is stored as a delta.
+
+        """
+        if not hasattr(self, '_subtitle_rows'):
+            self._subtitle_rows = Subtitle.objects.for_versions([self])[self.pk]
+        return self._subtitle_rows
+
     def changed_from(self, other_subs):
         my_subs = self.subtitles()
         if len(other_subs) != len(my_subs):
@@ -1390,6 +1518,8 @@ class SubtitleVersion(SubtitleCollection):
         return False
 
     def has_subtitles(self):
+        if self.delta_parent_id:
+            return len(self.get_subtitles()) > 0
         return self.subtitle_set.exists()
 
     @models.permalink
@@ -1491,8 +1621,8 @@ class SubtitleVersion(SubtitleCollection):
                           title=self.title, description=self.description)
         new_version.save()
 
-        for item in self.subtitle_set.all():
-            item.duplicate_for(version=new_version).save()
+        Subtitle.objects.bulk_save(new_version, [
+            item.duplicate_for() for item in self.get_subtitles()])
         if last_version.forked_from:
             if self.language.standard_language and self.language.is_forked == True :
                 # we are rolling back to a version that was dependent
@@ -1781,11 +1911,159 @@ class SubtitleVersionMetadata(models.Model):
 
 
 # Subtitle
+SUBTITLE_ID_MAX = int(10e12)
+
+def new_subtitle_ids(count, taken=()):
+    """Return count distinct random subtitle ids, none of which are in taken.
+
+    Subtitle ids are strings, as stored in Subtitle.subtitle_id.
+
+    """
+    taken = set(taken)
+    ids = random.sample(xrange(SUBTITLE_ID_MAX), count + len(taken))
+    return [id for id in map(str, ids) if id not in taken][:count]
+
 class SubtitleManager(models.Manager):
 
     def unsynced(self):
         return self.get_query_set().filter(start_time__isnull=True, end_time__isnull=True)
 
+    def for_versions(self, versions):
+        """Return a dict of version pk -> the version's Subtitles.
+
+        Delta versions are rebuilt from the rows of every version in their
+        chain, loaded with one query for all of them.  The lists are
+        ordered by subtitle_order.
+
+        """
+        parents = dict((v.pk, v.delta_parent_id) for v in versions)
+        missing = set(parents.values()) - set(parents) - set([None])
+        while missing:
+            found = dict(SubtitleVersion.objects.filter(pk__in=missing)
+                         .values_list('pk', 'delta_parent'))
+            parents.update(found)
+            missing = set(found.values()) - set(parents) - set([None])
+
+        rows = dict((pk, []) for pk in parents)
+        if rows:
+            for subtitle in self.filter(version__in=rows.keys()):
+                rows[subtitle.version_id].append(subtitle)
+
+        result = {}
+        for version in versions:
+            chain = []
+            pk = version.pk
+            while pk is not None:
+                chain.append(pk)
+                pk = parents[pk]
+            cues = {}
+            for pk in reversed(chain):
+                for subtitle in rows[pk]:
+                    if subtitle.deleted:
+                        cues.pop(subtitle.subtitle_id, None)
+                    else:
+                        cues[subtitle.subtitle_id] = subtitle
+            result[version.pk] = sorted(cues.values(),
+                                        key=lambda s: s.subtitle_order)
+        return result
+
+    def _delta_parent(self, version):
+        max_depth = getattr(settings, 'SUBTITLE_VERSION_DELTA_CHAIN', 0)
+        if not max_depth:
+            return None
+        try:
+            parent = (SubtitleVersion.objects
+                      .filter(language=version.language_id,
+                              version_no__lt=version.version_no)[:1].get())
+        except SubtitleVersion.DoesNotExist:
+            return None
+        if parent.delta_depth < max_depth:
+            return parent
+
+    def _delta(self, parent, subtitles, metadata):
+        """Return the rows storing subtitles as changes to parent."""
+        fields = ('subtitle_order', 'subtitle_text', 'start_time', 'end_time',
+                  'start_of_paragraph')
+        old = dict((s.subtitle_id, s) for s in parent.get_subtitles())
+        rows = []
+        for subtitle in subtitles:
+            previous = old.pop(subtitle.subtitle_id, None)
+            if (previous is None or subtitle.subtitle_id in metadata or
+                any(getattr(subtitle, f) != getattr(previous, f)
+                    for f in fields)):
+                rows.append(subtitle)
+        rows.extend(Subtitle(subtitle_id=subtitle_id, deleted=True)
+                    for subtitle_id in old)
+        return rows
+
+    def bulk_save(self, version, subtitles, metadata=None):
+        """Save the given new Subtitles for the version with batched INSERTs.
+
+        metadata is an optional dict of subtitle_id -> {key: data}, which is
+        saved as SubtitleMetadata for those subtitles.
+
+        When settings.SUBTITLE_VERSION_DELTA_CHAIN allows it, only the
+        subtitles that differ from the previous version are stored and the
+        version is marked as a delta of it.
+
+        Subtitle.save() is not called, but its normalization is applied.  The
+        instances won't have a pk afterwards.
+
+        """
+        for subtitle in subtitles:
+            subtitle.normalize_timing()
+
+        parent = self._delta_parent(version)
+        if parent is not None:
+            rows = self._delta(parent, subtitles, metadata or {})
+            # not worth it when most of the cues changed
+            if len(rows) < len(subtitles):
+                version.delta_parent = parent
+                version.delta_depth = parent.delta_depth + 1
+                SubtitleVersion.objects.filter(pk=version.pk).update(
+                    delta_parent=parent, delta_depth=version.delta_depth)
+                subtitles = rows
+
+        self._insert(version, subtitles, metadata)
+
+    def _insert(self, version, subtitles, metadata):
+        for subtitle in subtitles:
+            subtitle.version = version
+
+        bulk_insert(self.model, subtitles)
+
+        if metadata:
+            pks = dict(self.filter(version=version).values_list('subtitle_id', 'pk'))
+            bulk_insert(SubtitleMetadata, [
+                SubtitleMetadata(subtitle_id=pks[subtitle_id], key=key, data=data)
+                for subtitle_id, items in metadata.items()
+                for key, data in items.items()])
+
+    def make_snapshot(self, version):
+        """Store all of a delta version's subtitles in the version itself.
+
+        Needed before its delta parent is deleted.
+
+        """
+        if not version.delta_parent_id:
+            return
+        inherited = [s for s in version.get_subtitles()
+                     if s.version_id != version.pk]
+        subtitle_ids = dict((s.pk, s.subtitle_id) for s in inherited)
+        metadata = {}
+        items = SubtitleMetadata.objects.filter(subtitle__in=subtitle_ids.keys())
+        for item in items:
+            subtitle_id = subtitle_ids[item.subtitle_id]
+            metadata.setdefault(subtitle_id, {})[item.key] = item.data
+
+        self.filter(version=version, deleted=True).delete()
+        self._insert(version, [s.duplicate_for() for s in inherited], metadata)
+        SubtitleVersion.objects.filter(pk=version.pk).update(
+            delta_parent=None, delta_depth=0)
+        version.delta_parent = None
+        version.delta_depth = 0
+        del version._subtitle_rows
+
 class Subtitle(models.Model):
     version = models.ForeignKey(SubtitleVersion, null=True)
     subtitle_id = models.CharField(max_length=32, blank=True)
@@ -1796,6 +2074,8 @@ class Subtitle(models.Model):
     # in seconds. if no end time is set, should be null.
     end_time = models.FloatField(null=True)
     start_of_paragraph = models.BooleanField(default=False)
+    # marks a cue of the delta parent that this version deleted
+    deleted = models.BooleanField(default=False)
 
     objects = SubtitleManager()
 
@@ -1843,7 +2123,7 @@ class Subtitle(models.Model):
             if 'end_time' in caption_dict:
                 self.end_time = caption_dict['end_time']
 
-    def save(self, *args, **kwargs):
+    def normalize_timing(self):
         # Normalize start_time and end_time to None (separately) if either is
         # not a valid time.
         if not is_synced_value(self.start_time):
@@ -1852,6 +2132,8 @@ class Subtitle(models.Model):
         if not is_synced_value(self.end_time):
             self.end_time = None
 
+    def save(self, *args, **kwargs):
+        self.normalize_timing()
         return super(Subtitle, self).save(*args, **kwargs)
 
     def __unicode__(self):
@@ -2351,6 +2633,176 @@ class Action(models.Model):
 post_save.connect(Action.create_comment_handler, Comment)
 
 
+# ActionTimeline
+TIMELINE_CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+class ActionTimelineManager(models.Manager):
+    def _video_teams(self, actions):
+        from teams.models import TeamVideo
+        video_pks = set(a.video_id for a in actions if a.video_id)
+        if not video_pks:
+            return {}
+        return dict(TeamVideo.objects.filter(video__in=video_pks)
+                    .values_list('video', 'team'))
+
+    def _entries(self, action, video_teams):
+        model = self.model
+        feeds = []
+        if action.user_id:
+            feeds.append((model.USER, action.user_id))
+        if action.team_id:
+            feeds.append((model.TEAM, action.team_id))
+            feeds.append((model.TEAM_ACTIVITY, action.team_id))
+        if action.video_id:
+            feeds.append((model.VIDEO, action.video_id))
+            team_id = video_teams.get(action.video_id)
+            if team_id and team_id != action.team_id:
+                feeds.append((model.TEAM_ACTIVITY, team_id))
+        return [model(feed_type=feed_type, feed_id=feed_id, action=action,
+                      video_id=action.video_id, created=action.created)
+                for feed_type, feed_id in feeds]
+
+    def on_action_saved(self, sender, instance, created, raw, **kwargs):
+        if created and not raw:
+            bulk_insert(self.model, self._entries(
+                instance, self._video_teams([instance])))
+
+    def fill(self, actions):
+        """Add the entries of actions that aren't in the timelines yet."""
+        actions = list(actions)
+        video_teams = self._video_teams(actions)
+        existing = set(self.filter(action__in=[a.pk for a in actions])
+                       .values_list('feed_type', 'feed_id', 'action'))
+        bulk_insert(self.model, [
+            entry for action in actions
+            for entry in self._entries(action, video_teams)
+            if (entry.feed_type, entry.feed_id, action.pk) not in existing])
+
+    def add_team_video(self, team_video):
+        """Add the actions of a video that joined a team to its activity."""
+        existing = set(self.filter(
+            feed_type=self.model.TEAM_ACTIVITY, feed_id=team_video.team_id,
+            video=team_video.video_id).values_list('action', flat=True))
+        bulk_insert(self.model, [
+            self.model(feed_type=self.model.TEAM_ACTIVITY,
+                       feed_id=team_video.team_id, action_id=pk,
+                       video_id=team_video.video_id, created=created)
+            for pk, created in Action.objects.filter(
+                video=team_video.video_id).values_list('pk', 'created')
+            if pk not in existing])
+
+    def remove_team_video(self, team_video):
+        """Remove the actions of a video that left a team from its activity."""
+        self.filter(feed_type=self.model.TEAM_ACTIVITY,
+                    feed_id=team_video.team_id,
+                    video=team_video.video_id).exclude(
+            action__team=team_video.team_id).delete()
+
+    def page(self, feeds, before=None, limit=None, public_only=False):
+        """Return a page of the Actions in the given feeds, newest first.
+
+        feeds is a list of (feed_type, feed_id).  Each is read with one
+        range scan of its index, starting after the before cursor.
+
+        Returns the actions and the cursor of the next page, which is None
+        on the last page.
+
+        """
+        limit = limit or settings.ACTIVITIES_ONPAGE
+        try:
+            created, action_id = before.split('-')
+            cursor = (datetime.strptime(created, TIMELINE_CURSOR_FORMAT),
+                      int(action_id))
+        except (AttributeError, ValueError):
+            cursor = None
+
+        entries = set()
+        for feed_type, feed_id in feeds:
+            qs = self.filter(feed_type=feed_type, feed_id=feed_id)
+            if cursor:
+                qs = qs.filter(Q(created__lt=cursor[0]) |
+                               Q(created=cursor[0], action__lt=cursor[1]))
+            if public_only:
+                qs = qs.filter(action__language__has_version=True)
+            # ordering by action would use Action's ordering, with a join
+            qs = qs.extra(order_by=[
+                '-created', '-%s.action_id' % self.model._meta.db_table])
+            entries.update(qs.values_list('created', 'action')[:limit + 1])
+        entries = sorted(entries, reverse=True)
+
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            created, action_id = entries[-1]
+            next_cursor = '%s-%s' % (created.strftime(TIMELINE_CURSOR_FORMAT),
+                                     action_id)
+
+        actions = Action.objects.filter(
+            pk__in=[pk for created, pk in entries]).select_related(
+            'video', 'user', 'language', 'language__video')
+        actions = dict((action.pk, action) for action in actions)
+        return ([actions[pk] for created, pk in entries if pk in actions],
+                next_cursor)
+
+    def for_team(self, team, public_only=True, before=None, limit=None):
+        """Same as Action.objects.for_team, as a page."""
+        return self.page([(self.model.TEAM_ACTIVITY, team.pk)], before, limit,
+                         public_only=public_only)
+
+    def for_user(self, user, before=None, limit=None):
+        """Same as Action.objects.for_user, as a page."""
+        feeds = [(self.model.USER, user.pk)]
+        feeds.extend((self.model.TEAM, pk)
+                     for pk in user.teams.values_list('pk', flat=True))
+        return self.page(feeds, before, limit)
+
+    def for_video(self, video, user=None, before=None, limit=None):
+        """Same as Action.objects.for_video, as a page."""
+        public_only = False
+        team_video = video.get_team_video()
+        if team_video:
+            public_only = not team_video.team.is_member(user)
+        return self.page([(self.model.VIDEO, video.pk)], before, limit,
+                         public_only=public_only)
+
+class ActionTimeline(models.Model):
+    """An Action copied into one of the feeds it is shown in.
+
+    Written when the Action is created, so reading a feed is a range scan
+    of the (feed_type, feed_id, created, action) index, which is created in
+    the migration, instead of ORs and joins over Action.
+
+    """
+    # actions by the user
+    USER = 1
+    # actions with the team set, shown to its members
+    TEAM = 2
+    # the team's activity page, which also has its videos' actions
+    TEAM_ACTIVITY = 3
+    VIDEO = 4
+    FEED_TYPES = (
+        (USER, 'user'),
+        (TEAM, 'team'),
+        (TEAM_ACTIVITY, 'team activity'),
+        (VIDEO, 'video'),
+    )
+
+    feed_type = models.PositiveSmallIntegerField(choices=FEED_TYPES)
+    feed_id = models.PositiveIntegerField()
+    action = models.ForeignKey(Action)
+    # copied from the action
+    video = models.ForeignKey(Video, null=True, blank=True)
+    created = models.DateTimeField()
+
+    objects = ActionTimelineManager()
+
+    class Meta:
+        unique_together = (('feed_type', 'feed_id', 'action'),)
+
+post_save.connect(ActionTimeline.objects.on_action_saved, Action,
+                  dispatch_uid='videos.action.timeline')
+
+
 # UserTestResult
 class UserTestResult(models.Model):
     email = models.EmailField()
@@ -2415,27 +2867,47 @@ class VideoFeed(models.Model):
     last_link = models.URLField(blank=True)
     created = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, blank=True, null=True)
+    # validators of the last download, for conditional GETs
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
 
     def __unicode__(self):
         return self.url
 
-    def update(self):
-        feed_parser = FeedParser(self.url)
+    def fetch_job(self):
+        """Return the job to download this feed, see FeedFetcher.fetch."""
+        return (self.pk, self.url, self.etag, self.last_modified)
+
+    def update(self, feed_parser=None):
+        """Import the entries added since the last update.
+
+        feed_parser is the feed as already downloaded, if it was.  Returns
+        the number of entries checked, 0 when the feed didn't change.
+        """
+        if feed_parser is None:
+            feed_parser = FeedParser(self.url, etag=self.etag or None,
+                                     modified=self.last_modified or None)
+        if feed_parser.not_modified:
+            return 0
 
         checked_entries = 0
         last_link = self.last_link
 
+        self.etag = feed_parser.etag
+        self.last_modified = feed_parser.modified
         try:
             self.last_link = feed_parser.feed.entries[0]['link']
-            self.save()
         except (IndexError, KeyError):
             pass
+        self.save()
 
         _iter = feed_parser.items(reverse=True, until=last_link, ignore_error=True)
 
+        vts = []
         for vt, info, entry in _iter:
-            vt and Video.get_or_create_for_url(vt=vt, user=self.user)
+            vt and vts.append(vt)
             checked_entries += 1
+        Video.get_or_create_for_urls(vts=vts, user=self.user)
 
         return checked_entries
 
@@ -1,9 +1,12 @@
 from haystack.indexes import *
 from haystack.models import SearchResult
 from haystack import site
-from models import Video
-from auth.models import CustomUser as User
+from models import Video, SubtitleLanguage, SubtitleVersion, Action
+from teams.moderation_const import APPROVED, UNMODERATED
+from django.db.models import Count
+from statistic import st_widget_view_statistic
 from utils.celery_search_index import CelerySearchIndex
+from utils.orm import LoadRelatedQuerySet
 from django.conf import settings
 from haystack.query import SearchQuerySet
 import datetime
@@ -69,6 +72,83 @@ class LanguagesField(MultiValueField):
 
         return [LanguageField.convert(v) for v in list(value)]
 
+def get_index_data(videos):
+    """
+    Load what VideoIndex.prepare needs for all videos with grouped queries,
+    return {video pk: data}. Also fills Video.views in the objects.
+    """
+    videos = dict((v.pk, v) for v in videos)
+    pks = videos.keys()
+    data = dict((pk, {
+        'languages': [],
+        'languages_count': 0,
+        'contributors_count': 0,
+        'activity_count': 0,
+    }) for pk in pks)
+
+    originals = {}
+    for sl in SubtitleLanguage.objects.filter(video__in=pks).order_by('pk'):
+        video_data = data[sl.video_id]
+        if sl.subtitle_count > 0:
+            if sl.language:
+                video_data['languages'].append(sl.language)
+            if sl.has_version:
+                video_data['languages_count'] += 1
+        if sl.is_original and sl.video_id not in originals:
+            originals[sl.video_id] = sl
+
+    contributors = SubtitleVersion.objects.filter(language__video__in=pks) \
+        .values_list('language__video').annotate(c=Count('user', distinct=True))
+    for video_pk, count in contributors:
+        data[video_pk]['contributors_count'] = count
+
+    activity = Action.objects.filter(video__in=pks) \
+        .values_list('video').annotate(c=Count('pk'))
+    for video_pk, count in activity:
+        data[video_pk]['activity_count'] = count
+
+    # latest public version title of the original languages, see
+    # Video.title_display
+    version_titles = {}
+    versions = SubtitleVersion.objects.filter(
+        language__in=[sl.pk for sl in originals.values()],
+        moderation_status__in=[APPROVED, UNMODERATED]) \
+        .order_by('-version_no').values_list('language', 'title')
+    for language_pk, title in versions:
+        version_titles.setdefault(language_pk, title)
+
+    views = st_widget_view_statistic.get_views_for_many(pks)
+
+    for pk, video in videos.items():
+        video._original_subtitle = originals.get(pk)
+        views[pk]['total'] = video.widget_views_count
+        video._video_views_statistic = views[pk]
+
+        title = video._original_subtitle and \
+            version_titles.get(video._original_subtitle.pk)
+        if title and title.strip():
+            data[pk]['title'] = title
+        elif video.title and video.title.strip():
+            data[pk]['title'] = video.title
+        else:
+            data[pk]['title'] = video.title_display(truncate=False)
+
+    return data
+
+class VideoIndexQuerySet(LoadRelatedQuerySet):
+    """
+    Loads the VideoIndex data for each chunk of videos fetched, so building
+    the index doesn't take about ten queries per video.
+    """
+
+    def update_result_cache(self):
+        videos = [v for v in self._result_cache if not hasattr(v, '_index_data')]
+
+        if videos:
+            data = get_index_data(videos)
+            for v in videos:
+                v._index_data = data[v.pk]
+
 class VideoIndex(CelerySearchIndex):
     text = CharField(document=True, use_template=True)
     title = CharField(model_attr='title_display', boost=2)
@@ -103,20 +183,22 @@ class VideoIndex(CelerySearchIndex):
     def prepare(self, obj):
         self.prepared_data = super(VideoIndex, self).prepare(obj)
 
-        langs = obj.subtitlelanguage_set.exclude(language=u'', subtitle_count__gt=0)
-        self.prepared_data['languages_count'] = obj.subtitlelanguage_set.filter(
-                subtitle_count__gt=0, has_version=True).count()
+        data = getattr(obj, '_index_data', None)
+        if data is None:
+            data = get_index_data([obj])[obj.pk]
+
+        self.prepared_data['languages_count'] = data['languages_count']
         self.prepared_data['video_language'] = obj.language
         #TODO: converting should be in Field
         self.prepared_data['video_language'] = obj.language and LanguageField.prepare_lang(obj.language) or u''
-        self.prepared_data['languages'] = [LanguageField.prepare_lang(lang.language) for lang in langs if lang.subtitle_count]
-        self.prepared_data['contributors_count'] = User.objects.filter(subtitleversion__language__video=obj).distinct().count()
-        self.prepared_data['activity_count'] = obj.action_set.count()
+        self.prepared_data['languages'] = [LanguageField.prepare_lang(lang) for lang in data['languages']]
+        self.prepared_data['contributors_count'] = data['contributors_count']
+        self.prepared_data['activity_count'] = data['activity_count']
         self.prepared_data['week_views'] = obj.views['week']
         self.prepared_data['month_views'] = obj.views['month']
         self.prepared_data['year_views'] = obj.views['year']
         self.prepared_data['today_views'] = obj.views['today']
-        self.prepared_data['title'] = obj.title_display(truncate=False).strip()
+        self.prepared_data['title'] = data['title'].strip()
         self.prepared_data['is_public'] = obj.is_public
 
         return self.prepared_data
@@ -129,7 +211,7 @@ class VideoIndex(CelerySearchIndex):
         pass
 
     def index_queryset(self):
-        return self.model.objects.order_by('-id')
+        return VideoIndexQuerySet(self.model).order_by('-id')
 
     @classmethod
     def public(self):
@@ -33,13 +33,16 @@ from haystack import site
 from raven.contrib.django.models import client
 
 from messages.models import Message
-from utils import send_templated_email, DEFAULT_PROTOCOL
+from utils import send_templated_email, send_templated_emails, DEFAULT_PROTOCOL
 from utils.metrics import Gauge, Meter
 from videos.models import VideoFeed, SubtitleLanguage, Video, Subtitle, SubtitleVersion
-from videos.feed_parser import FeedParser
+from videos.feed_parser.fetcher import fetch_feeds
 
 celery_logger = logging.getLogger('celery.task')
 
+# feeds downloaded together by one update_video_feeds task
+FEED_UPDATE_CHUNK_SIZE = 100
+
 
 def process_failure_signal(exception, traceback, sender, task_id,
                            signal, args, kwargs, einfo, **kw):
@@ -78,6 +81,11 @@ def cleanup():
     TaskState.objects.filter(tstamp__lt=d).delete()
     transaction.commit_unless_managed()
 
+def _save_thumbnail_in_s3(video):
+    if video.thumbnail and not video.s3_thumbnail:
+        content = ContentFile(urlopen(video.thumbnail).read())
+        video.s3_thumbnail.save(video.thumbnail.split('/')[-1], content)
+
 @task
 def save_thumbnail_in_s3(video_id):
     try:
@@ -85,14 +93,36 @@ def save_thumbnail_in_s3(video_id):
     except Video.DoesNotExist:
         return
 
-    if video.thumbnail and not video.s3_thumbnail:
-        content = ContentFile(urlopen(video.thumbnail).read())
-        video.s3_thumbnail.save(video.thumbnail.split('/')[-1], content)
+    _save_thumbnail_in_s3(video)
+
+@task
+def save_thumbnails_in_s3(video_ids):
+    for video in Video.objects.filter(pk__in=video_ids):
+        try:
+            _save_thumbnail_in_s3(video)
+        except Exception, e:
+            celery_logger.warning('Could not save the thumbnail of video %s: %s'
+                                  % (video.pk, e))
 
 @periodic_task(run_every=crontab(minute=0, hour=1))
 def update_from_feed(*args, **kwargs):
-    for feed in VideoFeed.objects.all():
-        update_video_feed.delay(feed.pk)
+    pks = list(VideoFeed.objects.values_list('pk', flat=True))
+    for offset in xrange(0, len(pks), FEED_UPDATE_CHUNK_SIZE):
+        update_video_feeds.delay(pks[offset:offset + FEED_UPDATE_CHUNK_SIZE])
+
+@task
+def update_video_feeds(video_feed_ids):
+    """Update the feeds, downloading them concurrently.
+
+    Feeds that didn't change since the last update only cost a 304.
+    """
+    feeds = VideoFeed.objects.in_bulk(video_feed_ids)
+    for fetch in fetch_feeds([feed.fetch_job() for feed in feeds.values()]):
+        if fetch.error is not None:
+            celery_logger.warning('Could not fetch feed %s: %s' % (
+                fetch.url, fetch.error))
+            continue
+        feeds[fetch.key].update(fetch.feed_parser)
 
 @task
 def update_subtitles_fetched_counter_for_sl(sl_pk):
@@ -140,7 +170,7 @@ def video_changed_tasks(video_pk, new_version_id=None):
     from videos import metadata_manager
     from videos.models import Video
     from teams.models import TeamVideo
-    metadata_manager.update_metadata(video_pk)
+    metadata_manager.update_metadata(video_pk, new_version_id)
     if new_version_id is not None:
         _send_notification(new_version_id)
         _check_alarm(new_version_id)
@@ -201,15 +231,21 @@ def import_videos_from_feeds(urls, user_id=None):
     videos = []
     last_entry = dict()
 
-    for url in urls:
-        feed_parser = FeedParser(url)
+    for fetch in fetch_feeds([(url, url, None, None) for url in urls]):
+        if fetch.error is not None:
+            celery_logger.warning('Could not fetch feed %s: %s' % (
+                fetch.url, fetch.error))
+            continue
+        feed_parser = fetch.feed_parser
 
+        vts = []
         for vt, info, entry in feed_parser.items():
             if not vt: continue
-            videos.append(Video.get_or_create_for_url(vt=vt, user=user))
+            vts.append(vt)
             last_entry = entry
-        else:
-            _save_video_feed(url, last_entry.get('link', ''), user)
+        videos.extend(Video.get_or_create_for_urls(vts=vts, user=user))
+        _save_video_feed(fetch.url, last_entry.get('link', ''), user,
+                         feed_parser)
 
     if user:
         notifier.videos_imported_message.delay(user_id, len(videos))
@@ -276,23 +312,24 @@ def _send_letter_translation_start(translation_version):
     domain = Site.objects.get_current().domain
     video = translation_version.language.video
     language = translation_version.language
-    for user in video.notification_list(translation_version.user):
-        context = {
-            'version': translation_version,
-            'domain': domain,
-            'video_url': '%s://%s%s' % (DEFAULT_PROTOCOL, domain, video.get_absolute_url()),
-            'user': user,
-            'language': language,
-            'video': video,
-            'hash': user.hash_for_video(video.video_id),
-            "STATIC_URL": settings.STATIC_URL,
-        }
-        subject = 'New %s translation by %s of "%s"' % \
-            (language.language_display(), translation_version.user.__unicode__(), video.__unicode__())
-        Meter('templated-emails-sent-by-type.videos.new-translation-started').inc()
-        send_templated_email(user, subject,
-                             'videos/email_start_notification.html',
-                             context, fail_silently=not settings.DEBUG)
+    context = {
+        'version': translation_version,
+        'domain': domain,
+        'video_url': '%s://%s%s' % (DEFAULT_PROTOCOL, domain, video.get_absolute_url()),
+        'language': language,
+        'video': video,
+        "STATIC_URL": settings.STATIC_URL,
+    }
+    subject = 'New %s translation by %s of "%s"' % \
+        (language.language_display(), translation_version.user.__unicode__(), video.__unicode__())
+    recipients = [(user, {
+        'user': user,
+        'hash': user.hash_for_video(video.video_id),
+    }) for user in video.notification_list(translation_version.user)]
+    Meter('templated-emails-sent-by-type.videos.new-translation-started').inc(len(recipients))
+    send_templated_emails(recipients, subject,
+                          'videos/email_start_notification.html',
+                          context, fail_silently=not settings.DEBUG)
 
 def _make_caption_data(new_version, old_version):
     second_captions = dict([(item.subtitle_id, item) for item in old_version.ordered_subtitles()])
@@ -383,32 +420,39 @@ def _send_letter_caption(caption_version):
     followers = set(video.notification_list(caption_version.user))
     followers.update(language.notification_list(caption_version.user))
 
+    editors = []
+    messages = []
     for item in qs:
         if item.user and item.user in followers:
             if item.user.notify_by_email:
-                context['your_version'] = item
-                context['user'] = item.user
-                context['hash'] = item.user.hash_for_video(context['video'].video_id)
-                context['user_is_rtl'] = item.user.guess_is_rtl()
-                Meter('templated-emails-sent-by-type.videos.new-edits').inc()
-                send_templated_email(item.user, subject,
-                                 'videos/email_notification.html',
-                                 context, fail_silently=not settings.DEBUG)
+                editors.append((item.user, {
+                    'your_version': item,
+                    'user': item.user,
+                    'hash': item.user.hash_for_video(context['video'].video_id),
+                    'user_is_rtl': item.user.guess_is_rtl(),
+                }))
             if item.user.notify_by_message:
                 # TODO: Add body
-                Message.objects.create(user=item.user, subject=subject,
-                        content='')
+                messages.append(Message(user=item.user, subject=subject,
+                                        content=''))
 
             followers.discard(item.user)
+    Message.objects.create_many(messages)
 
-    for user in followers:
-        context['user'] = user
-        context['hash'] = user.hash_for_video(context['video'].video_id)
-        context['user_is_rtl'] = user.guess_is_rtl()
-        Meter('templated-emails-sent-by-type.videos.new-edits-non-editors').inc()
-        send_templated_email(user, subject,
-                             'videos/email_notification_non_editors.html',
-                             context, fail_silently=not settings.DEBUG)
+    Meter('templated-emails-sent-by-type.videos.new-edits').inc(len(editors))
+    send_templated_emails(editors, subject,
+                          'videos/email_notification.html',
+                          context, fail_silently=not settings.DEBUG)
+
+    non_editors = [(user, {
+        'user': user,
+        'hash': user.hash_for_video(context['video'].video_id),
+        'user_is_rtl': user.guess_is_rtl(),
+    }) for user in followers]
+    Meter('templated-emails-sent-by-type.videos.new-edits-non-editors').inc(len(non_editors))
+    send_templated_emails(non_editors, subject,
+                          'videos/email_notification_non_editors.html',
+                          context, fail_silently=not settings.DEBUG)
 
 
 
@@ -474,7 +518,7 @@ def delete_captions_in_original_service_by_code(language_code, video_pk):
     ThirdPartyAccount.objects.mirror_on_third_party(
         video, language_code, DELETE_LANGUAGE_ACTION)
 
-def _save_video_feed(feed_url, last_entry_url, user):
+def _save_video_feed(feed_url, last_entry_url, user, feed_parser=None):
     """ Creates or updates a videofeed given some url """
     try:
         vf = VideoFeed.objects.get(url=feed_url)
@@ -483,6 +527,9 @@ def _save_video_feed(feed_url, last_entry_url, user):
 
     vf.user = user
     vf.last_link = last_entry_url
+    if feed_parser is not None:
+        vf.etag = feed_parser.etag
+        vf.last_modified = feed_parser.modified
     vf.save()
 
 
@@ -53,7 +53,7 @@ def complete_indicator(language, mode='normal'):
             else:
                 return "??"
         v = language.version()
-        count = v and v.subtitle_set.count() or 0
+        count = v and len(v.get_subtitles()) or 0
         return ungettext('%(count)s Line', '%(count)s Lines', count) % {'count': count}
     return '%i%%' % language.percent_done
 
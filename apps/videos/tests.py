@@ -16,11 +16,13 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program. If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
+import BaseHTTPServer
 import codecs
 import feedparser
 import json
 import os
 import re
+import threading
 from datetime import datetime
 from StringIO import StringIO
 
@@ -42,9 +44,10 @@ from testhelpers.views import _create_videos
 from utils.subtitles import (
     SrtSubtitleParser, YoutubeSubtitleParser, TxtSubtitleParser, DfxpSubtitleParser
 )
-from videos import metadata_manager, alarms, EffectiveSubtitle
+from videos import metadata_manager, alarms, EffectiveSubtitle, EffectiveSubtitles
 from utils.unisubsmarkup import html_to_markup, markup_to_html
 from videos.feed_parser import FeedParser
+from videos.feed_parser.fetcher import fetch_feeds
 from videos.forms import VideoForm
 from videos.models import (
     Video, Action, VIDEO_TYPE_YOUTUBE, UserTestResult, SubtitleLanguage,
@@ -365,6 +368,27 @@ class SubtitleParserTest(TestCase):
             result[3], 78.36, 81.5,
             u'When I say what\'s the relation,\nis it greater than or is')
 
+    def test_parse_once(self):
+        parser = SrtSubtitleParser(SRT_TEXT)
+        calls = []
+        result_iter = parser._result_iter
+
+        def counting_result_iter():
+            calls.append(1)
+            return result_iter()
+        parser._result_iter = counting_result_iter
+
+        self.assertTrue(parser)
+        self.assertEqual(len(parser), 5)
+        result = list(parser)
+        self.assertEqual(result, list(parser))
+        self._assert_sub(parser[1], 1.5, 4.5, result[1]['subtitle_text'])
+        self.assertEqual(len(calls), 1)
+
+        # changing returned items doesn't change the parsed cues
+        result[0]['subtitle_text'] = u'changed'
+        self.assertNotEqual(parser[0]['subtitle_text'], u'changed')
+
     def test_youtube(self):
         path = os.path.join(os.path.dirname(__file__), 'fixtures/youtube_subs_response.json')
         parser = YoutubeSubtitleParser(open(path).read())
@@ -406,6 +430,70 @@ class SubtitleParserTest(TestCase):
 
        
 
+class EffectiveSubtitlesTest(TestCase):
+    def _subtitles(self):
+        subtitles = EffectiveSubtitles()
+        subtitles.append('a', u'first', 1.5, 2.5, 2.0, 10, True)
+        subtitles.append('b', u'\xe9', None, None, None, None)
+        subtitles.append('c', u'third', 3, 4, 1.0, 12)
+        return subtitles
+
+    def test_rows(self):
+        subtitles = self._subtitles()
+        self.assertEqual(len(subtitles), 3)
+        self.assertEqual(subtitles[0].as_dict(),
+                         EffectiveSubtitle('a', u'first', 1.5, 2.5, 2.0, 10, True).as_dict())
+        self.assertFalse(subtitles[1].has_start_time)
+        self.assertEqual(subtitles[1].sub_order, None)
+        self.assertEqual(subtitles[1].pk, None)
+        self.assertEqual(subtitles[-1].subtitle_id, 'c')
+        self.assertEqual([s.subtitle_id for s in subtitles[1:]], ['b', 'c'])
+        self.assertRaises(IndexError, lambda: subtitles[3])
+
+        self.assertEqual(subtitles.as_dicts()[0],
+                         dict(subtitles[0].as_dict(), pk=10))
+        self.assertEqual(subtitles.for_generator(),
+                         [s.for_generator() for s in subtitles])
+
+    def test_sort_and_pickle(self):
+        import pickle
+        subtitles = self._subtitles()
+        subtitles.sort(key=lambda item: item.sub_order)
+        self.assertEqual([s.subtitle_id for s in subtitles], ['b', 'c', 'a'])
+
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(subtitles, protocol))
+            self.assertEqual(loaded.as_dicts(), subtitles.as_dicts())
+        self.assertEqual(EffectiveSubtitles.from_dicts(subtitles.as_dicts()).as_dicts(),
+                         subtitles.as_dicts())
+
+class SubtitleDiffTest(TestCase):
+    def test_diff(self):
+        from videos.diff import SubtitleDiff
+        old = EffectiveSubtitles()
+        old.append('a', u'one', 1, 2, 1, None)
+        old.append('b', u'two', 2, 3, 2, None)
+        old.append('c', u'three', 3, 4, 3, None)
+        new = EffectiveSubtitles()
+        new.append('a', u'one', 1, 2, 1, None)
+        new.append('b', u'two!', 2, 3.5, 2, None)
+        new.append('d', u'four', 4, 5, 3, None)
+
+        diff = SubtitleDiff(old, new)
+        self.assertEqual([(row[0] and row[0].subtitle_id,
+                           row[1] and row[1].subtitle_id) for row in diff.rows],
+                         [('a', 'a'), ('b', 'b'), ('c', None), (None, 'd')])
+        self.assertEqual(diff.rows[1][2],
+                         {'text': True, 'time': False, 'end_time': True})
+        self.assertEqual(diff.text_changed, 3)
+        self.assertEqual(diff.time_changed, 3)
+        self.assertEqual(diff.text_change, 1)
+
+        diff = SubtitleDiff(old, old)
+        self.assertEqual((diff.text_change, diff.time_change), (0, 0))
+        diff = SubtitleDiff(old, EffectiveSubtitles())
+        self.assertEqual((diff.text_change, diff.time_change), (1, 1))
+
 class WebUseTest(TestCase):
     def _make_objects(self, video_id="S7HMxzLmS9gw"):
         self.auth = dict(username='admin', password='admin')
@@ -766,6 +854,33 @@ class VideoTest(TestCase):
         self.failIf(created)
         self.failUnlessEqual(video, more_video)
 
+    def test_get_or_create_for_urls(self):
+        existing, created = Video.get_or_create_for_url(
+            'http://example.com/existing.mp4')
+        urls = ['http://example.com/first.ogv',
+                'http://example.com/blog/not-a-video.html',
+                'http://example.com/existing.mp4',
+                'http://example.com/first.ogv',
+                'http://example.com/second.mp3']
+
+        results = Video.get_or_create_for_urls(urls, user=self.user)
+
+        self.assertEqual(len(results), len(urls))
+        self.assertTrue(results[0][1])
+        self.assertEqual(results[1], (None, False))
+        self.assertEqual(results[2], (existing, False))
+        self.assertEqual(results[3], (results[0][0], False))
+        self.assertTrue(results[4][1])
+        for video_url, (video, created) in zip(urls, results):
+            if video:
+                self.assertEqual(VideoUrl.objects.get(url=video_url).video,
+                                 video)
+
+        again = Video.get_or_create_for_urls(urls)
+        self.assertEqual([video for video, created in again],
+                         [video for video, created in results])
+        self.assertFalse([created for video, created in again if created])
+
     def test_video_cache_busted_on_delete(self):
         start_url = 'http://videos.mozilla.org/firefox/3.5/switch/switch.ogv'
         video, created = Video.get_or_create_for_url(start_url)
@@ -1353,6 +1468,45 @@ class VideoTypeRegistrarTest(TestCase):
         self.assertRaises(VideoTypeError, video_type_registrar.video_type_for_url,
                           'http://youtube.com/v=100500')
 
+    def test_host_index(self):
+        self.assertEqual(
+            video_type_registrar.candidates('http://www.youtube.com/watch?v=x'),
+            [t for t in video_type_registrar.values()
+             if t is YoutubeVideoType or not t.hosts])
+        self.assertFalse(VimeoVideoType in video_type_registrar.candidates(
+            'http://example.com/video.mp4'))
+        self.assertTrue(VimeoVideoType in video_type_registrar.candidates(
+            'http://player.vimeo.com/15786066'))
+
+        for url, video_type in (
+                ('http://vimeo.com/15786066', VimeoVideoType),
+                ('http://bcove.me/7fa5828z', BrightcoveVideoType),
+                ('http://example.com/video.mp4', HtmlFiveVideoType),
+                ('http://example.com/video.flv', FLVVideoType),
+                ('http://example.com/post.html', None)):
+            self.assertEqual(
+                video_type_registrar.video_type_class_for_url(url), video_type)
+            # the second lookup comes from the cache
+            self.assertEqual(
+                video_type_registrar.video_type_class_for_url(url), video_type)
+
+    def test_remote_match_failures_not_cached(self):
+        url = 'http://www.dailymotion.com/video/xuncached_test-video'
+        get_metadata = DailymotionVideoType.__dict__['get_metadata']
+        try:
+            # the request to dailymotion fails, then works
+            DailymotionVideoType.get_metadata = classmethod(
+                lambda cls, video_id: {})
+            self.assertEqual(
+                video_type_registrar.video_type_class_for_url(url), None)
+            DailymotionVideoType.get_metadata = classmethod(
+                lambda cls, video_id: {'url': 'http://example.com/x.flv'})
+            self.assertEqual(
+                video_type_registrar.video_type_class_for_url(url),
+                DailymotionVideoType)
+        finally:
+            DailymotionVideoType.get_metadata = get_metadata
+
 
 class TestFeedsSubmit(TestCase):
     def setUp(self):
@@ -2156,6 +2310,74 @@ class TestFeedParser(TestCase):
         video, created = Video.get_or_create_for_url(vt=vt)
         self.assertTrue(video)
 
+FIXTURE_FEED_ETAG = '"fixture-feed-v1"'
+FIXTURE_FEED = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0">
+  <channel>
+    <title>Fixture feed</title>
+    <link>http://example.com/</link>
+    <description>Fixture feed</description>
+    <item><title>Second</title><link>http://example.com/posts/2.html</link></item>
+    <item><title>First</title><link>http://example.com/posts/1.html</link></item>
+  </channel>
+</rss>"""
+
+class FixtureFeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves FIXTURE_FEED on every path, honouring If-None-Match."""
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == FIXTURE_FEED_ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('ETag', FIXTURE_FEED_ETAG)
+        self.end_headers()
+        self.wfile.write(FIXTURE_FEED)
+
+    def log_message(self, *args):
+        pass
+
+class TestFeedFetcher(TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                FixtureFeedHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base_url = 'http://127.0.0.1:%s' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_feeds(self):
+        urls = ['%s/feeds/%s' % (self.base_url, i) for i in xrange(6)]
+        fetched = list(fetch_feeds([(url, url, None, None) for url in urls],
+                                   threads=3, per_host=2))
+        self.assertEqual(sorted(f.key for f in fetched), sorted(urls))
+        for fetch in fetched:
+            self.assertEqual(fetch.error, None)
+            self.assertFalse(fetch.not_modified)
+            self.assertEqual(fetch.feed_parser.etag, FIXTURE_FEED_ETAG)
+            self.assertEqual(len(fetch.feed_parser.feed.entries), 2)
+
+        fetched = list(fetch_feeds([(url, url, FIXTURE_FEED_ETAG, None)
+                                    for url in urls]))
+        self.assertEqual(len(fetched), len(urls))
+        self.assertTrue(all(f.not_modified for f in fetched))
+
+    def test_video_feed_update(self):
+        feed = VideoFeed.objects.create(url=self.base_url + '/feed')
+        self.assertEqual(feed.update(), 2)
+
+        feed = VideoFeed.objects.get(pk=feed.pk)
+        self.assertEqual(feed.etag, FIXTURE_FEED_ETAG)
+        self.assertEqual(feed.last_link, 'http://example.com/posts/2.html')
+        # unchanged, the server answers 304
+        self.assertEqual(feed.update(), 0)
+
 class TestTemplateTags(TestCase):
     def setUp(self):
         from django.conf import settings
@@ -2233,6 +2455,58 @@ class TestMetadataManager(TestCase):
         self.assertEqual(len(v1.subtitles()), 3)
         self.assertEqual(lang.subtitle_count, 1)
 
+    def test_incremental_update(self):
+        v = Video.objects.all()[0]
+        en = SubtitleLanguage(language='en', video=v, is_forked=True)
+        en.save()
+        fr = SubtitleLanguage(language='fr', video=v, is_forked=True)
+        fr.save()
+        create_version(fr)
+        metadata_manager.update_metadata(v.pk)
+        fr = refresh_obj(fr)
+        fr_created = fr.created
+
+        version = create_version(en)
+        metadata_manager.update_metadata(v.pk, version.pk)
+        en = refresh_obj(en)
+        self.assertEqual(en.subtitle_count, 5)
+        self.assertTrue(en.had_version)
+        # untouched languages keep their stored values
+        self.assertEqual(refresh_obj(fr).created, fr_created)
+
+        video = refresh_obj(v)
+        self.assertEqual(video.languages_count,
+                         video.subtitlelanguage_set.filter(
+                             had_version=True, has_version=True).count())
+
+    def test_forked_waiting_moderation(self):
+        from apps.teams.moderation_const import WAITING_MODERATION
+        v = Video.objects.all()[0]
+        team = Team.objects.create(name='moderated', slug='moderated',
+                                   workflow_enabled=True)
+        Workflow.objects.create(
+            team=team, approve_allowed=Workflow.APPROVE_IDS['Admin must approve'])
+        TeamVideo.objects.create(team=team, video=v,
+                                 added_by=User.objects.all()[0])
+        original = SubtitleLanguage(language='en', video=v, is_original=True)
+        original.save()
+        create_version(original)
+        lang = SubtitleLanguage(language='fr', video=v, is_forked=False,
+                                standard_language=original)
+        lang.save()
+        create_version(lang)
+        metadata_manager.update_metadata(v.pk)
+        self.assertFalse(refresh_obj(lang).is_forked)
+
+        # a forked version that isn't approved yet doesn't fork the language
+        lang = refresh_obj(lang)
+        version = create_version(lang)
+        version.is_forked = True
+        version.moderation_status = WAITING_MODERATION
+        version.save()
+        metadata_manager.update_metadata(v.pk, version.pk)
+        self.assertFalse(refresh_obj(lang).is_forked)
+
 def _create_trans( video, latest_version=None, lang_code=None, forked=False):
         translation = SubtitleLanguage()
         translation.video = video
@@ -2315,6 +2589,108 @@ class TestSubtitleMetadata(TestCase):
             "Version's approved_by metadata is not the correct User.")
 
 
+class TestBulkSubtitleSave(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.video = Video.objects.all()[:1].get()
+        self.language = self.video.subtitle_language()
+
+    def test_new_subtitle_ids(self):
+        from videos.models import new_subtitle_ids
+        taken = new_subtitle_ids(100)
+        self.assertEqual(len(set(taken)), 100)
+        ids = new_subtitle_ids(1000, taken)
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertFalse(set(ids) & set(taken))
+
+    def test_new_version(self):
+        from videos.models import SubtitleMetadata, START_OF_PARAGRAPH
+        items = [{
+            'subtitle_text': u'line <b>%s</b>' % i,
+            'start_time': i,
+            'end_time': i + 0.5,
+        } for i in xrange(600)]
+        items[3]['metadata'] = {START_OF_PARAGRAPH: 'true'}
+        # invalid times are normalized, as in Subtitle.save
+        items[4]['start_time'] = -1
+
+        version = SubtitleVersion.objects.new_version(
+            items, self.language, None)
+
+        subtitles = list(version.subtitle_set.all())
+        self.assertEqual(len(subtitles), 600)
+        self.assertEqual(len(set(s.subtitle_id for s in subtitles)), 600)
+        self.assertEqual([s.subtitle_order for s in subtitles],
+                         range(1, 601))
+        self.assertEqual(subtitles[0].subtitle_text, u'line **0**')
+        self.assertEqual(subtitles[4].start_time, None)
+        self.assertEqual(subtitles[4].end_time, 4.5)
+
+        metadata = SubtitleMetadata.objects.filter(subtitle__version=version)
+        self.assertEqual(len(metadata), 1)
+        self.assertEqual(metadata[0].subtitle, subtitles[3])
+        self.assertEqual(metadata[0].key, START_OF_PARAGRAPH)
+
+    def test_new_version_translation_keeps_ids(self):
+        original = SubtitleVersion.objects.new_version(
+            [{'subtitle_text': u'a', 'start_time': 1, 'end_time': 2},
+             {'subtitle_text': u'b', 'start_time': 2, 'end_time': 3}],
+            self.language, None)
+        translation = SubtitleLanguage(
+            video=self.video, language='fr', is_original=False)
+        translation.save()
+
+        version = SubtitleVersion.objects.new_version(
+            [{'subtitle_text': u'x', 'start_time': 1, 'end_time': 2},
+             {'subtitle_text': u'y', 'start_time': 2, 'end_time': 3},
+             {'subtitle_text': u'z', 'start_time': 3, 'end_time': 4}],
+            translation, None, translated_from=original)
+
+        original_ids = [s.subtitle_id for s in
+                        original.subtitle_set.order_by('subtitle_order')]
+        ids = [s.subtitle_id for s in
+               version.subtitle_set.order_by('subtitle_order')]
+        self.assertEqual(ids[:2], original_ids)
+        self.assertFalse(ids[2] in original_ids)
+
+    def test_delta_versions(self):
+        old_chain = settings.SUBTITLE_VERSION_DELTA_CHAIN
+        settings.SUBTITLE_VERSION_DELTA_CHAIN = 2
+        try:
+            first = SubtitleVersion.objects.new_version([{
+                'subtitle_text': u'line %s' % i,
+                'start_time': i,
+                'end_time': i + 0.5,
+            } for i in xrange(10)], self.language, None)
+
+            second = SubtitleVersion(
+                language=self.language, version_no=first.version_no + 1,
+                datetime_started=datetime.now())
+            second.save()
+            subtitles = [s.duplicate_for() for s in first.get_subtitles()]
+            subtitles[2].subtitle_text = u'changed'
+            del subtitles[5]
+            Subtitle.objects.bulk_save(second, subtitles)
+
+            second = SubtitleVersion.objects.get(pk=second.pk)
+            self.assertEqual(second.delta_parent, first)
+            self.assertEqual(second.delta_depth, 1)
+            # the changed cue and the deleted one
+            self.assertEqual(second.subtitle_set.count(), 2)
+            texts = [s.subtitle_text for s in subtitles]
+            self.assertEqual([s.text for s in second.subtitles()], texts)
+
+            # deleting the parent makes the child a full version again
+            first.delete()
+            second = SubtitleVersion.objects.get(pk=second.pk)
+            self.assertEqual(second.delta_parent, None)
+            self.assertEqual(second.subtitle_set.count(), 9)
+            self.assertEqual([s.text for s in second.subtitles()], texts)
+        finally:
+            settings.SUBTITLE_VERSION_DELTA_CHAIN = old_chain
+
+
 def create_langs_and_versions(video, langs, user=None):
     versions = []
     for lang in langs:
@@ -2508,6 +2884,125 @@ class MarkupHtmlTest(TestCase):
             "there **bold text** there",
             html_to_markup(t)
         )
+
+    def test_matches_regex_conversion(self):
+        from utils import unisubsmarkup as m
+
+        def regex_markup_to_html(text, strip_tags=True):
+            for regex, tag in ((m.BOLD_MARKER_START_RE, "<b>"),
+                               (m.BOLD_MARKER_END_RE, "</b>"),
+                               (m.ITALIC_MARKER_START_RE, "<i>"),
+                               (m.ITALIC_MARKER_END_RE, "</i>"),
+                               (m.UNDERLINE_MARKER_START_RE, "<u>"),
+                               (m.UNDERLINE_MARKER_END_RE, "</u>")):
+                text = regex.sub(tag, text)
+            return m._strip_tags(text) if strip_tags else text
+
+        def regex_html_to_markup(text):
+            text = m._strip_tags(text)
+            text = m.BOLD_TAG_RE.sub("**", text)
+            text = m.ITALIC_TAG_RE.sub("*", text)
+            return m.UNDERLINE_TAG_RE.sub("_", text)
+
+        samples = [u'', u' ', u'plain', u'  padded  ', u'**bold**',
+                   u'*italic*', u'_under_', u'***both***', u'** nope **',
+                   u'a*b', u'a**b**c*', u'__x__', u'_ x _', u'*_*_',
+                   u'***', u'****a', u'a *', u'\xe9**\xe9**', u'1 < 2 & 3',
+                   u'<b>a</b>', u'<b><i>a</i></b>', u'<i><b>a</i></b>',
+                   u'<B>a</B>', u'<script>a</script>', u'<b>a', u'a</u>',
+                   u'&amp;', u'a\r\nb', u'a\x01b', u'\xa0a\xa0',
+                   u'line *[inside brackets]*', u'**a** _b_ *c*']
+        for text in samples:
+            self.assertEqual(regex_markup_to_html(text),
+                             markup_to_html(text))
+            self.assertEqual(regex_markup_to_html(text, False),
+                             markup_to_html(text, False))
+            self.assertEqual(regex_html_to_markup(text),
+                             html_to_markup(text))
+
+class TestActionTimeline(TestCase):
+    fixtures = ['test.json']
+
+    def _read_all(self, read, obj):
+        seen, cursor = read(obj, limit=2)
+        self.assertEqual(len(seen), 2)
+        while cursor:
+            page, cursor = read(obj, before=cursor, limit=2)
+            seen.extend(page)
+        return seen
+
+    def test_pages(self):
+        from videos.models import ActionTimeline
+        video = Video.objects.filter(teamvideo__isnull=True)[:1].get()
+        user = User.objects.all()[:1].get()
+        actions = []
+        for i in xrange(5):
+            action = Action(video=video, user=user, action_type=Action.ADD_VIDEO,
+                            created=datetime(2012, 1, 1, 0, 0, i % 3))
+            action.save()
+            actions.append(action)
+        # newest first, ties by pk
+        actions.sort(key=lambda a: (a.created, a.pk), reverse=True)
+        expected = [a.pk for a in actions]
+
+        for read, obj in ((ActionTimeline.objects.for_video, video),
+                          (ActionTimeline.objects.for_user, user)):
+            seen = self._read_all(read, obj)
+            self.assertEqual([a.pk for a in seen if a.pk in expected], expected)
+
+    def _check_team(self, team):
+        from videos.models import ActionTimeline
+        for public_only in (True, False):
+            old = Action.objects.for_team(team, public_only=public_only)
+            expected = [pk for created, pk in sorted(
+                [(a.created, a.pk) for a in old], reverse=True)]
+            seen, cursor = ActionTimeline.objects.for_team(
+                team, public_only=public_only, limit=100)
+            self.assertEqual([a.pk for a in seen], expected)
+        return expected
+
+    def test_team_activity(self):
+        video = Video.objects.filter(teamvideo__isnull=True)[:1].get()
+        user = User.objects.all()[:1].get()
+        team = Team.objects.create(name='timeline', slug='timeline')
+        other_team = Team.objects.create(name='timeline 2', slug='timeline-2')
+        language = SubtitleLanguage.objects.create(
+            video=video, language='en', has_version=True)
+
+        def action(i, **kwargs):
+            action = Action(user=user, created=datetime(2012, 1, 1, 0, 0, i),
+                            **kwargs)
+            action.save()
+            return action.pk
+
+        added = action(0, video=video, action_type=Action.ADD_VIDEO)
+        version = action(1, video=video, language=language,
+                         action_type=Action.ADD_VERSION)
+        joined = action(2, team=team, action_type=Action.MEMBER_JOINED)
+
+        def check_team(team):
+            # the fixture's actions of the video are in both, skip them
+            return [pk for pk in self._check_team(team)
+                    if pk in (added, version, joined, later)]
+
+        later = None
+        self.assertEqual(check_team(team), [joined])
+
+        # the video's earlier actions follow it into the team
+        team_video = TeamVideo.objects.create(team=team, video=video,
+                                              added_by=user)
+        later = action(3, video=video, language=language,
+                       action_type=Action.ADD_VERSION)
+        self.assertEqual(check_team(team), [later, joined, version, added])
+
+        # and out of it, into the next one
+        team_video.move_to(other_team)
+        self.assertEqual(check_team(team), [joined])
+        self.assertEqual(check_team(other_team), [later, version, added])
+
+        team_video.delete()
+        self.assertEqual(check_team(other_team), [])
+
 class BaseDownloadTest(object):
 
     def _download_subs(self, language, format):
@@ -23,6 +23,12 @@ class VideoType(object):
 
     abbreviation = None
     name = None    
+    # domains (and their subdomains) of the URLs this type matches, see
+    # VideoTypeRegistrar.candidates.  None means any domain.
+    hosts = None
+    # whether matches_video_url asks the site, in which case a failed match
+    # may be a failed request and isn't cached
+    remote_match = False
     
     def __init__(self, url):
         self.url = url
@@ -59,6 +65,46 @@ class VideoType(object):
         parsed_url = urlparse(url)
         return '%s://%s%s' % (parsed_url.scheme or 'http', parsed_url.netloc, parsed_url.path)    
     
+VIDEO_TYPE_CACHE_SIZE = 1000
+
+_MISSING = object()
+
+class LRUCache(object):
+    """
+    A small mapping that drops the least recently used keys when it grows
+    past size (python 2.6 has no OrderedDict).
+    """
+    def __init__(self, size):
+        self.size = size
+        self._data = {}
+        self._tick = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._tick += 1
+        entry[1] = self._tick
+        return entry[0]
+
+    def set(self, key, value):
+        self._tick += 1
+        self._data[key] = [value, self._tick]
+        if len(self._data) > self.size:
+            # evict a tenth at a time, so sorting doesn't happen on every set
+            by_age = sorted(self._data.items(), key=lambda item: item[1][1])
+            for old_key, entry in by_age[:max(1, self.size // 10)]:
+                self._data.pop(old_key, None)
+
+    def clear(self):
+        self._data.clear()
+
 class VideoTypeRegistrar(dict):
     
     domains = []
@@ -66,17 +112,71 @@ class VideoTypeRegistrar(dict):
     def __init__(self, *args, **kwargs):
         super(VideoTypeRegistrar, self).__init__(*args, **kwargs)
         self.choices = []
+        self._by_host = {}
+        self._any_host = []
+        self._positions = {}
+        self._url_cache = LRUCache(VIDEO_TYPE_CACHE_SIZE)
         
     def register(self, video_type):
         self[video_type.abbreviation] = video_type
         self.choices.append((video_type.abbreviation, video_type.name))
         domain = getattr(video_type, 'site', None)
         domain and self.domains.append(domain)
-        
-    def video_type_for_url(self, url):
-        for video_type in self.itervalues():
+        self._build_index()
+
+    def _build_index(self):
+        self._by_host = {}
+        self._any_host = []
+        self._positions = {}
+        for position, video_type in enumerate(self.itervalues()):
+            self._positions[video_type] = position
+            if video_type.hosts:
+                for host in video_type.hosts:
+                    self._by_host.setdefault(host, []).append(video_type)
+            else:
+                self._any_host.append(video_type)
+        self._url_cache.clear()
+
+    def candidates(self, url):
+        """
+        Return the types that can match url: the ones registered for its
+        domain or a parent domain, and the ones without hosts.  They are in
+        the order of a plain lookup through all the types.
+        """
+        try:
+            hostname = urlparse(url).hostname or ''
+        except ValueError:
+            return self.values()
+        candidates = set(self._any_host)
+        parts = hostname.split('.')
+        for i in xrange(len(parts)):
+            candidates.update(self._by_host.get('.'.join(parts[i:]), ()))
+        return sorted(candidates, key=self._positions.get)
+
+    def video_type_class_for_url(self, url):
+        """Return the type matching url, without instantiating it."""
+        # the URL is the key as is: the types match case and whitespace
+        # sensitively, so normalising it could change the answer
+        # one get: a check first could see the key evicted by another thread
+        # before the read
+        video_type = self._url_cache.get(url, _MISSING)
+        if video_type is not _MISSING:
+            return video_type
+        candidates = self.candidates(url)
+        for video_type in candidates:
             if video_type.matches_video_url(url):
-                return video_type(url)
+                break
+        else:
+            video_type = None
+            if [t for t in candidates if t.remote_match]:
+                return None
+        self._url_cache.set(url, video_type)
+        return video_type
+
+    def video_type_for_url(self, url):
+        video_type = self.video_type_class_for_url(url)
+        if video_type:
+            return video_type(url)
             
 class VideoTypeError(Exception):
     pass
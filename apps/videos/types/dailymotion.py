@@ -30,6 +30,8 @@ class DailymotionVideoType(VideoType):
     abbreviation = 'D'
     name = 'dailymotion.com'
     site = 'dailymotion.com'
+    hosts = ('dailymotion.com',)
+    remote_match = True
 
     def __init__(self, url):
         self.url = url
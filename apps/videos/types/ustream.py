@@ -24,6 +24,7 @@ class UstreamVideoType(VideoType):
     abbreviation = 'U'
     name = 'Ustream.tv'   
     site = 'ustream.tv'
+    hosts = ('ustream.tv',)
     
     def __init__(self, url):
         self.url = url
@@ -24,6 +24,7 @@ class GoogleVideoType(VideoType):
     abbreviation = 'G'
     name = 'video.google.com'   
     site = 'video.google.com'
+    hosts = ('video.google.com',)
     
     def convert_to_video_url(self):
         return self.format_url(self.url)
@@ -30,6 +30,7 @@ class VimeoVideoType(VideoType):
     abbreviation = 'V'
     name = 'Vimeo.com'   
     site = 'vimeo.com'
+    hosts = ('vimeo.com',)
     
     def __init__(self, url):
         self.url = url
@@ -16,7 +16,6 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 import logging
-import random
 import re
 from datetime import datetime
 from urlparse import urlparse
@@ -79,7 +78,9 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     except Video.DoesNotExist:
         return
 
-    from videos.models import SubtitleLanguage, SubtitleVersion, Subtitle
+    from videos.models import (
+        SubtitleLanguage, SubtitleVersion, Subtitle, new_subtitle_ids
+    )
 
     url = u'http://www.youtube.com/api/timedtext?v=%s&lang=%s&name=%s'
     url = url % (youtube_id, yt_lc, urlquote(lang.get('name', u'')))
@@ -120,16 +121,22 @@ def save_subtitles_for_lang(lang, video_pk, youtube_id):
     version.is_forked = True
     version.save()
 
-    for i, item in enumerate(parser):
+    items = list(parser)
+    ids = new_subtitle_ids(len(items))
+    subtitles = []
+
+    for i, item in enumerate(items):
         subtitle = Subtitle()
         subtitle.subtitle_text = item['subtitle_text']
         subtitle.start_time = item['start_time']
         subtitle.end_time = item['end_time']
-        subtitle.version = version
-        subtitle.subtitle_id = int(random.random()*10e12)
+        subtitle.subtitle_id = ids[i]
         subtitle.subtitle_order = i+1
-        subtitle.save()
+        subtitle.normalize_timing()
         assert subtitle.start_time or subtitle.end_time, item['subtitle_text']
+        subtitles.append(subtitle)
+
+    Subtitle.objects.bulk_save(version, subtitles)
     version.finished = True
     version.save()
 
@@ -153,6 +160,7 @@ class YoutubeVideoType(VideoType):
     abbreviation = 'Y'
     name = 'Youtube'
     site = 'youtube.com'
+    hosts = ('youtube.com', 'youtu.be')
 
     # changing this will cause havock, let's talks about this first
     URL_TEMPLATE = 'http://www.youtube.com/watch?v=%s'
@@ -20,8 +20,7 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, Http404, HttpResponseRedirect, HttpResponseForbidden
 from django.shortcuts import render_to_response, get_object_or_404, redirect
 from django.template import RequestContext
-from django.views.generic.list_detail import object_list
-from videos.models import Video, Action, SubtitleLanguage, SubtitleVersion,  \
+from videos.models import Video, ActionTimeline, SubtitleLanguage, SubtitleVersion,  \
     VideoUrl, AlreadyEditingException, restrict_versions
 from videos.forms import VideoForm, FeedbackForm, EmailFriendForm, UserTestResultForm, \
     SubtitlesUploadForm, CreateVideoUrlForm, TranscriptionFileForm, \
@@ -38,6 +37,7 @@ from auth.models import CustomUser as User
 from utils import send_templated_email
 from django.contrib.auth import logout
 from videos.share_utils import _add_share_panel_context_for_video, _add_share_panel_context_for_history
+from videos.diff import diff_versions
 from gdata.service import RequestError
 from django.db.models import Sum
 from django.db import transaction
@@ -247,17 +247,19 @@ def _get_related_task(request):
 
 def actions_list(request, video_id):
     video = get_object_or_404(Video, video_id=video_id)
-    qs = Action.objects.for_video(video, request.user)
+    before = request.GET.get('before')
+    action_list, next_cursor = ActionTimeline.objects.for_video(
+        video, request.user, before=before)
 
-    extra_context = {
-        'video': video
+    context = {
+        'video': video,
+        'action_list': action_list,
+        'before': before,
+        'next_cursor': next_cursor,
     }
 
-    return object_list(request, queryset=qs, allow_empty=True,
-                       paginate_by=settings.ACTIVITIES_ONPAGE,
-                       template_name='videos/actions_list.html',
-                       template_object_name='action',
-                       extra_context=extra_context)
+    return render_to_response('videos/actions_list.html', context,
+                              context_instance=RequestContext(request))
 
 @login_required
 @transaction.commit_manually
@@ -513,43 +515,9 @@ def diffing(request, first_version, second_pk):
     if second_version.datetime_started > first_version.datetime_started:
         first_version, second_version = second_version, first_version
 
-    second_captions = dict([(item.subtitle_id, item) for item in second_version.ordered_subtitles()])
-    first_captions = dict([(item.subtitle_id, item) for item in first_version.ordered_subtitles()])
-
-    subtitles = {}
-
-    for id, item in first_captions.items():
-        if not id in subtitles:
-            subtitles[id] = item.start_time
-
-    for id, item in second_captions.items():
-        if not id in subtitles:
-            subtitles[id] = item.start_time
-
-    subtitles = [item for item in subtitles.items()]
-    subtitles.sort(key=lambda item: item[1])
-
-    captions = []
-    for subtitle_id, t in subtitles:
-        try:
-            scaption = second_captions[subtitle_id]
-        except KeyError:
-            scaption = None
-        try:
-            fcaption = first_captions[subtitle_id]
-        except KeyError:
-            fcaption = None
-
-        if fcaption is None or scaption is None:
-            changed = dict(text=True, time=True)
-        else:
-            changed = {
-                'text': (not fcaption.text == scaption.text),
-                'time': (not fcaption.start_time == scaption.start_time),
-                'end_time': (not fcaption.end_time == scaption.end_time)
-            }
-        data = [fcaption, scaption, changed]
-        captions.append(data)
+    # first_version is the newer one
+    diff = diff_versions(second_version, first_version)
+    captions = [[new, old, changed] for old, new, changed in diff.rows]
 
     context = widget.add_onsite_js_files({})
     context['video'] = video
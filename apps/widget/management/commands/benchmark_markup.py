@@ -0,0 +1,56 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from utils.unisubsmarkup import html_to_markup, markup_to_html
+
+
+def make_texts(count):
+    """Return count synthetic cue texts in unisubs markup."""
+    return [u'Cue number %d with **bold**\nand *italic* _text_' % i
+            for i in xrange(count)]
+
+class Command(BaseCommand):
+    help = u'Measures how fast cue markup is converted to and from html'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', '-c', dest='count', type="int",
+                    help='Number of cues', default=10000),
+        make_option('--repeat', '-r', dest='repeat', type="int",
+                    help='Runs per conversion', default=3),
+    )
+
+    def _run(self, name, convert, texts, repeat):
+        best = None
+        for i in xrange(repeat):
+            start_t = time.time()
+            result = [convert(text) for text in texts]
+            elapsed = time.time() - start_t
+            best = elapsed if best is None else min(best, elapsed)
+
+        print '%-15s %8d cues/s  %6.3fs' % (
+            name, len(texts) / max(best, 1e-6), best)
+        return result
+
+    def handle(self, count, repeat, *args, **kwargs):
+        texts = make_texts(count)
+        html = self._run('markup_to_html', markup_to_html, texts, repeat)
+        self._run('html_to_markup', html_to_markup, html, repeat)
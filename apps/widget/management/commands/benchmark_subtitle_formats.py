@@ -0,0 +1,59 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from widget.srt_subs import GenerateSubtitlesHandler
+
+
+def make_subtitles(count):
+    """Return count synthetic cues, in the format handlers expect."""
+    return [{
+        'id': i,
+        'start': i * 2.5,
+        'end': i * 2.5 + 2,
+        'text': u'Cue number %d with <b>bold</b>\nand <i>italic</i> text' % i,
+        'start_of_paragraph': False,
+    } for i in xrange(count)]
+
+class Command(BaseCommand):
+    help = u'Measures how fast each download format is written'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', '-c', dest='count', type="int",
+                    help='Number of cues', default=10000),
+        make_option('--repeat', '-r', dest='repeat', type="int",
+                    help='Runs per format', default=3),
+    )
+
+    def handle(self, count, repeat, *args, **kwargs):
+        subtitles = make_subtitles(count)
+
+        for file_type, handler in sorted(GenerateSubtitlesHandler.items()):
+            best = None
+            for i in xrange(repeat):
+                start_t = time.time()
+                size = sum(len(chunk) for chunk in
+                           handler(subtitles, None).stream())
+                elapsed = time.time() - start_t
+                best = elapsed if best is None else min(best, elapsed)
+
+            print '%-5s %8d cues/s  %6.3fs  %d bytes' % (
+                file_type, count / max(best, 1e-6), best, size)
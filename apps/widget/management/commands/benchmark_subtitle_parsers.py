@@ -0,0 +1,69 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2012 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from utils.subtitles import ParserList
+from widget.management.commands.benchmark_subtitle_formats import make_subtitles
+from widget.srt_subs import GenerateSubtitlesHandler
+
+
+def use_like_upload(parser):
+    """The accesses an upload makes: the form checks, is_version_same and
+    new_version."""
+    bool(parser)
+    len(parser)
+    list(parser)
+    len(parser)
+    list(parser)
+
+def reparse(parser_class, text):
+    """The same accesses, parsing the document each time as before."""
+    for i in xrange(4):
+        list(parser_class(text)._result_iter())
+
+class Command(BaseCommand):
+    help = u'Measures how fast uploaded subtitle files are parsed'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', '-c', dest='count', type="int",
+                    help='Number of cues', default=1000),
+        make_option('--repeat', '-r', dest='repeat', type="int",
+                    help='Runs per format', default=3),
+    )
+
+    def handle(self, count, repeat, *args, **kwargs):
+        subtitles = make_subtitles(count)
+
+        for file_type in ('srt', 'sbv', 'dfxp'):
+            text = unicode(GenerateSubtitlesHandler[file_type](subtitles, None))
+            parser_class = ParserList[file_type]
+
+            for name, run in (('re-parse', lambda: reparse(parser_class, text)),
+                              ('parse once', lambda: use_like_upload(parser_class(text)))):
+                best = None
+                for i in xrange(repeat):
+                    start_t = time.time()
+                    run()
+                    elapsed = time.time() - start_t
+                    best = elapsed if best is None else min(best, elapsed)
+
+                print '%-5s %-10s %8d cues/s  %6.3fs' % (
+                    file_type, name, count / max(best, 1e-6), best)
@@ -23,7 +23,8 @@ from django.db.models import Sum, Q
 from django.utils import translation
 from django.utils.translation import ugettext as _
 
-from statistic.tasks import st_widget_view_statistic_update
+from raven.contrib.django.models import client
+from statistic import st_widget_view_recorder
 from teams.models import Task, Workflow, Team
 from teams.moderation_const import APPROVED, UNMODERATED, WAITING_MODERATION
 from teams.permissions import (
@@ -95,10 +96,12 @@ class Rpc(BaseRpc):
 
 
     # Widget
-    def _check_visibility_policy_for_widget(self, request, video_id):
+    def _check_visibility_policy_for_widget(self, request, video_id,
+                                            visibility_policy=None):
         """Return an error if the user cannot see the widget, None otherwise."""
 
-        visibility_policy = video_cache.get_visibility_policies(video_id)
+        if visibility_policy is None:
+            visibility_policy = video_cache.get_visibility_policies(video_id)
 
         if not visibility_policy.get("is_public", True):
             team = Team.objects.get(id=visibility_policy['team_id'])
@@ -106,22 +109,21 @@ class Rpc(BaseRpc):
             if not team.is_member(request.user):
                 return {"error_msg": _("Video embedding disabled by owner")}
 
-    def _get_video_urls_for_widget(self, video_url, video_id):
-        """Return the video URLs, 'cleaned' video id, and error."""
+    def _get_widget_bundle(self, video_url, video_id, language_codes):
+        """Return the widget bundle, 'cleaned' video id, and error."""
 
         try:
-            video_urls = video_cache.get_video_urls(video_id)
+            bundle = video_cache.get_widget_bundle(video_id, language_codes)
         except models.Video.DoesNotExist:
             video_cache.invalidate_video_id(video_url)
 
             try:
                 video_id = video_cache.get_video_id(video_url)
+                bundle = video_cache.get_widget_bundle(video_id, language_codes)
             except Exception as e:
                 return None, None, {"error_msg": unicode(e)}
 
-            video_urls = video_cache.get_video_urls(video_id)
-
-        return video_urls, video_id, None
+        return bundle, video_id, None
 
     def _find_remote_autoplay_language(self, request):
         language = None
@@ -131,22 +133,44 @@ class Rpc(BaseRpc):
             language = request.user.preferred_language
         return language if language != '' else None
 
-    def _get_subtitles_for_widget(self, request, base_state, video_id, is_remote):
+    def _language_codes_for_widget(self, request, base_state, is_remote):
+        """Return the language codes _get_subtitles_for_widget will look up."""
+
+        # keeping both forms valid as backwards compatibility layer
+        lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
+
+        if base_state is not None and lang_code is not None:
+            if base_state.get('language_pk', None) is None:
+                return [lang_code]
+            return []
+        elif is_remote:
+            return [self._find_remote_autoplay_language(request)]
+        return []
+
+    def _get_subtitles_for_widget(self, request, base_state, video_id, is_remote,
+                                  language_pks=None):
         # keeping both forms valid as backwards compatibility layer
         lang_code = base_state and base_state.get("language_code", base_state.get("language", None))
+        if language_pks is None:
+            language_pks = {}
+
+        def pk_for_default_language(language_code):
+            if language_code in language_pks:
+                return language_pks[language_code]
+            return video_cache.pk_for_default_language(video_id, language_code)
 
         if base_state is not None and lang_code is not None:
             lang_pk = base_state.get('language_pk', None)
 
             if lang_pk is  None:
-                lang_pk = video_cache.pk_for_default_language(video_id, lang_code)
+                lang_pk = pk_for_default_language(lang_code)
 
             return self._autoplay_subtitles(request.user, video_id, lang_pk,
                                             base_state.get('revision', None))
         else:
             if is_remote:
                 autoplay_language = self._find_remote_autoplay_language(request)
-                language_pk = video_cache.pk_for_default_language(video_id, autoplay_language)
+                language_pk = pk_for_default_language(autoplay_language)
 
                 if autoplay_language is not None:
                     return self._autoplay_subtitles(request.user, video_id,
@@ -162,39 +186,45 @@ class Rpc(BaseRpc):
         if video_id is None:
             return None
 
-        error = self._check_visibility_policy_for_widget(request, video_id)
+        language_codes = self._language_codes_for_widget(request, base_state,
+                                                         is_remote)
+        bundle, video_id, error = self._get_widget_bundle(video_url, video_id,
+                                                          language_codes)
         if error:
             return error
 
-        video_urls, video_id, error = self._get_video_urls_for_widget(video_url, video_id)
+        error = self._check_visibility_policy_for_widget(
+            request, video_id, bundle['visibility_policies'])
         if error:
             return error
 
         resp = {
             'video_id' : video_id,
             'subtitles': None,
-            'video_urls': video_urls,
-            'is_moderated': video_cache.get_is_moderated(video_id),
+            'video_urls': bundle['video_urls'],
+            'is_moderated': bundle['is_moderated'],
         }
         if additional_video_urls is not None:
-            for url in additional_video_urls:
-                video_cache.associate_extra_url(url, video_id)
+            video_cache.associate_extra_urls(additional_video_urls, video_id)
 
         add_general_settings(request, resp)
 
         if request.user.is_authenticated():
             resp['username'] = request.user.username
 
-        resp['drop_down_contents'] = video_cache.get_video_languages(video_id)
+        resp['drop_down_contents'] = bundle['video_languages']
         resp['my_languages'] = get_user_languages_from_request(request)
-        resp['subtitles'] = self._get_subtitles_for_widget(request, base_state,
-                                                           video_id, is_remote)
+        resp['subtitles'] = self._get_subtitles_for_widget(
+            request, base_state, video_id, is_remote, bundle['language_pks'])
         return resp
 
 
     # Statistics
     def track_subtitle_play(self, request, video_id):
-        st_widget_view_statistic_update.delay(video_id=video_id)
+        try:
+            st_widget_view_recorder.record(video_id=video_id)
+        except:
+            client.captureException()
         return { 'response': 'ok' }
 
 
@@ -585,22 +615,24 @@ class Rpc(BaseRpc):
             if error:
                 return error
 
-    def _save_subtitles(self, subtitle_set, json_subs, forked):
-        """Create Subtitle objects into the given queryset from the JSON subtitles."""
+    def _save_subtitles(self, version, json_subs, forked):
+        """Create Subtitle objects for the given version from the JSON subtitles."""
 
+        subtitles = []
         for s in json_subs:
             if not forked:
-                subtitle_set.create(
+                subtitles.append(models.Subtitle(
                     subtitle_id=s['subtitle_id'],
-                    subtitle_text=s['text'])
+                    subtitle_text=s['text']))
             else:
-                subtitle_set.create(
+                subtitles.append(models.Subtitle(
                     subtitle_id=s['subtitle_id'],
                     subtitle_text=s['text'],
                     start_time=s['start_time'],
                     end_time=s['end_time'],
                     subtitle_order=s['sub_order'],
-                    start_of_paragraph=s.get('start_of_paragraph', False))
+                    start_of_paragraph=s.get('start_of_paragraph', False)))
+        models.Subtitle.objects.bulk_save(version, subtitles)
 
     def _copy_subtitles(self, source_version, dest_version):
         """Copy the Subtitle objects from one version to another, unchanged.
@@ -610,8 +642,8 @@ class Rpc(BaseRpc):
 
         """
         if source_version:
-            for s in source_version.subtitle_set.all():
-                s.duplicate_for(dest_version).save()
+            models.Subtitle.objects.bulk_save(dest_version, [
+                s.duplicate_for() for s in source_version.get_subtitles()])
 
     def _get_new_version_for_save(self, subtitles, language, session, user, forked, new_title, new_description, save_for_later=None):
         """Return a new subtitle version for this save, or None if not needed."""
@@ -644,7 +676,7 @@ class Rpc(BaseRpc):
 
             if subtitles_changed:
                 self._save_subtitles(
-                    new_version.subtitle_set, subtitles, new_version.is_forked)
+                    new_version, subtitles, new_version.is_forked)
             else:
                 self._copy_subtitles(previous_version, new_version)
 
@@ -1158,7 +1190,7 @@ class Rpc(BaseRpc):
         if latest_version is None or version_no >= latest_version.version_no:
             is_latest = True
         return self._make_subtitles_dict(
-            [s.__dict__ for s in version.subtitles()],
+            version.subtitles().as_dicts(),
             language.language,
             language.pk,
             language.is_original,
@@ -17,31 +17,31 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 """Functionality for generating srt files."""
 
-import xml.dom.minidom
 import StringIO
 from HTMLParser import HTMLParser
 
 def captions_and_translations_to_srt(captions_and_translations):
-    # TODO: note this loads the entire string into memory, which will not
-    # scale beautifully. In future, possibly stream directly to response.
-    output = StringIO.StringIO()
-    for i in range(len(captions_and_translations)):
-        translation_to_srt(captions_and_translations[i][1],
-                           captions_and_translations[i][0],
-                           i, output)
-    srt = output.getvalue()
-    output.close()
-    return srt
+    return ''.join(iter_captions_and_translations_to_srt(
+        captions_and_translations))
+
+def iter_captions_and_translations_to_srt(captions_and_translations):
+    """Yields the srt for each caption in turn, so it can be streamed."""
+    for i, (caption, translation) in enumerate(captions_and_translations):
+        output = StringIO.StringIO()
+        translation_to_srt(translation, caption, i, output)
+        yield output.getvalue()
+        output.close()
 
 def captions_to_srt(subtitles):
-    # TODO: note this loads the entire string into memory, which will not
-    # scale beautifully. In future, possibly stream directly to response.
-    output = StringIO.StringIO()
-    for i in range(len(subtitles)):
-        subtitle_to_srt(subtitles[i], i, output)
-    srt = output.getvalue()
-    output.close()
-    return srt
+    return ''.join(iter_captions_to_srt(subtitles))
+
+def iter_captions_to_srt(subtitles):
+    """Yields the srt for each caption in turn, so it can be streamed."""
+    for i, subtitle in enumerate(subtitles):
+        output = StringIO.StringIO()
+        subtitle_to_srt(subtitle, i, output)
+        yield output.getvalue()
+        output.close()
 
 def translation_to_srt(translation, video_caption, index, output):
     subtitle_to_srt_impl(video_caption.caption_text if translation is None \
@@ -85,6 +85,9 @@ def write_padded_num(num, numchars, output):
 from math import floor
 import codecs
 
+# characters per chunk yielded by BaseSubtitles.stream
+STREAM_CHUNK_SIZE = 16 * 1024
+
 class BaseSubtitles(object):
     file_type = ''
 
@@ -103,7 +106,42 @@ class BaseSubtitles(object):
             self.title = u""
 
     def __unicode__(self):
-        raise Exception('Should return subtitles')
+        return u''.join(self.generate())
+
+    def generate(self):
+        """
+        Yields the subtitles as unicode chunks, which joined together
+        make up the whole file.
+        """
+        raise Exception('Should yield subtitles')
+
+    def stream(self, encoding='utf-8', chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Yields the subtitles encoded, in chunks of roughly chunk_size
+        characters, so they can be written out (e.g. as an HttpResponse
+        iterator) without building the whole file in memory.
+        """
+        buf = []
+        size = 0
+        for chunk in self.generate():
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                yield u''.join(buf).encode(encoding)
+                buf = []
+                size = 0
+        if buf:
+            yield u''.join(buf).encode(encoding)
+
+    def _join_lines(self, lines):
+        """Like line_delimiter.join(lines), but yielding as it goes."""
+        lines = iter(lines)
+        for line in lines:
+            yield line
+            break
+        for line in lines:
+            yield self.line_delimiter
+            yield line
 
     @classmethod
     def isnumber(cls, val):
@@ -114,12 +152,7 @@ class BaseSubtitles(object):
         sl = sl or sv.language
         video = video or sl.video
 
-        subtitles = []
-
-        for item in sv.subtitles():
-            subtitles.append(item.for_generator())
-
-        return cls(subtitles, video, sl=sl)
+        return cls(sv.subtitles().for_generator(), video, sl=sl)
 
 class GenerateSubtitlesHandlerClass(dict):
 
@@ -130,14 +163,10 @@ GenerateSubtitlesHandler = GenerateSubtitlesHandlerClass()
 
 class MGSubtitles(BaseSubtitles):
 
-    def __unicode__(self):
-        output = []
-
+    def generate(self):
         for item in self.subtitles:
-            output.append(u'[[[%s]]]' % item['id'])
-            output.append(item['text'].replace(u'[[[', u'').replace(u']]]', u''))
-
-        return u''.join(output)
+            yield u'[[[%s]]]' % item['id']
+            yield item['text'].replace(u'[[[', u'').replace(u']]]', u'')
 
 GenerateSubtitlesHandler.register(MGSubtitles)
 
@@ -147,23 +176,22 @@ class SRTSubtitles(BaseSubtitles):
     def __init__(self, subtitles, video, line_delimiter=u'\r\n', sl=None):
         super(SRTSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
+    def generate(self):
+        return self._join_lines(self._lines())
 
+    def _lines(self):
         parser = HTMLParser()
         i = 1
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
-                output.append(unicode(i))
+                yield unicode(i)
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
-                output.append(u'%s --> %s' % (start, end))
-                output.append(parser.unescape(item['text']).strip())
-                output.append(u'')
+                yield u'%s --> %s' % (start, end)
+                yield parser.unescape(item['text']).strip()
+                yield u''
                 i += 1
 
-        return self.line_delimiter.join(output)
-
     def format_time(self, time):
         hours = int(floor(time / 3600))
         if hours < 0:
@@ -181,18 +209,17 @@ class SBVSubtitles(BaseSubtitles):
     def __init__(self, subtitles, video, line_delimiter=u'\r\n', sl=None):
         super(SBVSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
+    def generate(self):
+        return self._join_lines(self._lines())
 
+    def _lines(self):
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
-                output.append(u'%s,%s' % (start, end))
-                output.append(item['text'].strip())
-                output.append(u'')
-
-        return self.line_delimiter.join(output)
+                yield u'%s,%s' % (start, end)
+                yield item['text'].strip()
+                yield u''
 
     def format_time(self, time):
         hours = int(floor(time / 3600))
@@ -211,21 +238,22 @@ class TXTSubtitles(BaseSubtitles):
     def __init__(self, subtitles, video, line_delimiter=u'\r\n\r\n', sl=None):
         super(TXTSubtitles, self).__init__(subtitles, video, line_delimiter)
 
-    def __unicode__(self):
-        output = []
-        for item in self.subtitles:
-            item['text'] and output.append(item['text'].strip())
-
-        return self.line_delimiter.join(output)
+    def generate(self):
+        return self._join_lines(item['text'].strip()
+                                for item in self.subtitles if item['text'])
 
 GenerateSubtitlesHandler.register(TXTSubtitles)
 
 class SSASubtitles(BaseSubtitles):
     file_type = 'ssa'
 
-    def __unicode__(self):
+    def generate(self):
         #add BOM to fix python default behaviour, because players don't play without it
-        return u''.join([unicode(codecs.BOM_UTF8, "utf8"), self._start(), self._content(), self._end()])
+        yield unicode(codecs.BOM_UTF8, "utf8")
+        yield self._start()
+        for chunk in self._content():
+            yield chunk
+        yield self._end()
 
     def _start(self):
         ld = self.line_delimiter
@@ -248,25 +276,31 @@ class SSASubtitles(BaseSubtitles):
 
     def _content(self):
         dl = self.line_delimiter
-        output = []
-        output.append(u'[Events]%s' % dl)
-        output.append(u'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text%s' % dl)
+        yield u'[Events]%s' % dl
+        yield u'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text%s' % dl
         tpl = u'Dialogue: 0,%s,%s,Default,,0000,0000,0000,,%s%s'
         for item in self.subtitles:
             if self.isnumber(item['start']) and self.isnumber(item['end']):
                 start = self.format_time(item['start'])
                 end = self.format_time(item['end'])
                 text = self._clean_text(item['text'].strip())
-                output.append(tpl % (start, end, text, dl))
-        return ''.join(output)
+                yield tpl % (start, end, text, dl)
 
 GenerateSubtitlesHandler.register(SSASubtitles)
 
 from lxml import etree
-import lxml.html
 import re
 
+TTML_NAMESPACE = 'http://www.w3.org/ns/ttml'
+TTML_STYLING_NAMESPACE = 'http://www.w3.org/2006/10/ttaf1#styling'
+XML_ID = '{http://www.w3.org/XML/1998/namespace}id'
+
 class TTMLSubtitles(BaseSubtitles):
+    """
+    Writes TTML one <p> at a time: the header and footer are plain strings
+    and each cue is parsed and serialized on its own, so no document tree
+    is ever built for the whole file.
+    """
     file_type = 'xml'
     remove_re = re.compile(u'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]')
     STYLES = {
@@ -282,9 +316,12 @@ class TTMLSubtitles(BaseSubtitles):
         }
     }
 
-    def __unicode__(self):
-        node = self.xml_node()
-        return node.toprettyxml(newl="")
+    def generate(self):
+        yield self._header()
+        for item in self.subtitles:
+            if item['text'] and self.isnumber(item['start']) and self.isnumber(item['end']):
+                yield self._cue(item)
+        yield u'</div></body></tt>'
 
     def _get_attributes(self, item):
         attrib = {}
@@ -292,37 +329,37 @@ class TTMLSubtitles(BaseSubtitles):
         attrib['dur'] = self.format_time(item['end']-item['start'])
         return attrib
 
-    def xml_node(self):
-        xmlt = """<tt xml:lang="" xmlns="http://www.w3.org/ns/ttml"><head><metadata/><styling/><layout/></head><body region="subtitleArea"><div></div></body></tt>"""
-        dom = xml.dom.minidom.parseString(xmlt)
-	styling = dom.getElementsByTagName('head')[0].getElementsByTagName('styling')[0]
-        styling.setAttribute("xmlns:tts", "http://www.w3.org/2006/10/ttaf1#styling")
-
-        for style_name, style_def in TTMLSubtitles.STYLES.items():
-            style = dom.createElement('style')
-            style.setAttribute('xml:id', style_name)
-            for def_name, def_style in style_def.items():
-                style.setAttribute(def_name, def_style)
-            styling.appendChild(style)
-
-	div = dom.getElementsByTagName('tt')[0].getElementsByTagName('body')[0].getElementsByTagName('div')[0]
-        for item in self.subtitles:
-            if item['text'] and self.isnumber(item['start']) and self.isnumber(item['end']):
-                # as we're replacing new lines with <br>s we need to create
-                # the element from a fragment,and also from the formateed <b> and <i> to
-                # the correct span / style
-                content = item['text'].replace(u'\n', u'<br/>').strip()
-                content = content.replace(u"<b>", u'<span style="strong">').replace(u"</b>", u'</span>')
-                content = content.replace(u"<i>", u'<span style="emphasis">').replace(u"</i>", u'</span>')
-                content = content.replace(u"<u>", u'<span style="underlined">').replace(u"</u>", u'</span>')
-                node = xml.dom.minidom.parseString((u"<p>%s</p>" % content).encode('utf-8'))
-                child = node.documentElement
-
-                for k,v in self._get_attributes(item).items():
-                    child.setAttribute(k,v)
-                div.appendChild(child)
-
-        return dom
+    def _header(self):
+        styling = etree.Element('styling', nsmap={'tts': TTML_STYLING_NAMESPACE})
+        for style_name, style_def in sorted(self.STYLES.items()):
+            style = etree.SubElement(styling, 'style')
+            style.set(XML_ID, style_name)
+            for def_name, def_style in sorted(style_def.items()):
+                style.set(def_name, def_style)
+
+        return u''.join([
+            u'<?xml version="1.0" ?>',
+            u'<tt xml:lang="" xmlns="%s">' % TTML_NAMESPACE,
+            u'<head><metadata/>',
+            etree.tostring(styling, encoding=unicode),
+            u'<layout/></head>',
+            u'<body region="subtitleArea"><div>',
+        ])
+
+    def _cue(self, item):
+        # as we're replacing new lines with <br>s we need to create
+        # the element from a fragment,and also from the formateed <b> and <i> to
+        # the correct span / style
+        content = item['text'].replace(u'\n', u'<br/>').strip()
+        content = content.replace(u"<b>", u'<span style="strong">').replace(u"</b>", u'</span>')
+        content = content.replace(u"<i>", u'<span style="emphasis">').replace(u"</i>", u'</span>')
+        content = content.replace(u"<u>", u'<span style="underlined">').replace(u"</u>", u'</span>')
+        # the <p> is parsed without a namespace, so it is serialized without
+        # one and picks up the TTML default namespace from <tt>
+        p = etree.fromstring((u"<p>%s</p>" % content).encode('utf-8'))
+        for k, v in sorted(self._get_attributes(item).items()):
+            p.set(k, v)
+        return etree.tostring(p, encoding=unicode)
 
     def format_time(self, time):
         hours = int(floor(time / 3600))
@@ -1151,7 +1151,75 @@ class TestCache(TestCase):
         video_id = video_cache.get_video_id(url)
         video_cache.get_subtitles_dict(video_id, 0, 0, lambda x: x)
 
-from widget.srt_subs import TTMLSubtitles, SRTSubtitles, SBVSubtitles, TXTSubtitles, SSASubtitles
+    def test_widget_bundle_matches_single_lookups(self):
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video_id = video_cache.get_video_id(url)
+        video_cache.invalidate_cache(video_id)
+
+        # cold: filled from the database
+        bundle = video_cache.get_widget_bundle(video_id, ['en', None])
+        # warm: served by a single get_many
+        warm_bundle = video_cache.get_widget_bundle(video_id, ['en', None])
+        self.assertEquals(bundle, warm_bundle)
+
+        self.assertEquals(bundle['video_urls'],
+                          video_cache.get_video_urls(video_id))
+        self.assertEquals(bundle['is_moderated'],
+                          video_cache.get_is_moderated(video_id))
+        self.assertEquals(bundle['visibility_policies'],
+                          video_cache.get_visibility_policies(video_id))
+        self.assertEquals(bundle['video_languages'],
+                          video_cache.get_video_languages(video_id))
+        self.assertEquals(bundle['language_pks']['en'],
+                          video_cache.pk_for_default_language(video_id, 'en'))
+        self.assertEquals(bundle['language_pks'][None],
+                          video_cache.pk_for_default_language(video_id, None))
+
+    def test_invalidate_cache_bumps_version(self):
+        from django.db import connection
+
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video_id = video_cache.get_video_id(url)
+        video_cache.get_video_urls(video_id)
+        old_key = video_cache._video_urls_key(video_id)
+        self.assertTrue(video_cache.cache.get(old_key) is not None)
+
+        try:
+            settings.DEBUG = True
+            num = len(connection.queries)
+            video_cache.invalidate_cache(video_id)
+            self.assertEquals(num, len(connection.queries))
+        finally:
+            settings.DEBUG = False
+
+        self.assertNotEquals(old_key, video_cache._video_urls_key(video_id))
+        self.assertTrue(
+            video_cache.cache.get(video_cache._video_urls_key(video_id)) is None)
+        # the url -> video_id mapping survives
+        self.assertEquals(video_id, video_cache.get_video_id(url))
+
+    def test_invalidate_many(self):
+        url = "http://videos-cdn.mozilla.net/serv/mozhacks/demos/screencasts/londonproject/screencast.ogv"
+        video_id = video_cache.get_video_id(url)
+        video_cache.get_is_moderated(video_id)
+        video_cache.get_visibility_policies(video_id)
+        moderated_key = video_cache._video_is_moderated_key(video_id)
+        visibility_key = video_cache._video_visibility_policy_key(video_id)
+        self.assertTrue(video_cache.cache.get(moderated_key) is not None)
+        self.assertTrue(video_cache.cache.get(visibility_key) is not None)
+
+        video_cache.invalidate_video_moderation_many([video_id, "bad key"])
+        self.assertTrue(video_cache.cache.get(moderated_key) is None)
+        self.assertTrue(video_cache.cache.get(visibility_key) is not None)
+
+        video_cache.invalidate_video_visibility_many([video_id])
+        self.assertTrue(video_cache.cache.get(visibility_key) is None)
+
+    def test_widget_bundle_missing_video(self):
+        self.assertRaises(models.Video.DoesNotExist,
+                          video_cache.get_widget_bundle, "bad key")
+
+from widget.srt_subs import TTMLSubtitles, DFXPSubtitles, SRTSubtitles, SBVSubtitles, TXTSubtitles, SSASubtitles
 
 class TestSubtitlesGenerator(TestCase):
     fixtures = ['test_widget.json']
@@ -1182,6 +1250,34 @@ class TestSubtitlesGenerator(TestCase):
         self.assertTrue(unicode(h))
         self.assertIn(self.cyrillic_text , unicode(h))
 
+    def test_ttml_structure(self):
+        from lxml import etree
+        ns = '{http://www.w3.org/ns/ttml}'
+        subtitles = self.subtitles + [{
+            'start': 3,
+            'end': 4,
+            'text': u'one <b>bold</b>\nand <i>italic</i> &amp; <u>under</u>'
+        }]
+        root = etree.fromstring(
+            unicode(TTMLSubtitles(subtitles, self.video)).encode('utf-8'))
+        self.assertEquals(ns + 'tt', root.tag)
+        self.assertEquals(3, len(root.findall('.//%sstyle' % ns)))
+        # the empty cue is skipped
+        paragraphs = root.findall('.//%sp' % ns)
+        self.assertEquals(3, len(paragraphs))
+        self.assertEquals(self.cyrillic_text, paragraphs[0].text)
+        self.assertEquals('00:00:01.00', paragraphs[0].get('begin'))
+        self.assertEquals('00:00:01.00', paragraphs[0].get('dur'))
+        last = paragraphs[-1]
+        self.assertEquals(['strong', 'emphasis', 'underlined'],
+                          [span.get('style') for span in last.findall('%sspan' % ns)])
+        self.assertEquals(1, len(last.findall('%sbr' % ns)))
+
+        root = etree.fromstring(
+            unicode(DFXPSubtitles(subtitles, self.video)).encode('utf-8'))
+        paragraphs = root.findall('.//%sp' % ns)
+        self.assertEquals('00:00:02.00', paragraphs[0].get('end'))
+
     def test_one_subtitle(self):
         subtitles = [{
             'text': u'Witam, jestem Fr\xe9d\xe9ric Couchet, General Manager, od kwietnia',
@@ -1194,6 +1290,18 @@ class TestSubtitlesGenerator(TestCase):
         self.assertTrue(unicode(SBVSubtitles(subtitles, self.video)))
         self.assertTrue(unicode(TXTSubtitles(subtitles, self.video)))
 
+    def test_stream(self):
+        for handler in (TTMLSubtitles, SRTSubtitles, SBVSubtitles,
+                        TXTSubtitles, SSASubtitles):
+            h = handler(self.subtitles, self.video)
+            expected = unicode(h).encode('utf-8')
+            self.assertEquals(expected, ''.join(h.stream()))
+            # small chunks still add up to the same file
+            self.assertEquals(expected, ''.join(h.stream(chunk_size=8)))
+
+        chunks = list(SRTSubtitles(self.subtitles, self.video).stream(chunk_size=8))
+        self.assertTrue(len(chunks) > 1)
+
 
 class TestCaching(TestCase):
     fixtures = ['test_widget.json']
@@ -16,8 +16,8 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 import datetime
+import time
 
-from django.conf import settings
 from django.core.cache import cache
 from django.utils.hashcompat import sha_constructor
 
@@ -26,6 +26,8 @@ from videos.types.base import VideoTypeError
 
 
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
+# must outlive the entries written under it
+VERSION_TIMEOUT = TIMEOUT * 2
 
 
 def get_video_id(video_url, public_only=False, referer=None):
@@ -66,77 +68,152 @@ def associate_extra_url(video_url, video_id):
                 'videoid': video_id })
         cache.set(cache_key, video_url.videoid, TIMEOUT)
 
+def associate_extra_urls(video_urls, video_id):
+    """associate_extra_url for many URLs, with one query for the ones
+    that aren't cached."""
+    keys = dict((_video_id_key(video_url), video_url)
+                for video_url in video_urls)
+    cached = cache.get_many(keys.keys())
+    missing = [video_url for key, video_url in keys.items()
+               if key not in cached]
+    if not missing:
+        return
+
+    from videos.models import VideoUrl, Video
+    vts = [video_type_registrar.video_type_for_url(video_url)
+           for video_url in missing]
+    urls = [vt.convert_to_video_url() for vt in vts]
+    existing = dict(VideoUrl.objects.filter(url__in=urls)
+                    .values_list('url', 'videoid'))
+    video = None
+    for video_url, vt, url in zip(missing, vts, urls):
+        if url not in existing:
+            if video is None:
+                video = Video.objects.get(video_id=video_id)
+            video_url_obj, created = VideoUrl.objects.get_or_create(
+                url=url, defaults={
+                    'video': video,
+                    'type': vt.abbreviation,
+                    'videoid': video_id })
+            existing[url] = video_url_obj.videoid
+        cache.set(_video_id_key(video_url), existing[url], TIMEOUT)
+
 
 # Invalidation
+#
+# Every per-video key embeds the video's cache version, so invalidating
+# everything we know about a video is a single incr: the old entries are
+# never read again and simply expire.
 def invalidate_cache(video_id):
-    cache.delete(_video_urls_key(video_id))
     try:
-        from apps.videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        for l in video.subtitlelanguage_set.all():
-            cache.delete(_subtitles_dict_key(video_id, l.pk))
-    except Video.DoesNotExist:
-        pass
-    for language in settings.ALL_LANGUAGES:
-        cache.delete(_subtitle_language_pk_key(video_id, language[0]))
-    cache.delete(_subtitle_language_pk_key(video_id, None))
-    cache.delete(_subtitles_dict_key(video_id, None))
-    cache.delete(_subtitles_count_key(video_id))
-    cache.delete(_video_languages_key(video_id))
-    cache.delete(_video_languages_verbose_key(video_id))
-    cache.delete(_video_is_moderated_key(video_id))
-    cache.delete(_video_visibility_policy_key(video_id))
-
-    from videos.models import Video
-    try:
-        video = Video.objects.get(video_id=video_id)
-        for url in video.videourl_set.all():
-            cache.delete(_video_id_key(url.url))
-    except Video.DoesNotExist:
+        cache.incr(_video_cache_version_key(video_id))
+    except ValueError:
+        # no version yet (or it was evicted): nothing to invalidate, as
+        # get_cache_version will start a fresh namespace
         pass
 
 def invalidate_video_id(video_url):
     cache.delete(_video_id_key(video_url))
 
+def invalidate_video_urls(video):
+    """
+    Drops the url -> video_id mappings for all of the video's urls. These
+    are keyed by url, not video, so the version bump doesn't reach them.
+    """
+    cache.delete_many([_video_id_key(url) for url
+                       in video.videourl_set.values_list('url', flat=True)])
+
 def invalidate_video_moderation(video_id):
     cache.delete(_video_is_moderated_key(video_id))
 
 def invalidate_video_visibility(video_id):
     cache.delete(_video_visibility_policy_key(video_id))
 
+def _cache_versions(video_ids):
+    """
+    Returns {video_id: version} for the videos that have a cache version,
+    with one round-trip. Videos without one have nothing cached.
+    """
+    keys = dict((_video_cache_version_key(video_id), video_id)
+                for video_id in video_ids)
+    return dict((keys[key], version)
+                for key, version in cache.get_many(keys.keys()).items())
+
+def invalidate_video_moderation_many(video_ids):
+    """Same as invalidate_video_moderation, with two round-trips in all."""
+    cache.delete_many([_video_is_moderated_key(video_id, version) for
+                       video_id, version in _cache_versions(video_ids).items()])
+
+def invalidate_video_visibility_many(video_ids):
+    """Same as invalidate_video_visibility, with two round-trips in all."""
+    cache.delete_many([_video_visibility_policy_key(video_id, version) for
+                       video_id, version in _cache_versions(video_ids).items()])
+
 def on_video_url_save(sender, instance, **kwargs):
+    invalidate_video_id(instance.url)
     if instance.video_id:
         invalidate_cache(instance.video.video_id)
 
+def get_cache_version(video_id):
+    """
+    Returns the current cache version for this video, starting a new one
+    if there is none.
+    New versions are seeded from the clock rather than 1, so an evicted
+    version key won't bring back entries written under an older version.
+    """
+    cache_key = _video_cache_version_key(video_id)
+    version = cache.get(cache_key)
+    if version is None:
+        cache.add(cache_key, int(time.time()), VERSION_TIMEOUT)
+        version = cache.get(cache_key)
+    return version
+
+def _video_cache_version_key(video_id):
+    return 'widget_video_version_{0}'.format(video_id)
+
+def _versioned_key(key, video_id, version=None):
+    if version is None:
+        version = get_cache_version(video_id)
+    return '{0}_v{1}'.format(key, version)
+
 def _video_id_key(video_url):
     return 'video_id_{0}'.format(sha_constructor(video_url).hexdigest())
 
-def _video_urls_key(video_id):
-    return 'widget_video_urls_{0}'.format(video_id)
+def _video_urls_key(video_id, version=None):
+    return _versioned_key(
+        'widget_video_urls_{0}'.format(video_id), video_id, version)
 
-def _subtitles_dict_key(video_id, language_pk, version_no=None):
-    return 'widget_subtitles_{0}{1}{2}'.format(video_id, language_pk, version_no)
+def _subtitles_dict_key(video_id, language_pk, version_no=None, version=None):
+    return _versioned_key(
+        'widget_subtitles_{0}{1}{2}'.format(video_id, language_pk, version_no),
+        video_id, version)
 
-def _subtitles_count_key(video_id):
-    return "subtitle_count_{0}".format(video_id)
+def _subtitles_count_key(video_id, version=None):
+    return _versioned_key(
+        "subtitle_count_{0}".format(video_id), video_id, version)
 
-def _video_languages_key(video_id):
-    return "widget_video_languages_{0}".format(video_id)
+def _video_languages_key(video_id, version=None):
+    return _versioned_key(
+        "widget_video_languages_{0}".format(video_id), video_id, version)
 
-def _video_languages_verbose_key(video_id):
-    return "widget_video_languages_verbose_{0}".format(video_id)
+def _video_languages_verbose_key(video_id, version=None):
+    return _versioned_key(
+        "widget_video_languages_verbose_{0}".format(video_id), video_id, version)
 
 def _video_writelocked_langs_key(video_id):
     return "writelocked_langs_{0}".format(video_id)
 
-def _subtitle_language_pk_key(video_id, language_code):
-    return "sl_pk_{0}{1}".format(video_id, language_code)
+def _subtitle_language_pk_key(video_id, language_code, version=None):
+    return _versioned_key(
+        "sl_pk_{0}{1}".format(video_id, language_code), video_id, version)
 
-def _video_is_moderated_key(video_id):
-    return 'widget_video_is_moderated_{0}'.format(video_id)
+def _video_is_moderated_key(video_id, version=None):
+    return _versioned_key(
+        'widget_video_is_moderated_{0}'.format(video_id), video_id, version)
 
-def _video_visibility_policy_key(video_id):
-    return 'widget_video_vis_key_{0}'.format(video_id)
+def _video_visibility_policy_key(video_id, version=None):
+    return _versioned_key(
+        'widget_video_vis_key_{0}'.format(video_id), video_id, version)
 
 
 def pk_for_default_language(video_id, language_code):
@@ -159,8 +236,7 @@ def get_video_urls(video_id):
         return value
     else:
         from videos.models import Video
-        video_urls = [vu.effective_url for vu
-                 in Video.objects.get(video_id=video_id).videourl_set.all()]
+        video_urls = _video_urls_for(Video.objects.get(video_id=video_id))
         cache.set(cache_key, video_urls, TIMEOUT)
         return video_urls
 
@@ -169,7 +245,7 @@ def get_subtitles_dict(
     cache_key = _subtitles_dict_key(video_id, language_pk, version_no)
     value = cache.get(cache_key)
     if value is not None:
-        cached_value = value
+        cached_value = _unpack_subtitles_dict(value)
     else:
         from videos.models import Video, SubtitleLanguage
         video = Video.objects.get(video_id=video_id)
@@ -187,11 +263,28 @@ def get_subtitles_dict(
             cached_value = subtitles_dict_fn(version)
         else:
             cached_value = 0
-        cache.set(cache_key, cached_value, TIMEOUT)
+        cache.set(cache_key, _pack_subtitles_dict(cached_value), TIMEOUT)
     return None if cached_value == 0 else cached_value
 
+def _pack_subtitles_dict(value):
+    """Store the subtitles of a subtitles dict as compact EffectiveSubtitles."""
+    from videos import EffectiveSubtitles
+    if not isinstance(value, dict) or 'subtitles' not in value:
+        return value
+    value = dict(value)
+    value['subtitles'] = EffectiveSubtitles.from_dicts(value['subtitles'])
+    return value
+
+def _unpack_subtitles_dict(value):
+    from videos import EffectiveSubtitles
+    if not isinstance(value, dict) or \
+            not isinstance(value.get('subtitles'), EffectiveSubtitles):
+        return value
+    value = dict(value)
+    value['subtitles'] = value['subtitles'].as_dicts()
+    return value
+
 def get_video_languages(video_id):
-    from apps.widget.rpc import language_summary
     cache_key = _video_languages_key(video_id)
     value = cache.get(cache_key)
     if value is not None:
@@ -199,13 +292,7 @@ def get_video_languages(video_id):
     else:
         from videos.models import Video
         video = Video.objects.get(video_id=video_id)
-        languages = video.subtitlelanguage_set.filter(has_version=True)
-
-        team_video = video.get_team_video()
-        if team_video:
-            languages = languages.filter(language__in=team_video.team.get_readable_langs())
-
-        return_value = [language_summary(l) for l in languages]
+        return_value = _video_languages_for(video, video.get_team_video())
         cache.set(cache_key, return_value, TIMEOUT)
         return return_value
 
@@ -267,24 +354,119 @@ def get_visibility_policies(video_id):
         except Video.DoesNotExist:
             return {}
 
-        team_video = video.get_team_video()
+        value = _visibility_policies_for(video.get_team_video())
+        cache.set(cache_key, value, TIMEOUT)
 
-        if team_video:
-            team = team_video.team
-            is_public = team.is_visible
-            team_id = team.id
-        else:
-            is_public = True
-            team_id = None
+    return value
 
-        value = {
-            "is_public": is_public,
-            "team_id": team_id
-        }
+def _video_urls_for(video):
+    return [vu.effective_url for vu in video.videourl_set.all()]
 
-        cache.set(cache_key, value, TIMEOUT)
+def _video_languages_for(video, team_video):
+    from apps.widget.rpc import language_summary
+    languages = video.subtitlelanguage_set.filter(has_version=True)
+    if team_video:
+        languages = languages.filter(language__in=team_video.team.get_readable_langs())
+    return [language_summary(l, team_video) for l in languages]
+
+def _visibility_policies_for(team_video):
+    if team_video:
+        team = team_video.team
+        is_public = team.is_visible
+        team_id = team.id
+    else:
+        is_public = True
+        team_id = None
 
-    return value
+    return {
+        "is_public": is_public,
+        "team_id": team_id
+    }
+
+def _language_pks_for(video, language_codes):
+    """
+    Returns a dict of language_code -> SubtitleLanguage pk (or 'none') for
+    the given codes, using a single query for all the non-original ones.
+    """
+    pks = {}
+    codes = [code for code in language_codes if code is not None]
+    if codes:
+        # mimic Video.subtitle_language: the language with the most
+        # subtitles wins when a code is duplicated
+        languages = video.subtitlelanguage_set.filter(
+            language__in=codes).order_by('-subtitle_count')
+        for language_code, pk in languages.values_list('language', 'pk'):
+            pks.setdefault(language_code, pk)
+    if None in language_codes:
+        sl = video.subtitle_language()
+        pks[None] = None if sl is None else sl.pk
+    return dict((code, pks.get(code) or 'none') for code in language_codes)
+
+
+# Batched lookups
+def get_widget_bundle(video_id, language_codes=()):
+    """
+    Returns everything show_widget needs to know about a video with a
+    single cache round-trip (after the version lookup), instead of one per
+    key:
+
+        {
+            'visibility_policies': {...},
+            'video_urls': [...],
+            'is_moderated': bool,
+            'video_languages': [...],
+            'language_pks': {language_code: pk or None},
+        }
+
+    language_codes are the codes to resolve as in pk_for_default_language.
+    Misses are filled from a single video lookup and written back with
+    one set_many call.
+    Raises Video.DoesNotExist if any key is missing and the video is gone.
+    """
+    language_codes = list(set(language_codes))
+    version = get_cache_version(video_id)
+    keys = {
+        'visibility_policies': _video_visibility_policy_key(video_id, version),
+        'video_urls': _video_urls_key(video_id, version),
+        'is_moderated': _video_is_moderated_key(video_id, version),
+        'video_languages': _video_languages_key(video_id, version),
+    }
+    pk_keys = dict((code, _subtitle_language_pk_key(video_id, code, version))
+                   for code in language_codes)
+    cached = cache.get_many(keys.values() + pk_keys.values())
+
+    bundle = dict((name, cached[key]) for name, key in keys.items()
+                  if key in cached)
+    language_pks = dict((code, cached[key]) for code, key in pk_keys.items()
+                        if key in cached)
+    missing_codes = [code for code in language_codes
+                     if code not in language_pks]
+
+    if len(bundle) < len(keys) or missing_codes:
+        from videos.models import Video
+        video = Video.objects.get(video_id=video_id)
+        team_video = video.get_team_video()
+        to_set = {}
+        if 'visibility_policies' not in bundle:
+            bundle['visibility_policies'] = _visibility_policies_for(team_video)
+        if 'video_urls' not in bundle:
+            bundle['video_urls'] = _video_urls_for(video)
+        if 'is_moderated' not in bundle:
+            bundle['is_moderated'] = video.is_moderated
+        if 'video_languages' not in bundle:
+            bundle['video_languages'] = _video_languages_for(video, team_video)
+        for name, key in keys.items():
+            if key not in cached:
+                to_set[key] = bundle[name]
+        for code, pk in _language_pks_for(video, missing_codes).items():
+            language_pks[code] = pk
+            to_set[pk_keys[code]] = pk
+        cache.set_many(to_set, TIMEOUT)
+
+    bundle['language_pks'] = dict(
+        (code, None if pk == 'none' else pk)
+        for code, pk in language_pks.items())
+    return bundle
 
 
 # Writelocking
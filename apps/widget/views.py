@@ -298,10 +298,10 @@ def download_subtitles(request, handler=SSASubtitles):
         raise Http404
 
     h = handler.create(version, video, language)
-    subs_text = unicode(h)
     # since this is a downlaod, we can afford not to escape tags, specially true
     # since speaker change is denoted by '>>' and that would get entirely stripped out
-    response = HttpResponse(subs_text, mimetype="text/plain")
+    # stream the file out, long transcripts don't need to be held in memory
+    response = HttpResponse(h.stream(), mimetype="text/plain")
     original_filename = '%s.%s' % (video.lang_filename(language), h.file_type)
 
     if not 'HTTP_USER_AGENT' in request.META or u'WebKit' in request.META['HTTP_USER_AGENT']:
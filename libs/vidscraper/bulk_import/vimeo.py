@@ -1,6 +1,7 @@
 import datetime
 import math
 import re
+from multiprocessing.pool import ThreadPool
 
 import feedparser
 import simplejson
@@ -13,6 +14,9 @@ USERNAME_RE = re.compile(r'http://(www\.)?vimeo\.com/'
 
 _cached_video_count = {}
 
+# API pages downloaded at the same time by bulk_import
+PAGE_FETCH_THREADS = 4
+
 def _post_url(username, type, query=None):
     if 'channels/' in username:
         username = username.replace('channels/', 'channel/')
@@ -49,17 +53,26 @@ def bulk_import(parsed_feed):
     post_url = _post_url(username, match.group('type') or 'videos', 'page=%i')
     parsed_feed = feedparser.FeedParserDict(parsed_feed.copy())
     parsed_feed.entries = []
-    for i in range(1, int(math.ceil(count / 20.0)) + 1):
+
+    def fetch_page(i):
         response = open_url_while_lying_about_agent(post_url % i)
         if response.getcode() != 200:
-            break
-        data = response.read()
-        if not data:
-            break
-        json_data = simplejson.loads(data)
-        for video in json_data:
-            parsed_feed.entries.append(feedparser_dict(
-                    _json_to_feedparser(video)))
+            return None
+        return response.read()
+
+    pages = range(1, int(math.ceil(count / 20.0)) + 1)
+    pool = ThreadPool(max(1, min(PAGE_FETCH_THREADS, len(pages))))
+    try:
+        # pages are fetched concurrently but read in order
+        for data in pool.imap(fetch_page, pages):
+            if not data:
+                break
+            json_data = simplejson.loads(data)
+            for video in json_data:
+                parsed_feed.entries.append(feedparser_dict(
+                        _json_to_feedparser(video)))
+    finally:
+        pool.terminate()
 
     # clean up cache
     if parsed_feed.feed.link in _cached_video_count:
@@ -495,6 +495,11 @@ PROJECT_VERSION = '0.5'
 
 EDIT_END_THRESHOLD = 120
 
+# A subtitle version stores only the cues that changed since the previous
+# version, unless that would make more than this many versions to replay.
+# 0 stores every version in full.
+SUBTITLE_VERSION_DELTA_CHAIN = 0
+
 ANONYMOUS_USER_ID = 10000
 
 #Use on production
@@ -23,11 +23,12 @@ from django.http import HttpResponse
 from django.utils import simplejson
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.functional import update_wrapper
-from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
+from django.template import Context
+from django.template.loader import get_template
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 from django.contrib.sites.models import Site
-from utils.metrics import Meter
+from utils.metrics import Meter, Timer
 
 DEFAULT_PROTOCOL = getattr(settings, "DEFAULT_PROTOCOL", 'https')
 
@@ -72,6 +73,54 @@ def render_to_json(func):
         return HttpResponse(json, mimetype="application/json")
     return update_wrapper(wrapper, func)
 
+EMAIL_CHUNK_SIZE = 100
+
+_compiled_templates = {}
+
+def _recipient_address(recipient, check_user_preference=True):
+    """Return the address to mail recipient at, or None to skip it.
+
+    If passed a User, check that he has opted in for email notification
+    unless check_user_preference is False (useful for example for password
+    retrivals, else users that have opted out of email notifications
+    can never recover their passowrd)
+    """
+    from auth.models import CustomUser
+    from django.contrib.auth.models import User
+    if isinstance(recipient, User) or isinstance(recipient, CustomUser):
+        if not bool(recipient.email):
+            return None
+        if check_user_preference is False or recipient.notify_by_email:
+            return recipient.email
+        return None
+    return recipient
+
+def _email_context(body_dict):
+    domain = Site.objects.get_current().domain
+    body_dict['STATIC_URL_BASE'] = settings.STATIC_URL_BASE
+    body_dict['domain'] = domain
+    body_dict['url_base'] = "%s://%s" % (DEFAULT_PROTOCOL, domain)
+    return body_dict
+
+def _get_compiled_template(name):
+    """Like get_template, but keeps the compiled template around.
+
+    Templates are reloaded on each call when TEMPLATE_DEBUG is on, so
+    edits show up without restarting.
+    """
+    if settings.TEMPLATE_DEBUG:
+        return get_template(name)
+    if name not in _compiled_templates:
+        _compiled_templates[name] = get_template(name)
+    return _compiled_templates[name]
+
+def _log_email(body_template):
+    if oboe:
+        try:
+            oboe.Context.log('email', 'info', backtrace=False,**{"template":body_template})
+        except Exception, e:
+            print >> sys.stderr, "Oboe error: %s" % e
+
 def send_templated_email(to, subject, body_template, body_dict,
                          from_email=None, ct="html", fail_silently=False,
                          check_user_preference=True):
@@ -84,40 +133,79 @@ def send_templated_email(to, subject, body_template, body_dict,
              situations where you must send the email, for example on
              password retrivals.
     """
-    from auth.models import CustomUser
-    from django.contrib.auth.models import User
     to_unchecked = to
     if not isinstance(to_unchecked, list):
         to_unchecked = [to]
     to = []
-    # if passed a User, check that he has opted in for email notification
-    # unless check_user_preference is False (useful for example for password)
-    # retrivals, else users that have opted out of email notifications
-    # can never recover their passowrd
     for recipient in to_unchecked:
-        if isinstance(recipient, User) or isinstance(recipient, CustomUser):
-            if not bool(recipient.email):
-                continue
-            if check_user_preference is False or  recipient.notify_by_email:
-                to.append(recipient.email)
-        else:
-            to.append(recipient)
+        address = _recipient_address(recipient, check_user_preference)
+        if address:
+            to.append(address)
     if not from_email: from_email = settings.DEFAULT_FROM_EMAIL
 
-    body_dict['STATIC_URL_BASE'] = settings.STATIC_URL_BASE
-    body_dict['domain'] = Site.objects.get_current().domain
-    body_dict['url_base'] = "%s://%s" % (DEFAULT_PROTOCOL,  Site.objects.get_current().domain)
-    message = render_to_string(body_template, body_dict)
+    message = _get_compiled_template(body_template).render(
+        Context(_email_context(body_dict)))
     bcc = settings.EMAIL_BCC_LIST
     email = EmailMessage(subject, message, from_email, to, bcc=bcc)
     email.content_subtype = ct
-    if oboe:
-        try:
-            oboe.Context.log('email', 'info', backtrace=False,**{"template":body_template})
-        except Exception, e:
-            print >> sys.stderr, "Oboe error: %s" % e
+    _log_email(body_template)
 
     Meter('templated-emails-sent').inc()
 
     return email.send(fail_silently)
 
+def send_templated_emails(recipients, subject, body_template, body_dict,
+                          from_email=None, ct="html", fail_silently=False,
+                          check_user_preference=True,
+                          chunk_size=EMAIL_CHUNK_SIZE):
+    """
+    Sends one html email per recipient, rendering the same template.
+    Parameters:
+        recipients: a list of (recipient, context) pairs, where recipient
+             is an email address or a User and context is a dict updating
+             body_dict for that recipient only (or None)
+        chunk_size: how many emails are handed to the backend at once
+
+    The template is compiled once and all emails go over a single
+    connection, opened for the whole batch. Returns the number of emails
+    sent; with fail_silently, the ones the backend rejected are counted in
+    the 'templated-emails-failed' meter.
+    """
+    if not from_email: from_email = settings.DEFAULT_FROM_EMAIL
+    template = _get_compiled_template(body_template)
+    base_context = _email_context(dict(body_dict))
+    bcc = settings.EMAIL_BCC_LIST
+
+    emails = []
+    for recipient, context in recipients:
+        address = _recipient_address(recipient, check_user_preference)
+        if not address:
+            continue
+        body = Context(base_context)
+        if context:
+            body.update(context)
+        email = EmailMessage(subject, template.render(body), from_email,
+                             [address], bcc=bcc)
+        email.content_subtype = ct
+        emails.append(email)
+    if not emails:
+        return 0
+    _log_email(body_template)
+
+    sent = 0
+    with Timer('templated-emails-batch-time'):
+        connection = get_connection(fail_silently=fail_silently)
+        opened = connection.open()
+        try:
+            for offset in xrange(0, len(emails), chunk_size):
+                chunk = emails[offset:offset + chunk_size]
+                sent += connection.send_messages(chunk) or 0
+        finally:
+            if opened:
+                connection.close()
+
+    Meter('templated-emails-sent').inc(sent)
+    if len(emails) > sent:
+        Meter('templated-emails-failed').inc(len(emails) - sent)
+    return sent
+
@@ -66,14 +66,15 @@ def update_search_index(model_class, pk):
 def update_search_index_for_qs(model_class, pks):
     start = time.time()
 
-    qs = model_class._default_manager.filter(pk__in=pks)
-
     try:
         search_index = site.get_index(model_class)
     except NotRegistered:
         log(u'Seacrh index is not registered for %s' % model_class)
         return None
 
+    # index_queryset can prefetch what the index needs for all objects
+    qs = search_index.index_queryset().filter(pk__in=pks)
+
     search_index.backend.update(search_index, qs)
 
     LogEntry(num=len(pks), time=time.time()-start).save()
@@ -1,5 +1,15 @@
+from django.db import connection, transaction
+from django.db.models import AutoField
 from django.db.models.query import QuerySet
 
+# rows per INSERT statement in bulk_insert
+BULK_INSERT_BATCH_SIZE = 500
+# rows per UPDATE statement in bulk_update
+BULK_UPDATE_BATCH_SIZE = 100
+# sqlite refuses statements with more parameters than this
+MAX_QUERY_PARAMS = 999
+
+
 
 class LoadRelatedQuerySet(QuerySet):
     def __len__(self):
@@ -17,3 +27,81 @@ class LoadRelatedQuerySet(QuerySet):
         some attribute
         """
         raise Exception('Not implemented')
+
+
+def bulk_insert(model, objs, batch_size=BULK_INSERT_BATCH_SIZE):
+    """
+    Inserts the (unsaved) model instances with multi-row INSERTs, instead
+    of one query per save().
+
+    This bypasses Model.save() and the pre/post_save signals, and the
+    instances won't have their pk set afterwards.
+    """
+    if not objs:
+        return
+
+    fields = [f for f in model._meta.local_fields
+              if not isinstance(f, AutoField)]
+    qn = connection.ops.quote_name
+    row_sql = u'(%s)' % u', '.join([u'%s'] * len(fields))
+    base_sql = u'INSERT INTO %s (%s) VALUES ' % (
+        qn(model._meta.db_table),
+        u', '.join([qn(f.column) for f in fields]))
+
+    rows = [[f.get_db_prep_save(f.pre_save(obj, True), connection=connection)
+             for f in fields] for obj in objs]
+
+    cursor = connection.cursor()
+    if 'sqlite3' in connection.settings_dict['ENGINE']:
+        # older sqlites can't do multi-row VALUES and cap the number of
+        # parameters, but executemany is cheap there anyway
+        cursor.executemany(base_sql + row_sql, rows)
+    else:
+        for start in xrange(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = [value for row in batch for value in row]
+            cursor.execute(base_sql + u', '.join([row_sql] * len(batch)), params)
+    transaction.commit_unless_managed()
+
+
+def bulk_update(model, values, batch_size=BULK_UPDATE_BATCH_SIZE):
+    """
+    Updates many rows, each with its own values, with a single
+    UPDATE ... SET field = CASE pk WHEN ... END statement (per batch_size
+    rows) instead of one save() per row.
+
+    values maps pk -> {field_name: value}, and every row must give the same
+    fields.  Like QuerySet.update() this bypasses Model.save() and signals.
+    """
+    if not values:
+        return
+
+    opts = model._meta
+    qn = connection.ops.quote_name
+    pk_column = qn(opts.pk.column)
+    names = values.values()[0].keys()
+    fields = [opts.get_field(name) for name in names]
+    # each row takes two parameters per field, plus one for the IN clause
+    batch_size = max(1, min(batch_size,
+                            MAX_QUERY_PARAMS // (2 * len(fields) + 1)))
+
+    cursor = connection.cursor()
+    pks = values.keys()
+    for start in xrange(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        sets = []
+        params = []
+        for field in fields:
+            cases = []
+            for pk in batch:
+                cases.append(u'WHEN %s THEN %s')
+                params.append(pk)
+                params.append(field.get_db_prep_save(
+                    values[pk][field.name], connection=connection))
+            sets.append(u'%s = CASE %s %s END' % (
+                qn(field.column), pk_column, u' '.join(cases)))
+        params.extend(batch)
+        cursor.execute(u'UPDATE %s SET %s WHERE %s IN (%s)' % (
+            qn(opts.db_table), u', '.join(sets), pk_column,
+            u', '.join([u'%s'] * len(batch))), params)
+    transaction.commit_unless_managed()
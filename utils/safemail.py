@@ -47,6 +47,12 @@ class InternalOnlyBackend(object):
                         break
         return clean
 
+    def open(self):
+        return self.smtp_backend.open()
+
+    def close(self):
+        self.smtp_backend.close()
+
     def send_messages(self, email_messages):
         try:
             self.file_backend.send_messages(email_messages)
@@ -56,5 +62,5 @@ class InternalOnlyBackend(object):
             message.to = self.get_whitelisted(message.to)
             message.bcc = self.get_whitelisted(message.bcc)
             message.cc = self.get_whitelisted(message.cc)
-        self.smtp_backend.send_messages(email_messages)
+        return self.smtp_backend.send_messages(email_messages)
 
@@ -15,7 +15,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
-import random
 import re
 from itertools import chain
 from datetime import datetime
@@ -40,10 +39,11 @@ def is_version_same(version, parser):
 
     subtitles = list(parser)
 
-    if version.subtitle_set.count() != len(subtitles):
+    version_subtitles = version.get_subtitles()
+    if len(version_subtitles) != len(subtitles):
         return False
 
-    for item in zip(subtitles, list(version.subtitle_set.all())):
+    for item in zip(subtitles, version_subtitles):
         if item[0]['subtitle_text'] != item[1].subtitle_text or \
             item[0]['start_time'] != item[1].start_time or \
             item[0]['end_time'] != item[1].end_time:
@@ -64,7 +64,7 @@ def strip_tags(text, tags=None):
     
 def save_subtitle(video, language, parser, user=None, update_video=True,
                   forks=True, as_forked=True, translated_from=None):
-    from videos.models import SubtitleVersion, Subtitle, SubtitleMetadata
+    from videos.models import SubtitleVersion, Subtitle, new_subtitle_ids
     from videos.tasks import video_changed_tasks
 
     key = str(uuid4()).replace('-', '')
@@ -101,34 +101,24 @@ def save_subtitle(video, language, parser, user=None, update_video=True,
 
         version.save()
 
-        ids = []
-
-        for i, item in enumerate(parser):
-            id = int(random.random()*10e12)
-
-            while id in ids:
-                id = int(random.random()*10e12)
-
-            ids.append(id)
-
-            metadata = item.pop('metadata', None)
+        items = list(parser)
+        ids = new_subtitle_ids(len(items))
+        captions = []
+        metadata = {}
 
+        for i, item in enumerate(items):
             data = item.copy()
+            item_metadata = data.pop('metadata', None)
+            if item_metadata:
+                metadata[ids[i]] = item_metadata
+
             data['subtitle_text'] = strip_tags(data['subtitle_text'])
             caption = Subtitle(**data)
-            caption.version = version
-            caption.datetime_started = datetime.now()
-            caption.subtitle_id = str(id)
+            caption.subtitle_id = ids[i]
             caption.subtitle_order = i+1
-            caption.save()
+            captions.append(caption)
 
-            if metadata:
-                for name, value in metadata.items():
-                    SubtitleMetadata(
-                        subtitle=caption,
-                        key=name,
-                        data=value
-                    ).save()
+        Subtitle.objects.bulk_save(version, captions, metadata)
 
     version = version or old_version
 
@@ -200,6 +190,12 @@ class ParserListClass(dict):
 ParserList = ParserListClass()
 
 class SubtitleParser(object):
+    """
+    Subclasses implement *_result_iter*. The document is parsed the first
+    time the parser is used and the cues are kept in *cues*, so len(),
+    truth testing, indexing and iteration don't parse it again.
+    """
+    _cues = None
 
     def __init__(self, subtitles, pattern, flags=[]):
         self.subtitles = subtitles
@@ -207,13 +203,24 @@ class SubtitleParser(object):
         self._pattern = re.compile(pattern, *flags)
 
     def __iter__(self):
-        return self._result_iter()
+        # copies, so callers changing items don't change the parsed cues
+        return (dict(cue) for cue in self.cues)
 
     def __len__(self):
-        return len(self._pattern.findall(self.subtitles))
+        return len(self.cues)
 
     def __nonzero__(self):
-        return bool(self._pattern.search(self.subtitles))
+        return bool(self.cues)
+
+    def __getitem__(self, index):
+        return dict(self.cues[index])
+
+    @property
+    def cues(self):
+        """Tuple with all cues of the document, parsed on first access."""
+        if self._cues is None:
+            self._cues = tuple(self._result_iter())
+        return self._cues
 
     def _result_iter(self):
         """
@@ -243,12 +250,6 @@ class TxtSubtitleParser(SubtitleParser):
     def __init__(self, subtitles, linebreak_re=_linebreak_re):
         self.subtitles = linebreak_re.split(subtitles)
 
-    def __len__(self):
-        return len(self.subtitles)
-
-    def __nonzero__(self):
-        return bool(self.subtitles)
-
     def _result_iter(self):
         for item in self.subtitles:
             output = {}
@@ -266,12 +267,6 @@ class YoutubeXMLParser(SubtitleParser):
         self.xml = xml
         self.subtitles = xml.xpath('text')
 
-    def __len__(self):
-        return len(self.subtitles)
-
-    def __nonzero__(self):
-        return bool(self.subtitles)
-
     def _result_iter(self):
         for i, item in enumerate(self.subtitles):
             try:
@@ -306,12 +301,6 @@ class YoutubeSubtitleParser(SubtitleParser):
             self.subtitles = []
             self.language = None
 
-    def __len__(self):
-        return len(self.subtitles)
-
-    def __nonzero__(self):
-        return bool(self.subtitles)
-
     def _result_iter(self):
         for item in self.subtitles:
             yield self._get_data(item)
@@ -334,12 +323,6 @@ class STSubtitleParser(SubtitleParser):
             raise SubtitleParserError('Incorrect format of SpeakerText subtitles')
 
 
-    def __len__(self):
-        return len(self.nodes)
-
-    def __nonzero__(self):
-        return bool(len(self.nodes))
-
     def _get_time(self, val):
         try:
             return int(val) / 1000.
@@ -399,12 +382,6 @@ class TtmlSubtitleParser(SubtitleParser):
             raise SubtitleParserError('Incorrect format of TTML subtitles')
                        
 
-    def __len__(self):
-        return len(self.nodes)
-
-    def __nonzero__(self):
-        return bool(len(self.nodes))
-
     def _get_time(self, begin, dur):
         if not begin or not dur:
             return -1
@@ -455,12 +432,6 @@ class DfxpSubtitleParser(SubtitleParser):
         except (ExpatError, IndexError):
             raise SubtitleParserError('Incorrect format of TTML subtitles')
 
-    def __len__(self):
-        return len(self.nodes)
-
-    def __nonzero__(self):
-        return bool(len(self.nodes))
-
     def _get_time(self, t):
         try:
             if t.endswith('t'):
@@ -17,8 +17,14 @@
 # along with this program. If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from django.contrib.sites.models import Site
+from django.core import mail
 from django.test import TestCase
+
+from auth.models import CustomUser as User
+from teams.models import Team
 from videos.models import Video
+from utils import send_templated_emails
 from utils.multi_query_set import MultiQuerySet
 
 
@@ -114,3 +120,39 @@ class MultiQuerySetTest(TestCase):
                          list(mqs[3:7]),
                          "MQS[3:7] (out-of-bounds endpoint) failed.")
 
+
+class SendTemplatedEmailsTest(TestCase):
+    def test_send_templated_emails(self):
+        team = Team.objects.create(name='Mail team', slug='mail-team')
+        users = [User.objects.create(username='mailuser%s' % i,
+                                     email='mailuser%s@example.com' % i)
+                 for i in xrange(4)]
+        users[2].notify_by_email = False
+        users[2].save()
+        users[3].email = ''
+        users[3].save()
+
+        recipients = [(user, {'user': user}) for user in users]
+        recipients.append(('someone@example.com', None))
+        mail.outbox = []
+        sent = send_templated_emails(recipients, 'New videos',
+                                     'teams/email_new_videos.html',
+                                     {'team': team, 'team_videos': []},
+                                     chunk_size=2)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual([m.to for m in mail.outbox], [
+            ['mailuser0@example.com'],
+            ['mailuser1@example.com'],
+            ['someone@example.com'],
+        ])
+        domain = Site.objects.get_current().domain
+        for message in mail.outbox:
+            self.assertEqual(message.subject, 'New videos')
+            self.assertTrue('Mail team' in message.body)
+            self.assertTrue(domain in message.body)
+
+        self.assertEqual(send_templated_emails(
+            [(users[2], None)], 'New videos', 'teams/email_new_videos.html',
+            {'team': team, 'team_videos': []}), 0)
+        self.assertEqual(len(mail.outbox), 3)
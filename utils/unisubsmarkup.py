@@ -23,11 +23,16 @@ in subtitles, namely:
  _this has underline_
    
 We are not using a markdown parser, as our formats actually differ.
-Currently this is an ugly regex subtitution, but if we go ahead we
-should probably write a parser for it.
+
+markup_to_html and html_to_markup convert in one scan and only call
+bleach when the text has something the scanner can't vouch for: other
+tags, entities, control characters or unbalanced tags. The regexes below
+describe the conversion and are kept as its reference.
 """
 import re
 
+from django.utils.encoding import force_unicode
+
 from utils.subtitles import strip_tags as _strip_tags
 
 BOLD_TAG_RE = re.compile("</?s*b\s*>", re.IGNORECASE)
@@ -42,35 +47,115 @@ UNDERLINE_TAG_RE = re.compile("</?s*u\s*>", re.IGNORECASE)
 UNDERLINE_MARKER_START_RE = re.compile(r"_(?=[^\s])", re.IGNORECASE) 
 UNDERLINE_MARKER_END_RE = re.compile(r"(?![^_]\w)_", re.IGNORECASE)
 
+# runs of markers and the text between them
+MARKUP_TOKEN_RE = re.compile(r"\*+|_+|[^*_]+")
+# the allowed tags exactly as bleach writes them and the text between them
+HTML_TOKEN_RE = re.compile(r"<(/?)([biu])>|[^<]+|<")
+# like \w and \s in the marker regexes, which aren't unicode aware
+WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz'
+                       'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+SPACE_CHARS = frozenset(' \t\n\r\f\v')
+# text bleach would change: markup, entities and characters html5lib
+# replaces or drops
+UNSAFE_TEXT_RE = re.compile(u'[<>&\r\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f'
+                            u'\ufdd0-\ufdef\ufffe\uffff]')
+MARKUP_TAGS = {'b': '**', 'i': '*', 'u': '_'}
+
+def _marker_tags(marker, count, next_char):
+    """
+    Tags that a run of count markers followed by next_char is replaced
+    with by the marker regexes.
+    """
+    if marker == '_':
+        if next_char and next_char not in SPACE_CHARS:
+            return ['<u>'] * count
+        return ['<u>'] * (count - 1) + ['</u>']
+
+    bold_start = count >= 2 and next_char in WORD_CHARS
+    left = count - 2 if bold_start else count
+    tags = ['</b>'] * (left // 2)
+    if left % 2:
+        if bold_start or (next_char and next_char not in SPACE_CHARS):
+            tags.append('<i>')
+        else:
+            tags.append('</i>')
+    if bold_start:
+        tags.append('<b>')
+    return tags
+
+def _close_tag(stack, name):
+    if stack and stack[-1] == name:
+        stack.pop()
+        return True
+    return False
+
 def markup_to_html(text, strip_tags=True):
     """
     Converts the unisubs formatting to html.
     If strip_tags is True will strip all tags, but the
     available for subs.
     """
-    text = BOLD_MARKER_START_RE.sub("<b>", text)
-    text = BOLD_MARKER_END_RE.sub("</b>", text)
-    # order matters, substitute doubles first
-    text = ITALIC_MARKER_START_RE.sub("<i>", text)
-    text = ITALIC_MARKER_END_RE.sub("</i>", text)
-    
-    text = UNDERLINE_MARKER_START_RE.sub("<u>", text)
-    text = UNDERLINE_MARKER_END_RE.sub("</u>", text)
-    
+    output = []
+    open_tags = []
+    # False once the result needs bleach
+    clean = True
+
+    tokens = MARKUP_TOKEN_RE.findall(force_unicode(text))
+    for i, token in enumerate(tokens):
+        marker = token[0]
+        if marker not in '*_':
+            output.append(token)
+            if clean and UNSAFE_TEXT_RE.search(token):
+                clean = False
+            continue
+
+        next_token = tokens[i + 1] if i + 1 < len(tokens) else ''
+        for tag in _marker_tags(marker, len(token), next_token[:1]):
+            output.append(tag)
+            if not clean:
+                continue
+            if tag[1] == '/':
+                clean = _close_tag(open_tags, tag[2])
+            else:
+                open_tags.append(tag[1])
+
+    text = u''.join(output)
     if strip_tags:
-        text = _strip_tags(text)
+        if clean and not open_tags:
+            # bleach strips the whitespace around what it cleans
+            text = text.strip()
+        else:
+            text = _strip_tags(text)
     return text
     
 def html_to_markup(text):
     """
-    Very naive html to markdown converter. No parsing just
-    a regex hack, since we don't need actual an actual tree, our
-    content can be 1 depth level only. Should look into a more
-    robust solution in the near future.
+    Converts html to unisubs formatting, dropping all the tags but b, i
+    and u. Our content can be 1 depth level only, so there is no tree.
     """
+    output = []
+    open_tags = []
+    clean = True
+
+    for match in HTML_TOKEN_RE.finditer(force_unicode(text)):
+        name = match.group(2)
+        if name:
+            output.append(MARKUP_TAGS[name])
+            if match.group(1):
+                clean = _close_tag(open_tags, name)
+            else:
+                open_tags.append(name)
+        else:
+            clean = not UNSAFE_TEXT_RE.search(match.group(0))
+            output.append(match.group(0))
+        if not clean:
+            break
+
+    if clean and not open_tags:
+        return u''.join(output).strip()
+
     safe_html = _strip_tags(text)
     safe_html = BOLD_TAG_RE.sub("**", safe_html)
     safe_html = ITALIC_TAG_RE.sub("*", safe_html)
     safe_html = UNDERLINE_TAG_RE.sub("_", safe_html)
     return safe_html
-